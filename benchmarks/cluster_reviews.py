@@ -0,0 +1,65 @@
+"""Compare sample-and-assign mini-batch clustering with a full KMeans fit.
+
+Usage: python -m benchmarks.cluster_reviews [--rows 10000 50000] [--methods minibatch kmeans]
+
+For each size the TF-IDF matrix is built once and clustered by every method.
+Time, peak traced memory and inertia (sum of squared distances of every row
+to the mean of its cluster) are reported as JSON, along with each
+method's inertia relative to the full KMeans fit when it was run.
+"""
+import argparse
+import json
+
+import numpy as np
+
+from benchmarks.reduce_dimensions import measure
+from benchmarks.synthetic import reference_corpus
+from reviews.data_analyzer import DataAnalyzer
+
+
+def inertia(tfidf_matrix, labels, num_clusters):
+    total = 0.0
+    for cluster in range(num_clusters):
+        rows = tfidf_matrix[labels == cluster]
+        if rows.shape[0]:
+            centroid = np.asarray(rows.mean(axis=0)).ravel()
+            total += rows.multiply(rows).sum() - 2 * (rows @ centroid).sum() + rows.shape[0] * centroid @ centroid
+    return float(total)
+
+
+def run(sizes, methods):
+    analyzer = DataAnalyzer()
+    results = []
+    for rows in sizes:
+        corpus = reference_corpus(rows, vocabulary_size=5000)
+        df = corpus.assign(concatenated_text=corpus['review_headline'] + ' ' + corpus['review_body'])
+        tfidf_matrix, _ = analyzer.vectorize_text(df, analyzer.max_features)
+        size_results = []
+        for method in methods:
+            labels, seconds, peak = measure(analyzer.cluster_reviews, tfidf_matrix, analyzer.num_clusters, method)
+            size_results.append({
+                'rows': rows,
+                'method': method,
+                'seconds': seconds,
+                'peak_memory_bytes': peak,
+                'inertia': round(inertia(tfidf_matrix, labels, analyzer.num_clusters), 4),
+                'cluster_sizes': np.bincount(labels, minlength=analyzer.num_clusters).tolist(),
+            })
+        baseline = next((r['inertia'] for r in size_results if r['method'] == 'kmeans'), None)
+        if baseline:
+            for result in size_results:
+                result['inertia_vs_kmeans'] = round(result['inertia'] / baseline, 4)
+        results.extend(size_results)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 50000])
+    parser.add_argument('--methods', nargs='+', default=['minibatch', 'kmeans'])
+    args = parser.parse_args()
+    print(json.dumps(run(args.rows, args.methods), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+"""Time every stage of the analysis and reporting pipeline on synthetic exports.
+
+Usage: python -m benchmarks.pipeline [--rows 1000 10000 100000 1000000] [--formats csv xlsx]
+       [--max-feedback-rows 100000] [--memory] [--skip-end-to-end]
+       [--output results.json] [--baseline previous.json]
+
+For every size and input format (see benchmarks.synthetic) the analyzer
+stages run one after the other on the production settings: read_data,
+perform_analysis, vectorize_text, cluster_reviews and reduce_dimensions.
+The PDF and DOCX reports are then built once per size, over as many feedback
+rows as review rows (capped at --max-feedback-rows). Last, classify_data runs
+end to end: the file is stored as an upload, submitted to the classify
+endpoint and polled until the worker pool has finished it.
+
+Stages are timed untraced. With --memory every in-process stage runs a
+second time under tracemalloc to record its peak memory; classify_data runs
+on the worker pool, out of tracemalloc's reach, and has no memory figure.
+
+The results are printed, or written to --output, as JSON along with the
+commit and analyzer parameters they were measured with. --baseline adds the
+seconds from an earlier results file and the speedup over them.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'user_review.settings')
+django.setup()
+
+from django.core.files import File  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.test.utils import override_settings  # noqa: E402
+
+from benchmarks.reduce_dimensions import measure  # noqa: E402
+from benchmarks.report_feedback import fill  # noqa: E402
+from benchmarks.synthetic import DEFAULT_DATA_DIR, FORMATS, dataset  # noqa: E402
+from reviews.ReportGenerator import ReportGenerator  # noqa: E402
+from reviews.jobs import build_analyzer, shutdown_executor  # noqa: E402
+from reviews.models import ReviewFeedback, ReviewFile, UserInterfaceFeedback  # noqa: E402
+
+POLL_INTERVAL = 0.1
+
+
+def record(results, stage, rows, input_format, seconds, peak=None):
+    result = {
+        'stage': stage,
+        'rows': rows,
+        'input_format': input_format,
+        'seconds': round(seconds, 4),
+        'rows_per_second': round(rows / seconds, 1) if seconds else None,
+    }
+    if peak is not None:
+        result['peak_memory_bytes'] = peak
+    results.append(result)
+
+
+def timed(results, stage, rows, input_format, trace_memory, function, *args):
+    start = time.perf_counter()
+    value = function(*args)
+    seconds = time.perf_counter() - start
+    peak = measure(function, *args)[2] if trace_memory else None
+    record(results, stage, rows, input_format, seconds, peak)
+    return value
+
+
+def analyzer_stages(results, analyzer, path, rows, input_format, trace_memory):
+    df = timed(results, 'read_data', rows, input_format, trace_memory, analyzer.read_data, path)
+    columns = ['review_headline', 'review_body']
+    # perform_analysis adds its column to the frame it is given; every run gets a fresh copy
+    df = timed(results, 'perform_analysis', rows, input_format, trace_memory,
+               lambda: analyzer.perform_analysis(df[columns].copy()))
+    df['concatenated_text'] = df['review_headline'].astype(str) + ' ' + df['review_body'].astype(str)
+    tfidf_matrix, _ = timed(results, 'vectorize_text', rows, input_format, trace_memory,
+                            analyzer.vectorize_text, df, analyzer.max_features)
+    timed(results, 'cluster_reviews', rows, input_format, trace_memory,
+          analyzer.cluster_reviews, tfidf_matrix, analyzer.num_clusters)
+    timed(results, 'reduce_dimensions', rows, input_format, trace_memory,
+          analyzer.reduce_dimensions, tfidf_matrix, analyzer.num_components)
+
+
+def report_stages(results, rows, trace_memory):
+    review_file, file_output = fill(rows)
+    generator = ReportGenerator(file_output, UserInterfaceFeedback.objects.filter(review_file=review_file),
+                                ReviewFeedback.objects.filter(review_file=review_file),
+                                ['#FF6384', '#36A2EB', '#FFCE56'])
+    generator.render_charts()
+    timed(results, 'report_pdf', rows, None, trace_memory, generator.generate_pdf_report)
+    timed(results, 'report_docx', rows, None, trace_memory, generator.generate_docx_report)
+    review_file.delete()
+
+
+def classify_stage(results, client, path, rows, input_format):
+    with open(path, 'rb') as upload:
+        review_file = ReviewFile.objects.create(user_email='bench@example.com',
+                                                file=File(upload, name=os.path.basename(path)))
+    start = time.perf_counter()
+    response = client.post('/classify-data/', json.dumps({'id': review_file.id}), content_type='application/json')
+    job = response.json()
+    while job['state'] not in ('completed', 'failed'):
+        time.sleep(POLL_INTERVAL)
+        job = client.get(f"/classify-data/{job['job_id']}/").json()
+    if job['state'] == 'failed':
+        raise RuntimeError(f"Classification of {path} failed: {job['error']}")
+    record(results, 'classify_data', rows, input_format, time.perf_counter() - start)
+
+
+def run(sizes, formats, max_feedback_rows, trace_memory, end_to_end, data_dir):
+    analyzer = build_analyzer()
+    client = Client(HTTP_HOST='localhost')
+    results = []
+    for rows in sizes:
+        for input_format in formats:
+            path = dataset(rows, input_format, data_dir=data_dir)
+            analyzer_stages(results, analyzer, path, rows, input_format, trace_memory)
+            if end_to_end:
+                classify_stage(results, client, path, rows, input_format)
+        report_stages(results, min(rows, max_feedback_rows), trace_memory)
+    return results
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)
+    seconds = {(r['stage'], r['rows'], r['input_format']): r['seconds'] for r in baseline['results']}
+    for result in results:
+        previous = seconds.get((result['stage'], result['rows'], result['input_format']))
+        if previous is not None:
+            result['baseline_seconds'] = previous
+            result['speedup'] = round(previous / result['seconds'], 3) if result['seconds'] else None
+
+
+def current_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+    parser.add_argument('--formats', nargs='+', choices=FORMATS, default=list(FORMATS))
+    parser.add_argument('--max-feedback-rows', type=int, default=100000)
+    parser.add_argument('--memory', action='store_true', help='also record peak memory (slow)')
+    parser.add_argument('--skip-end-to-end', action='store_true', help='leave out classify_data')
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR, help='where the synthetic files are kept')
+    parser.add_argument('--output', help='write the JSON here instead of printing it')
+    parser.add_argument('--baseline', help='results file of an earlier run to compare with')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        # The classification workers are forked from this process, so they
+        # inherit the overridden settings, and share a database file with it
+        connection.settings_dict['TEST']['NAME'] = os.path.join(work_dir, 'benchmark.sqlite3')
+        test_database = connection.creation.create_test_db(verbosity=0)
+        try:
+            with override_settings(MEDIA_ROOT=os.path.join(work_dir, 'media'), CLASSIFICATION_POOL_START_METHOD='fork'):
+                results = run(args.rows, args.formats, args.max_feedback_rows, args.memory,
+                              not args.skip_end_to_end, args.data_dir)
+        finally:
+            shutdown_executor()
+            connection.creation.destroy_test_db(test_database, verbosity=0)
+
+    if args.baseline:
+        compare(results, args.baseline)
+    document = {
+        'commit': current_commit(),
+        'created': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'analysis_params': build_analyzer().analysis_params,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(document, output_file, indent=2)
+    else:
+        print(json.dumps(document, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""Compare the sparse truncated SVD projection with the dense PCA path.
+
+Usage: python -m benchmarks.reduce_dimensions [--rows 10000 50000] [--methods svd pca]
+
+For each size the TF-IDF matrix is built once, then every method is timed
+and its peak traced memory (numpy allocations included) recorded. Prints
+the results as JSON.
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+from benchmarks.synthetic import reference_corpus
+from reviews.data_analyzer import DataAnalyzer
+
+
+def measure(function, *args, **kwargs):
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = function(*args, **kwargs)
+        seconds = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, round(seconds, 4), peak
+
+
+def run(sizes, methods):
+    analyzer = DataAnalyzer()
+    results = []
+    for rows in sizes:
+        corpus = reference_corpus(rows, vocabulary_size=5000)
+        df = corpus.assign(concatenated_text=corpus['review_headline'] + ' ' + corpus['review_body'])
+        tfidf_matrix, _ = analyzer.vectorize_text(df, analyzer.max_features)
+        for method in methods:
+            reduced, seconds, peak = measure(analyzer.reduce_dimensions, tfidf_matrix, analyzer.num_components, method)
+            results.append({
+                'rows': rows,
+                'method': method,
+                'seconds': seconds,
+                'peak_memory_bytes': peak,
+                'output_shape': list(reduced.shape),
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 50000])
+    parser.add_argument('--methods', nargs='+', default=['svd', 'pca'])
+    args = parser.parse_args()
+    print(json.dumps(run(args.rows, args.methods), indent=2))
+
+
+if __name__ == '__main__':
+    main()
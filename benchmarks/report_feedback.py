@@ -0,0 +1,97 @@
+"""Time the PDF and DOCX writers against growing feedback volumes.
+
+Usage: python -m benchmarks.report_feedback [--rows 1000 10000 100000] [--memory]
+
+Each size fills a throwaway test database with that many review and
+interface feedback rows, then builds each report and records its time and
+file size. With --memory every report is built a second time under
+tracemalloc to record its peak memory; tracing slows reportlab down several
+times over, so it is left out of the timed run. Prints the results as JSON;
+time and memory per row should stay flat as the row count grows.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'user_review.settings')
+django.setup()
+
+from django.core.files.storage import default_storage  # noqa: E402
+from django.core.files.uploadedfile import SimpleUploadedFile  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test.utils import override_settings  # noqa: E402
+
+from benchmarks.reduce_dimensions import measure  # noqa: E402
+from reviews.ReportGenerator import ReportGenerator  # noqa: E402
+from reviews.feedback_summary import rebuild  # noqa: E402
+from reviews.models import FileOutput, ReviewFeedback, ReviewFile, UserInterfaceFeedback  # noqa: E402
+
+SUMMARY = {'labels': ['Positive', 'Neutral', 'Negative'],
+           'datasets': [{'data': [50, 30, 20], 'percentages': [50.0, 30.0, 20.0]}]}
+COMMENTS = ["Great product, works as described.", "Arrived late and the box was damaged.",
+            "The interface is confusing on mobile, the upload button is hard to find and the "
+            "progress bar does not move for large files.", "ok", "Would recommend to a friend!"]
+
+
+def fill(rows):
+    review_file = ReviewFile.objects.create(user_email='bench@example.com', file=SimpleUploadedFile(
+        'reviews.csv', b'review_headline,review_body\nGood,Works\n'))
+    file_output = FileOutput.objects.create(review_file=review_file, review_text='Benchmark report.',
+                                            sentiment_summary=SUMMARY)
+    ReviewFeedback.objects.bulk_create(
+        (ReviewFeedback(review_file=review_file, comment=COMMENTS[i % len(COMMENTS)], star_rating=i % 5 + 1)
+         for i in range(rows)), batch_size=5000)
+    UserInterfaceFeedback.objects.bulk_create(
+        (UserInterfaceFeedback(review_file=review_file, comment=COMMENTS[-i % len(COMMENTS)]) for i in range(rows)),
+        batch_size=5000)
+    rebuild(review_file.id)
+    return review_file, file_output
+
+
+def run(sizes, trace_memory=False):
+    results = []
+    for rows in sizes:
+        review_file, file_output = fill(rows)
+        generator = ReportGenerator(file_output, UserInterfaceFeedback.objects.filter(review_file=review_file),
+                                    ReviewFeedback.objects.filter(review_file=review_file),
+                                    ['#FF6384', '#36A2EB', '#FFCE56'])
+        generator.render_charts()
+        for report_format, write in (('pdf', generator.generate_pdf_report), ('docx', generator.generate_docx_report)):
+            start = time.perf_counter()
+            path = write()
+            seconds = time.perf_counter() - start
+            result = {
+                'rows': rows,
+                'format': report_format,
+                'seconds': round(seconds, 4),
+                'microseconds_per_row': round(seconds / (2 * rows) * 1e6, 1),
+                'file_bytes': default_storage.size(path),
+            }
+            if trace_memory:
+                _, _, peak = measure(write)
+                result['peak_memory_bytes'] = peak
+                result['peak_memory_bytes_per_row'] = round(peak / (2 * rows), 1)
+            results.append(result)
+        review_file.delete()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--memory', action='store_true', help='also record peak memory (slow)')
+    args = parser.parse_args()
+    test_database = connection.creation.create_test_db(verbosity=0)
+    try:
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            print(json.dumps(run(args.rows, args.memory), indent=2))
+    finally:
+        connection.creation.destroy_test_db(test_database, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
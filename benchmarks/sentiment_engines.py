@@ -0,0 +1,37 @@
+"""Compare the batch sentiment scorer with the per-review TextBlob path.
+
+Usage: python -m benchmarks.sentiment_engines [--rows 20000] [--seed 0]
+
+Prints label agreement and timings for both engines as JSON.
+"""
+import argparse
+import json
+import time
+
+from benchmarks.synthetic import reference_corpus
+from reviews.data_analyzer import DataAnalyzer
+
+
+def run(rows, seed):
+    corpus = reference_corpus(rows, seed)
+    results = {'rows': rows}
+    labels = {}
+    for engine in ('textblob', 'batch'):
+        analyzer = DataAnalyzer(sentiment_engine=engine)
+        start = time.perf_counter()
+        labels[engine] = analyzer.perform_analysis(corpus.copy())['review_sentiment']
+        results[f'{engine}_seconds'] = round(time.perf_counter() - start, 4)
+    results['agreement'] = float((labels['textblob'] == labels['batch']).mean())
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    print(json.dumps(run(args.rows, args.seed), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""Deterministic synthetic review exports for the benchmarks.
+
+Usage: python -m benchmarks.synthetic [--rows 1000 10000] [--formats csv xlsx] [--seed 0] [--data-dir DIR]
+
+Files have the columns of the marketplace exports users upload and are
+written FILE_CHUNK_ROWS rows at a time, so even the 1M row files are never
+held in memory whole. The same rows, seed and format always give the same
+file; generated files are kept in the data directory and reused. Prints the
+paths and sizes as JSON.
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from itertools import accumulate
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+SUBJECTS = ["This product", "The item", "It", "My order", "The quality", "Customer service",
+            "The battery", "This phone case", "The size", "Shipping"]
+VERBS = ["is", "was", "seems", "looks", "feels", "arrived", "works", "turned out"]
+MODIFIERS = ["", "very ", "really ", "not ", "not very ", "extremely ", "pretty ", "absolutely ",
+             "quite ", "so ", "never "]
+ADJECTIVES = ["good", "bad", "great", "terrible", "awful", "excellent", "fine", "ok", "broken",
+              "amazing", "cheap", "fast", "slow", "disappointing", "perfect", "useless", "nice",
+              "poor", "sturdy", "flimsy", "small", "big", "late", "happy", "sad"]
+ENDINGS = [".", "!", "!!", " :)", " :(", "", ". Would not buy again.", ". Highly recommend!",
+           ". I love it.", ". Returned it."]
+
+COLUMNS = ['marketplace', 'customer_id', 'review_headline', 'review_body', 'star_rating']
+FORMATS = ('csv', 'xlsx')
+FILE_CHUNK_ROWS = 50000
+VOCABULARY_SIZE = 5000
+DEFAULT_DATA_DIR = os.path.join(tempfile.gettempdir(), 'review-benchmarks')
+
+
+def reference_corpus(rows, seed=0, vocabulary_size=0, words_per_review=20):
+    # vocabulary_size > 0 appends words_per_review product words drawn from a
+    # Zipf-like vocabulary to each body, to give TF-IDF a realistic width
+    rng = random.Random(seed)
+
+    def sentence():
+        return (f"{rng.choice(SUBJECTS)} {rng.choice(VERBS)} "
+                f"{rng.choice(MODIFIERS)}{rng.choice(ADJECTIVES)}{rng.choice(ENDINGS)}")
+
+    headlines = [sentence() for _ in range(rows)]
+    bodies = [' '.join(sentence() for _ in range(rng.randint(1, 4))) for _ in range(rows)]
+    if vocabulary_size:
+        words = [f"term{i}" for i in range(vocabulary_size)]
+        # Cumulative weights give the same draws as weights without summing
+        # the whole vocabulary again for every review
+        cum_weights = list(accumulate(1.0 / (i + 1) for i in range(vocabulary_size)))
+        bodies = [f"{body} {' '.join(rng.choices(words, cum_weights=cum_weights, k=words_per_review))}"
+                  for body in bodies]
+    return pd.DataFrame({'review_headline': headlines, 'review_body': bodies})
+
+
+def iter_reviews(rows, seed=0, vocabulary_size=VOCABULARY_SIZE):
+    # DataFrames of at most FILE_CHUNK_ROWS rows with every export column.
+    # Each chunk has its own seed, so a file's rows do not depend on how many
+    # rows follow them.
+    for start in range(0, rows, FILE_CHUNK_ROWS):
+        count = min(FILE_CHUNK_ROWS, rows - start)
+        chunk_seed = seed * 1_000_000_007 + start
+        frame = reference_corpus(count, chunk_seed, vocabulary_size)
+        frame.insert(0, 'marketplace', 'US')
+        frame.insert(1, 'customer_id', np.arange(start, start + count))
+        frame['star_rating'] = np.random.default_rng(chunk_seed).integers(1, 6, count)
+        yield frame
+
+
+def write_reviews(path, rows, seed=0, vocabulary_size=VOCABULARY_SIZE):
+    if path.endswith('.csv'):
+        for index, frame in enumerate(iter_reviews(rows, seed, vocabulary_size)):
+            frame.to_csv(path, mode='w' if index == 0 else 'a', header=index == 0, index=False)
+    elif path.endswith('.xlsx'):
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet()
+        sheet.append(COLUMNS)
+        for frame in iter_reviews(rows, seed, vocabulary_size):
+            for row in frame.itertuples(index=False):
+                sheet.append([row.marketplace, int(row.customer_id), row.review_headline, row.review_body,
+                              int(row.star_rating)])
+        workbook.save(path)
+    else:
+        raise ValueError(f"Unsupported format: {path}")
+
+
+def dataset(rows, file_format='csv', seed=0, data_dir=DEFAULT_DATA_DIR):
+    # Path of the synthetic file, generating it on first use
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f'reviews-{rows}-{seed}.{file_format}')
+    if not os.path.exists(path):
+        # Written under a temporary name, so an interrupted run leaves no
+        # truncated file behind to be reused
+        partial = os.path.join(data_dir, f'.partial-{os.getpid()}-{os.path.basename(path)}')
+        try:
+            write_reviews(partial, rows, seed)
+            os.replace(partial, path)
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+    parser.add_argument('--formats', nargs='+', choices=FORMATS, default=list(FORMATS))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR)
+    args = parser.parse_args()
+    results = []
+    for rows in args.rows:
+        for file_format in args.formats:
+            start = time.perf_counter()
+            path = dataset(rows, file_format, args.seed, args.data_dir)
+            results.append({'rows': rows, 'format': file_format, 'path': path, 'bytes': os.path.getsize(path),
+                            'seconds': round(time.perf_counter() - start, 4)})
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -6,6 +6,7 @@ import { faFileUpload } from '@fortawesome/free-solid-svg-icons';
 import axios from 'axios';
 import { useNavigate } from 'react-router-dom';
 import { ClipLoader } from 'react-spinners';
+import { compareFiles } from '../shared/compareJob';
 
 function Compare() {
     const navigate = useNavigate();
@@ -37,11 +38,12 @@ function Compare() {
             const response1 = await uploadFile(files.file1);
             const response2 = await uploadFile(files.file2);
             if (response1 && response2) {
-              const classifyResponse1 = await handleClassify(response1.data);
-              const classifyResponse2 = await handleClassify(response2.data);
+              // Both files are analyzed together, so their clusters and
+              // scatter plots share one space and can be compared directly
+              const comparison = await handleCompare([response1.data.id, response2.data.id]);
       
-              if (classifyResponse1 && classifyResponse2) {
-                // Logic to compare the classified data from both files
+              if (comparison) {
+                const [classifyResponse1, classifyResponse2] = comparison.files;
                 localStorage.setItem('classifyResponse1', JSON.stringify(classifyResponse1));
                 localStorage.setItem('classifyResponse2', JSON.stringify(classifyResponse2));
                 alert('Both files uploaded and classified successfully. Ready to compare.');
@@ -60,20 +62,13 @@ function Compare() {
         }
       };
       
-      const handleClassify = async (uploadResponse) => {
+      const handleCompare = async (ids) => {
         try {
-          const response = await axios.post(`${apiUrl}/classify-data/`, uploadResponse, {
-            headers: {
-              'Content-Type': 'multipart/json',
-            },
-          });
-          if (response.status === 200) {
-            return response.data.classified_data;
-          }
+          return await compareFiles(apiUrl, ids);
         } catch (error) {
           setErrorMessage('Error classifying data. Please try again later.');
           console.error(error);
-          return null; // Ensure you return null in case of an error for consistent function behavior
+          return null;
         }
       };
       
@@ -6,6 +6,7 @@ import { faFileUpload } from '@fortawesome/free-solid-svg-icons';
 import { useNavigate } from 'react-router-dom';
 import axios from 'axios';
 import { ClipLoader } from 'react-spinners';
+import { classifyFile } from '../shared/classifyJob';
 
 function DataImport() {
   const apiUrl = process.env.REACT_APP_API_URL;
@@ -14,6 +15,7 @@ function DataImport() {
   const [errorMessage, setErrorMessage] = useState(null);
   const [isFileUploaded, setIsFileUploaded] = useState(false);
   const [isLoading, setIsLoading] = useState(false);
+  const [progress, setProgress] = useState(null);
   const fileInputRef = useRef(null);
   const [uploadResponse, setUploadResponse] = useState(null);
   const user_email = JSON.parse(localStorage.getItem('user'))?.email;
@@ -43,23 +45,19 @@ function DataImport() {
   const handleClassifyClick = async () => {
     if (uploadResponse) { 
       setIsLoading(true);
+      setProgress(0);
       try {
-        const response = await axios.post(`${apiUrl}/classify-data/`, uploadResponse, {
-          headers: {
-            'Content-Type': 'multipart/json',
-          },
-        });
-        if (response.status === 200) {
-          localStorage.setItem('sentiment_summary', JSON.stringify(response.data.classified_data));
-          localStorage.setItem('uploadFile', JSON.stringify(uploadResponse));
-          alert(response.data.message);
-          navigate('/visualization');
-        }
+        const job = await classifyFile(apiUrl, uploadResponse, setProgress);
+        localStorage.setItem('sentiment_summary', JSON.stringify(job.classified_data));
+        localStorage.setItem('uploadFile', JSON.stringify(uploadResponse));
+        alert(job.message);
+        navigate('/visualization');
       } catch (error) {
         setErrorMessage('Error classifying data. Please try again later.');
         console.log(error);
       }
       setIsLoading(false);
+      setProgress(null);
     } else {
       setErrorMessage('Please upload a file first.');
     }
@@ -146,6 +144,7 @@ function DataImport() {
           {isLoading && (
             <div className={styles.loadingGraphics}>
               <ClipLoader size={50} color={"#123abc"} />
+              {progress !== null && <p>{`${progress}%`}</p>}
             </div>
           )}
         </div>
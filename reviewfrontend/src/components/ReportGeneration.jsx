@@ -1,11 +1,19 @@
 import React, { useState } from 'react';
-import axios from 'axios';
 import Navbar from '../shared/Navbar';
 import styles from '../assets/reportGeneration.module.css';
 import { useNavigate } from 'react-router-dom';
+import { generateReports } from '../shared/reportJob';
+
+const STAGE_LABELS = {
+    queued: 'Waiting for a worker',
+    charts: 'Rendering charts',
+    writing: 'Writing PDF and Word document',
+    done: 'Done',
+};
 
 function ReportGeneration() {
     const [reportPaths, setReportPaths] = useState({ pdf: '', docx: '' });
+    const [reportProgress, setReportProgress] = useState(null);
     const navigate = useNavigate();
     const apiUrl = process.env.REACT_APP_API_URL;
     const review_file_id = JSON.parse(localStorage.getItem('uploadFile'))?.id;
@@ -18,18 +26,22 @@ function ReportGeneration() {
             return;
         }
 
+        setReportPaths({ pdf: '', docx: '' });
         try {
-            const response = await axios.get(`${apiUrl}/generatereportdata/`, {
-                params: { review_file_id, colorOptions }
+            const job = await generateReports(apiUrl, review_file_id, colorOptions, (stage, progress) => {
+                setReportProgress({ stage, progress });
             });
-            setReportPaths(response.data);
+            setReportPaths(job);
         } catch (error) {
             if (error.response && error.response.data.error === 'Please submit data file first.') {
                 alert('Please submit data file first.');
                 navigate('/import');
             } else {
                 console.error('Error fetching report data:', error);
+                alert(error.message);
             }
+        } finally {
+            setReportProgress(null);
         }
     };
 
@@ -46,9 +58,14 @@ function ReportGeneration() {
           <Navbar activePage="ReportGeneration" />
           <div className={styles.container}>
             <h2 className={styles.heading}>Report Generation</h2>
-            <button className={`btn btn-primary ${styles.button}`} onClick={fetchReportData}>
+            <button className={`btn btn-primary ${styles.button}`} onClick={fetchReportData} disabled={reportProgress !== null}>
               Generate Report
             </button>
+            {reportProgress && (
+              <p className={styles.subHeading}>
+                {STAGE_LABELS[reportProgress.stage] || reportProgress.stage} ({reportProgress.progress}%)
+              </p>
+            )}
             <div className={styles.downloadButtons}>
               {reportPaths.pdf_path && (
                 <div className={styles.buttonContainer}>
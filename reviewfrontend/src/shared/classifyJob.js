@@ -0,0 +1,24 @@
+// classifyJob.js
+import axios from 'axios';
+import { pollJob } from './pollJob';
+
+// Submits a classification job for an uploaded file and polls its status
+// until the worker pool has finished. Resolves with the final status payload.
+export const classifyFile = async (apiUrl, uploadResponse, onProgress) => {
+    const submitResponse = await axios.post(`${apiUrl}/classify-data/`, uploadResponse, {
+        headers: {
+            'Content-Type': 'multipart/json',
+        },
+    });
+    const jobId = submitResponse.data.job_id;
+
+    const job = await pollJob(`${apiUrl}/classify-data/${jobId}/`, (status) => {
+        if (onProgress) {
+            onProgress(status.progress);
+        }
+    });
+    if (!job.classified_data) {
+        throw new Error('The classification result is no longer available');
+    }
+    return job;
+};
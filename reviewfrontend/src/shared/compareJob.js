@@ -0,0 +1,17 @@
+// compareJob.js
+import axios from 'axios';
+import { pollJob } from './pollJob';
+
+// Starts a comparison of uploaded files and polls the job until the worker
+// pool has analyzed them together. Resolves with the final status payload,
+// which holds the shared clusters and one result per file.
+export const compareFiles = async (apiUrl, ids, onProgress) => {
+    const submitResponse = await axios.post(`${apiUrl}/compare/`, { ids });
+    const jobId = submitResponse.data.job_id;
+
+    return pollJob(`${apiUrl}/compare/${jobId}/`, (status) => {
+        if (onProgress) {
+            onProgress(status.progress);
+        }
+    });
+};
@@ -0,0 +1,26 @@
+// pollJob.js
+import axios from 'axios';
+
+const POLL_INTERVAL_MS = 1000;
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+// Polls a job's status URL until the worker pool has finished it. onProgress
+// receives every status payload. Resolves with the completed payload and
+// rejects with the job's error when it failed.
+export const pollJob = async (url, onProgress) => {
+    while (true) {
+        const statusResponse = await axios.get(url);
+        const job = statusResponse.data;
+        if (onProgress) {
+            onProgress(job);
+        }
+        if (job.state === 'completed') {
+            return job;
+        }
+        if (job.state === 'failed') {
+            throw new Error(job.error || 'The job failed');
+        }
+        await sleep(POLL_INTERVAL_MS);
+    }
+};
@@ -0,0 +1,20 @@
+// reportJob.js
+import axios from 'axios';
+import { pollJob } from './pollJob';
+
+// Starts report generation for a classified file and polls the job until the
+// PDF and DOCX are written. onProgress receives the stage and percentage.
+// Resolves with the final status payload, which holds the download paths.
+export const generateReports = async (apiUrl, reviewFileId, colorOptions, onProgress) => {
+    const submitResponse = await axios.post(`${apiUrl}/report-jobs/`, {
+        review_file_id: reviewFileId,
+        colorOptions: colorOptions || [],
+    });
+    const jobId = submitResponse.data.job_id;
+
+    return pollJob(`${apiUrl}/report-jobs/${jobId}/`, (status) => {
+        if (onProgress) {
+            onProgress(status.stage, status.progress);
+        }
+    });
+};
@@ -1,222 +1,224 @@
-import os
 import tempfile
-
+from copy import deepcopy
 from io import BytesIO
-import matplotlib
-matplotlib.use('Agg')  # Set the backend before importing pyplot
-import matplotlib.pyplot as plt
-from matplotlib.figure import Figure
+from xml.sax.saxutils import escape
+
 from docx import Document
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 from docx.oxml import parse_xml
 from docx.oxml.ns import nsdecls
 from docx.shared import Inches, Pt
+from docx.table import _Cell
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import A4
+from reportlab.lib.enums import TA_CENTER
 from reportlab.lib.styles import ParagraphStyle
-from reportlab.pdfgen import canvas
-from reportlab.platypus import Paragraph, Table, TableStyle
-from django.core.files.base import ContentFile
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.platypus import Image, PageBreak, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+from django.core.files import File
 from django.core.files.storage import default_storage
+from reviews.charts import chart_renderer
+from reviews.feedback_summary import get_summary
+
+# Feedback rows fetched per query and rows per table in the reports
+FEEDBACK_CHUNK_SIZE = 500
+HEADING_STYLE = ParagraphStyle(name='Heading', fontName='Helvetica-Bold', fontSize=14, leading=18, spaceBefore=10, spaceAfter=10)
+CELL_STYLE = ParagraphStyle(name='Cell', fontName='Helvetica', fontSize=10, leading=12, alignment=TA_CENTER)
+
+
+class FlowableStream(list):
+    """Flowables for SimpleDocTemplate.build() drawn from an iterator.
+
+    build() consumes its list from the front and checks len() before every
+    flowable, so topping the list up there keeps only the next few tables in
+    memory instead of every row of the report.
+    """
+
+    def __init__(self, flowables, lookahead=2):
+        super().__init__()
+        self._source = iter(flowables)
+        self.lookahead = lookahead
+
+    def __len__(self):
+        while super().__len__() < self.lookahead:
+            flowable = next(self._source, None)
+            if flowable is None:
+                break
+            self.append(flowable)
+        return super().__len__()
 
 
 class ReportGenerator:
 
-    def __init__(self, file_output, ui_feedbacks, review_feedbacks, colorOptions):
+    def __init__(self, file_output, ui_feedbacks, review_feedbacks, colorOptions, feedback_summary=None,
+                 charts=None):
+        # charts, when given, are the PNG bytes render_charts() returned on
+        # another generator of the same output and colors
         self.file_output = file_output
         self.ui_feedbacks = ui_feedbacks
         self.review_feedbacks = review_feedbacks
         self.colorOptions = colorOptions
+        self.feedback_summary = feedback_summary
+        self._charts = charts
 
     def create_pie_chart(self):
         sentiment_summary = self.file_output.sentiment_summary
         labels = sentiment_summary['labels']
         data = sentiment_summary['datasets'][0]['data']
-        colors = self.colorOptions
-        
-        fig, ax = plt.subplots()
-        ax.pie(data, labels=labels, colors=colors, autopct='%1.1f%%')
-        ax.set_title("Pie Chart - Sentiment Distribution")
-        plt.axis('equal')  # Equal aspect ratio ensures that pie is drawn as a circle.
-
-        # Save pie chart to a bytes buffer
-        buf = BytesIO()
-        plt.savefig(buf, format='png')
-        plt.close(fig)
-        return buf.getvalue()
+        return chart_renderer.pie_chart(data, labels, self.colorOptions)
 
     def create_bar_chart(self):
         sentiment_summary = self.file_output.sentiment_summary
         labels = sentiment_summary['labels']
         data = sentiment_summary['datasets'][0]['data']
-        
-        fig, ax = plt.subplots()
-        ax.bar(labels, data, color=self.colorOptions)
-        ax.set_title("Bar Chart - Sentiment Counts")
-        
-        # Save bar chart to a bytes buffer
-        buf = BytesIO()
-        plt.savefig(buf, format='png')
-        plt.close(fig)
-        return buf.getvalue()
+        return chart_renderer.bar_chart(data, labels, self.colorOptions)
     
-    def save_chart_to_temp_file(self, chart_data, chart_type='png'):
-        # Create a temporary file
-        file_descriptor, file_path = tempfile.mkstemp(suffix=f'.{chart_type}')
-        # Write chart data to it
-        with os.fdopen(file_descriptor, 'wb') as temp_file:
-            temp_file.write(chart_data)
-        return file_path
+    def render_charts(self):
+        # PNG bytes of both charts, rendered once and shared by the PDF and DOCX writers
+        if self._charts is None:
+            self._charts = {'pie': self.create_pie_chart(), 'bar': self.create_bar_chart()}
+        return self._charts
+
+    def feedback_statistics(self):
+        # [label, value] rows for the feedback summary table, read from the
+        # file's FeedbackSummary rather than counted from the feedback rows
+        if self.feedback_summary is None:
+            self.feedback_summary = get_summary(self.file_output.review_file_id)
+        summary = self.feedback_summary
+        mean_rating = summary.mean_rating
+        latest = max((date for date in (summary.review_latest, summary.interface_latest) if date), default=None)
+        rows = [
+            ['User interface feedback', str(summary.interface_count)],
+            ['Review feedback', str(summary.review_count)],
+            ['Average rating', f"{mean_rating:.2f}" if mean_rating is not None else '-'],
+        ]
+        rows += [[f'{rating} star ratings', str(count)] for rating, count in summary.histogram.items()]
+        rows.append(['Latest feedback', latest.strftime("%Y-%m-%d %H:%M:%S") if latest else '-'])
+        return rows
+
+    def generate_report(self, report_format):
+        # Path of the saved 'pdf' or 'docx' report. jobs.write_reports runs
+        # one generator per format on the worker pool, so both are written at
+        # the same time from charts rendered once.
+        if report_format == 'pdf':
+            return self.generate_pdf_report()
+        if report_format == 'docx':
+            return self.generate_docx_report()
+        raise ValueError(f"Unsupported report format: {report_format}")
+
+    def feedback_rows(self, feedbacks, include_rating=False):
+        # Yields [comment, created date, (rating)] for each feedback, reading
+        # querysets in chunks instead of loading them whole
+        if hasattr(feedbacks, 'iterator'):
+            fields = ['comment', 'created_date'] + (['star_rating'] if include_rating else [])
+            rows = feedbacks.order_by('id').values_list(*fields).iterator(chunk_size=FEEDBACK_CHUNK_SIZE)
+        else:
+            rows = ((feedback.comment, feedback.created_date, getattr(feedback, 'star_rating', '')) for feedback in feedbacks)
+        for row in rows:
+            values = [row[0], row[1].strftime("%Y-%m-%d %H:%M:%S")]
+            if include_rating:
+                values.append(str(row[2]))
+            yield values
 
-    def generate_pdf_report(self):
-        # Create charts
-        pie_chart_data = self.create_pie_chart()
-        bar_chart_data = self.create_bar_chart()
+    def save_report(self, file_name, write):
+        # Documents are written to a temporary file, which storage then copies
+        # in chunks, so a large report is never held in memory as one buffer
+        with tempfile.TemporaryFile() as temp_file:
+            write(temp_file)
+            temp_file.seek(0)
+            return default_storage.save(file_name, File(temp_file, name=file_name))
 
-        # Save charts to temporary files
-        pie_chart_path = self.save_chart_to_temp_file(pie_chart_data)
-        bar_chart_path = self.save_chart_to_temp_file(bar_chart_data)
+    def generate_pdf_report(self):
+        charts = self.render_charts()
 
         # PDF generation setup
         pdf_filename = f'report_{self.file_output.review_file.id}.pdf'
-        buffer = BytesIO()
-        c = canvas.Canvas(buffer, pagesize=A4)
-        width, height = A4  # Width and height of the A4 page
-
-        # Starting Y position (from top of the page, moving down)
-        y_position = height - 30
-
-        # Draw Report Title
-        c.setFont("Helvetica-Bold", 16)
-        c.drawCentredString(width / 2, y_position, "Report")
-        y_position -= 30  # Move down for the next element
-
-        style = ParagraphStyle(name='Normal', fontName='Helvetica', fontSize=12, leading=15)
-
-        # Create a paragraph with the review text
-        review_text_paragraph = Paragraph(self.file_output.review_text, style)
-
-        # Calculate the height the paragraph will take and update y_position accordingly
-        text_width, text_height = review_text_paragraph.wrapOn(c, width - 144, height)  # 72 points margin on each side
-        y_position -= text_height + 40  # Subtract the height of the text block plus some padding
-
-        # Draw the paragraph on the canvas
-        if y_position < 0:
-            y_position = height - text_height - 20
-
-        review_text_paragraph.drawOn(c, 72, y_position)
-        # Draw pie chart
-        c.drawImage(pie_chart_path, 72, y_position - 200, width=400, height=200)
-        y_position -= 220  # Move down for the next element, including some padding
-        # Draw bar chart
-        c.drawImage(bar_chart_path, 72, y_position - 200, width=400, height=200)
-        y_position -= 220  # Move down for the next element, including some padding
-
-        # Add summary table
-        y_position = self.add_summary_table_to_pdf(c, (width, y_position))
-        # Assuming add_summary_table_to_pdf adjusts y_position internally
-
-        # Add a new page for the feedback tables
-        c.showPage()
-        page_width, page_height = A4  # Assuming A4 page size
-
-        # Starting Y position for the new page (from the top, going down)
-        y_position = page_height - 30  # Start below the top margin
-
-        # Draw the UI Feedback table
-        y_position = self.add_feedback_table_to_pdf(c, self.ui_feedbacks, 'User Interface Feedback', y_position, page_width, False)
-
-        # Add some space before the next table
-        y_position -= 20
-
-        # Draw the Review Feedback table
-        y_position = self.add_feedback_table_to_pdf(c, self.review_feedbacks, 'Review Feedback', y_position, page_width,True)
-
-        # Finalize the PDF and save
-        c.showPage()
-        c.save()
-
-        # Get the buffer's content as a Django friendly ContentFile
-        pdf_content = ContentFile(buffer.getvalue())
-        # Save the ContentFile to the media directory using default_storage
-        pdf_path = default_storage.save(pdf_filename, pdf_content)
-
-        # Make sure to close the buffer and clean up temporary
-        buffer.close()
-        # Clean up temporary files
-        os.remove(pie_chart_path)
-        os.remove(bar_chart_path)
-        return pdf_path
-
-    def add_summary_table_to_pdf(self, c, page_dimensions):
-
-        width, y_position = page_dimensions
-        sentiment_summary = self.file_output.sentiment_summary
-        data = [['Review Type', 'Total', 'Percentage']]
-
-        c.setFont("Helvetica-Bold", 14)
-        c.drawString(72, y_position, 'Summary Table')
-        y_position -= 20  # Space after title
-        
-        for label, count, percent in zip(sentiment_summary['labels'], sentiment_summary['datasets'][0]['data'], sentiment_summary['datasets'][0]['percentages']):
-            data.append([label, str(count), f"{percent:.2f}%"])
-        
-        table = Table(data, colWidths=[width * 0.27] * 3)
-        table.setStyle(TableStyle([
+        title_style = ParagraphStyle(name='Title', fontName='Helvetica-Bold', fontSize=16, leading=20, alignment=TA_CENTER, spaceAfter=20)
+        style = ParagraphStyle(name='Normal', fontName='Helvetica', fontSize=12, leading=15, spaceAfter=20)
+
+        # Flowables: title, review text, charts and summary, then the feedback
+        # tables on their own pages
+        def flowables():
+            yield Paragraph("Report", title_style)
+            yield Paragraph(escape(self.file_output.review_text), style)
+            yield Image(BytesIO(charts['pie']), width=400, height=200)
+            yield Spacer(1, 20)
+            yield Image(BytesIO(charts['bar']), width=400, height=200)
+            yield Spacer(1, 20)
+            yield from self.summary_table_flowables()
+            yield from self.feedback_summary_flowables()
+            yield PageBreak()
+            yield from self.feedback_table_flowables(self.ui_feedbacks, 'User Interface Feedback', False)
+            yield Spacer(1, 20)
+            yield from self.feedback_table_flowables(self.review_feedbacks, 'Review Feedback', True)
+
+        def write(pdf_file):
+            doc = SimpleDocTemplate(pdf_file, pagesize=A4, topMargin=30)
+            doc.build(FlowableStream(flowables()))
+
+        return self.save_report(pdf_filename, write)
+
+    def table_style(self):
+        return TableStyle([
             ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
             ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
             ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
             ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
             ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
             ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
             ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ]))
-        
-        table_width, table_height = table.wrapOn(c, width, y_position)
-        table.drawOn(c, 72, y_position - table_height)
+        ])
 
-        return y_position - table_height - 10  # Return updated y_position
-
-    def add_feedback_table_to_pdf(self, c, feedbacks, title, y_position, page_width, include_rating=False):
-        # Add a title for the feedback table
-        c.setFont("Helvetica-Bold", 14)
-        c.drawString(72, y_position, title)
-        y_position -= 20  # Space after title
+    def summary_table_flowables(self):
+        width, _ = A4
+        sentiment_summary = self.file_output.sentiment_summary
+        data = [['Review Type', 'Total', 'Percentage']]
+        for label, count, percent in zip(sentiment_summary['labels'], sentiment_summary['datasets'][0]['data'], sentiment_summary['datasets'][0]['percentages']):
+            data.append([label, str(count), f"{percent:.2f}%"])
 
-        # Determine the column widths and headers based on whether rating is included
+        table = Table(data, colWidths=[width * 0.27] * 3)
+        table.setStyle(self.table_style())
+        return [Paragraph('Summary Table', HEADING_STYLE), table]
+
+    def feedback_summary_flowables(self):
+        width, _ = A4
+        table = Table([['Feedback', 'Value']] + self.feedback_statistics(), colWidths=[width * 0.4, width * 0.27])
+        table.setStyle(self.table_style())
+        return [Paragraph('Feedback Summary', HEADING_STYLE), table]
+
+    def feedback_table_flowables(self, feedbacks, title, include_rating=False):
+        # One table per FEEDBACK_CHUNK_SIZE rows, each repeating its header on
+        # every page it spans; a single huge table would be re-measured on
+        # every page split
+        yield Paragraph(title, HEADING_STYLE)
+        width = A4[0] - 144  # 72 points margin on each side
         if include_rating:
-            colWidths = [page_width * 0.266667] * 3
-            data = [['Comment', 'Created Date', 'Rating']]
+            colWidths = [width * 0.6, width * 0.27, width * 0.13]
+            header = ['Comment', 'Created Date', 'Rating']
         else:
-            colWidths = [page_width * 0.4] * 2
-            data = [['Comment', 'Created Date']]
-
-        # Populate table data
-        for feedback in feedbacks:
-            row = [feedback.comment, feedback.created_date.strftime("%Y-%m-%d %H:%M:%S")]
-            if include_rating:
-                row.append(str(feedback.star_rating))
+            colWidths = [width * 0.7, width * 0.3]
+            header = ['Comment', 'Created Date']
+
+        # Cell text is Helvetica 10 with 6 points of padding on each side
+        comment_width = colWidths[0] - 12
+        data = [header]
+        for row in self.feedback_rows(feedbacks, include_rating):
+            # Comments too long for their column wrap in a Paragraph instead of
+            # running off the page; laying one out costs far more than a string
+            if stringWidth(row[0], CELL_STYLE.fontName, CELL_STYLE.fontSize) > comment_width:
+                row[0] = Paragraph(escape(row[0]), CELL_STYLE)
             data.append(row)
+            if len(data) > FEEDBACK_CHUNK_SIZE:
+                yield self._feedback_table(data, colWidths)
+                data = [header]
+        if len(data) > 1:
+            yield self._feedback_table(data, colWidths)
 
-        # Create the table and style it
-        table = Table(data, colWidths=colWidths)
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ]))
-
-        # Calculate the height the table will take and draw the table
-        table.wrapOn(c, page_width, y_position)
-        table_height = table.wrap(page_width, y_position)[1]
-        table.drawOn(c, 72, y_position - table_height - 20)  # Extra 20 for spacing
-
-        # Return the new y_position, above the table and with some padding
-        return y_position - table_height - 30
+    def _feedback_table(self, data, colWidths):
+        table = Table(data, colWidths=colWidths, repeatRows=1)
+        table.setStyle(self.table_style())
+        return table
 
     def set_cell_style(self, cell, bold=False, background_color=None):
         paragraphs = cell.paragraphs
@@ -228,12 +230,10 @@ class ReportGenerator:
             paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
         
         if background_color:
-            shading_elm = parse_xml(r'<w:shd {} w:fill="{}"/>'.format(nsdecls('w'), background_color))
-            cell._tc.get_or_add_tcPr().append(shading_elm)
+            self.set_cell_background_color(cell, background_color)
     
     def set_cell_background_color(self, cell, rgb_color):
-        shading_elm = OxmlElement('w:shd')
-        shading_elm.set(qn('w:fill'), rgb_color)
+        shading_elm = parse_xml(r'<w:shd {} w:fill="{}"/>'.format(nsdecls('w'), rgb_color))
         cell._tc.get_or_add_tcPr().append(shading_elm)
 
     def generate_docx_report(self):
@@ -246,41 +246,21 @@ class ReportGenerator:
         paragraph.style.font.size = Pt(12)
 
         # Add charts as images
-        pie_chart_image = self.create_pie_chart()
-        bar_chart_image = self.create_bar_chart()
+        charts = self.render_charts()
+        doc.add_picture(BytesIO(charts['pie']), width=Inches(6))
+        doc.add_picture(BytesIO(charts['bar']), width=Inches(6))
 
-        # Save charts to temporary files and add to doc
-        pie_chart_path = self.save_chart_to_temp_file(pie_chart_image, 'png')
-        bar_chart_path = self.save_chart_to_temp_file(bar_chart_image, 'png')
-
-        doc.add_picture(pie_chart_path, width=Inches(6))
-        doc.add_picture(bar_chart_path, width=Inches(6))
-
-        # Add sentiment summary table
+        # Add sentiment summary and feedback summary tables
         self.add_summary_table_to_docx(doc, self.file_output.sentiment_summary)
+        self.add_feedback_summary_to_docx(doc)
 
         # Add feedback tables on a new page
         doc.add_page_break()
         self.add_feedback_table_to_docx(doc, self.ui_feedbacks, 'User Interface Feedback', include_rating=False)
         self.add_feedback_table_to_docx(doc, self.review_feedbacks, 'Review Feedback', include_rating=True)
 
-        # Save the docx file to a byte stream
-        docx_stream = BytesIO()
-        doc.save(docx_stream)
-        docx_stream.seek(0)
-
-        # Prepare the ContentFile to be saved
-        docx_content = ContentFile(docx_stream.read(), name=f'report_{self.file_output.review_file.id}.docx')
-        
-        # Use default_storage to save the ContentFile
-        docx_path = default_storage.save(docx_content.name, docx_content)
-
-        # Clean up temporary chart files
-        os.remove(pie_chart_path)
-        os.remove(bar_chart_path)
-
-        # Return the path where the file was saved
-        return docx_path
+        # Save the docx file and return the path where it was saved
+        return self.save_report(f'report_{self.file_output.review_file.id}.docx', doc.save)
 
     def add_summary_table_to_docx(self, doc, sentiment_summary):
         table = doc.add_table(rows=1, cols=3)
@@ -307,6 +287,24 @@ class ReportGenerator:
 
         return doc
 
+    def add_feedback_summary_to_docx(self, doc):
+        doc.add_heading('Feedback Summary', level=2)
+        table = doc.add_table(rows=1, cols=2)
+        table.style = 'TableGrid'
+        hdr_cells = table.rows[0].cells
+        hdr_cells[0].text = 'Feedback'
+        hdr_cells[1].text = 'Value'
+        for cell in hdr_cells:
+            self.set_cell_style(cell, bold=True, background_color='D3D3D3')
+
+        for label, value in self.feedback_statistics():
+            row_cells = table.add_row().cells
+            row_cells[0].text = label
+            row_cells[1].text = value
+            for cell in row_cells:
+                self.set_cell_style(cell)
+        return doc
+
     def add_feedback_table_to_docx(self, doc, feedbacks, title, include_rating=False):
         # Add a title for the feedback table
         doc.add_heading(title, level=2)
@@ -322,21 +320,36 @@ class ReportGenerator:
         if include_rating:
             hdr_cells[2].text = 'Rating'
 
-        # Set header row style
+        # Set header row style, repeated on every page the table spans
         for cell in hdr_cells:
             self.set_cell_style(cell, bold=True, background_color='D3D3D3')
-
-        # Populate table data
-        for feedback in feedbacks:
-            row_cells = table.add_row().cells
-            row_cells[0].text = feedback.comment
-            row_cells[1].text = feedback.created_date.strftime("%Y-%m-%d %H:%M:%S")
-            if include_rating:
-                row_cells[2].text = str(feedback.star_rating) if hasattr(feedback, 'star_rating') else ""
-
-            # Set data row style
-            for cell in row_cells:
-                self.set_cell_style(cell)
+        table.rows[0]._tr.get_or_add_trPr().append(parse_xml(r'<w:tblHeader {}/>'.format(nsdecls('w'))))
+
+        # Populate table data. Data rows all look the same (see set_cell_style),
+        # so each is a copy of one styled template row with its text filled in.
+        # table.add_row() and row.cells would search the growing table for every
+        # row, which makes filling it quadratic.
+        paragraph = parse_xml(
+            r'<w:p {}><w:pPr><w:jc w:val="center"/></w:pPr>'
+            r'<w:r><w:rPr><w:sz w:val="22"/></w:rPr><w:t xml:space="preserve"/></w:r></w:p>'.format(nsdecls('w'))
+        )
+        template = table.add_row()._tr
+        for tc in template.tc_lst:
+            tc.replace(tc.p_lst[0], deepcopy(paragraph))
+        tbl = table._tbl
+        tbl.remove(template)
+
+        for values in self.feedback_rows(feedbacks, include_rating):
+            tr = deepcopy(template)
+            tbl.append(tr)
+            for tc, value in zip(tr.tc_lst, values):
+                if '\n' in value or '\t' in value:
+                    # Line breaks and tabs need python-docx's run handling
+                    cell = _Cell(tc, table)
+                    cell.text = value
+                    self.set_cell_style(cell)
+                else:
+                    tc.p_lst[0][-1][-1].text = value
 
         # Return the document after adding the feedback table
-        return doc
\ No newline at end of file
+        return doc
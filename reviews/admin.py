@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import CustomUser, ReviewFile, FileOutput, UserInterfaceFeedback, ReviewFeedback, ReportGenerated
+from .models import CustomUser, ReviewFile, FileOutput, UserInterfaceFeedback, ReviewFeedback, ReportGenerated, ClassificationJob, AnalysisCacheEntry, StoredBlob, ReviewResultSet, ReviewResult, ReportCacheEntry, ReportJob, FeedbackSummary, CompareJob
 
 @admin.register(CustomUser)
 class CustomUserAdmin(admin.ModelAdmin):
@@ -7,7 +7,7 @@ class CustomUserAdmin(admin.ModelAdmin):
 
 @admin.register(ReviewFile)
 class ReviewFileAdmin(admin.ModelAdmin):
-    list_display = ('user_email', 'file', 'created_date', 'unique_id')
+    list_display = ('user_email', 'file', 'created_date', 'unique_id', 'revision_of')
     search_fields = ('user_email', 'unique_id')
 
 @admin.register(FileOutput)
@@ -28,4 +28,55 @@ class ReviewFeedbackAdmin(admin.ModelAdmin):
 @admin.register(ReportGenerated)
 class ReportGeneratedAdmin(admin.ModelAdmin):
     list_display = ('generated_at', 'file_path', 'review_file')
-    search_fields = ('review_file__file',)
\ No newline at end of file
+    search_fields = ('review_file__file',)
+
+@admin.register(ClassificationJob)
+class ClassificationJobAdmin(admin.ModelAdmin):
+    list_display = ('unique_id', 'review_file', 'state', 'progress', 'cache_hit', 'reused_rows', 'profile_mode', 'created_date')
+    list_filter = ('state', 'profile_mode')
+    search_fields = ('unique_id', 'review_file__file')
+
+@admin.register(AnalysisCacheEntry)
+class AnalysisCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ('content_hash', 'params_key', 'size_bytes', 'hit_count', 'last_used_date')
+    search_fields = ('content_hash',)
+    exclude = ('result',)
+
+@admin.register(StoredBlob)
+class StoredBlobAdmin(admin.ModelAdmin):
+    list_display = ('content_hash', 'file', 'size', 'ref_count', 'created_date')
+    search_fields = ('content_hash',)
+
+@admin.register(ReviewResultSet)
+class ReviewResultSetAdmin(admin.ModelAdmin):
+    list_display = ('content_hash', 'params_key', 'row_count', 'complete', 'created_date')
+    search_fields = ('content_hash',)
+
+@admin.register(ReviewResult)
+class ReviewResultAdmin(admin.ModelAdmin):
+    list_display = ('result_set', 'row_index', 'sentiment', 'cluster')
+    list_filter = ('sentiment',)
+    raw_id_fields = ('result_set',)
+
+@admin.register(ReportCacheEntry)
+class ReportCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ('cache_key', 'file_output', 'size_bytes', 'hit_count', 'last_used_date')
+    search_fields = ('cache_key',)
+
+@admin.register(ReportJob)
+class ReportJobAdmin(admin.ModelAdmin):
+    list_display = ('unique_id', 'review_file', 'state', 'stage', 'progress', 'cache_hit', 'created_date')
+    list_filter = ('state', 'stage')
+    search_fields = ('unique_id', 'review_file__file')
+
+@admin.register(FeedbackSummary)
+class FeedbackSummaryAdmin(admin.ModelAdmin):
+    list_display = ('review_file', 'review_count', 'mean_rating', 'interface_count', 'updated_date')
+    raw_id_fields = ('review_file',)
+
+@admin.register(CompareJob)
+class CompareJobAdmin(admin.ModelAdmin):
+    list_display = ('unique_id', 'file_ids', 'state', 'progress', 'created_date')
+    list_filter = ('state',)
+    search_fields = ('unique_id',)
+    exclude = ('result',)
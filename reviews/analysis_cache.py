@@ -0,0 +1,251 @@
+import hashlib
+import io
+import json
+import tempfile
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .lru import over_budget
+from .models import AnalysisCacheEntry, ClassificationJob, FileOutput, ReviewResult, ReviewResultSet
+
+# Rows per INSERT when storing per-review results
+REVIEW_RESULTS_BATCH_SIZE = 5000
+# About what a ReviewResult row and its index entries take up in SQLite
+REVIEW_RESULT_ROW_BYTES = 150
+
+
+def make_params_key(params):
+    return hashlib.md5(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+
+def lookup(content_hash, params_key):
+    if not content_hash:
+        return None
+    entry = AnalysisCacheEntry.objects.filter(content_hash=content_hash, params_key=params_key).first()
+    if entry is not None:
+        AnalysisCacheEntry.objects.filter(id=entry.id).update(
+            hit_count=F('hit_count') + 1,
+            last_used_date=timezone.now(),
+        )
+    return entry
+
+
+def stored_size(content_hash, params_key, result):
+    # What an analysis takes up: its result, its sidecars and its per-review
+    # rows, all of which go once the entry is evicted and no output uses them
+    size = len(json.dumps(result))
+    for name in (state_name, point_index_name, texts_name):
+        if default_storage.exists(name(content_hash, params_key)):
+            size += default_storage.size(name(content_hash, params_key))
+    row_count = ReviewResultSet.objects.filter(content_hash=content_hash, params_key=params_key).values_list(
+        'row_count', flat=True).first()
+    return size + (row_count or 0) * REVIEW_RESULT_ROW_BYTES
+
+
+def store(content_hash, params_key, result, evict_entries=True):
+    entry, _ = AnalysisCacheEntry.objects.update_or_create(
+        content_hash=content_hash,
+        params_key=params_key,
+        defaults={
+            'result': result,
+            'size_bytes': stored_size(content_hash, params_key, result),
+            'last_used_date': timezone.now(),
+        },
+    )
+    if evict_entries:
+        evict(keep=entry)
+    return entry
+
+
+def evict(keep=None):
+    # Least recently used entries go first once the cache outgrows its budget
+    stale = over_budget(AnalysisCacheEntry.objects.all(), settings.ANALYSIS_CACHE_MAX_BYTES, keep)
+    if stale:
+        AnalysisCacheEntry.objects.filter(id__in=stale).delete()
+    return len(stale)
+
+
+def state_name(content_hash, params_key):
+    return f'analysis/{content_hash}-{params_key}.npz'
+
+
+def point_index_name(content_hash, params_key):
+    return f'analysis/{content_hash}-{params_key}-points.npz'
+
+
+def texts_name(content_hash, params_key):
+    return f'analysis/{content_hash}-{params_key}-texts.bin'
+
+
+def _save_sidecar(name, sidecar):
+    # Named after the content and parameters, so an existing file already
+    # holds the same data
+    if not default_storage.exists(name):
+        buffer = io.BytesIO()
+        sidecar.save(buffer)
+        default_storage.save(name, ContentFile(buffer.getvalue()))
+    return name
+
+
+def save_state(content_hash, params_key, state):
+    return _save_sidecar(state_name(content_hash, params_key), state)
+
+
+def save_point_index(content_hash, params_key, point_index):
+    return _save_sidecar(point_index_name(content_hash, params_key), point_index)
+
+
+@lru_cache(maxsize=8)
+def load_point_index(name):
+    # Sidecars never change once written, so loaded indexes are kept for the
+    # viewport requests that follow
+    from .point_index import PointIndex
+    with default_storage.open(name, 'rb') as points_file:
+        return PointIndex.load(points_file)
+
+
+def load_previous_state(review_file, params_key):
+    # State of the file this one revises, when it was analyzed with the same parameters
+    from .data_analyzer import AnalysisState
+    if review_file.revision_of_id is None:
+        return None
+    file_output = FileOutput.objects.filter(
+        review_file_id=review_file.revision_of_id, params_key=params_key,
+    ).exclude(state_file='').first()
+    if file_output is None or not default_storage.exists(file_output.state_file.name):
+        return None
+    with default_storage.open(file_output.state_file.name, 'rb') as state_file:
+        return AnalysisState.load(state_file)
+
+
+def save_texts(content_hash, params_key, texts):
+    # The review texts back to back in UTF-8. A ReviewResult points at its
+    # text by offset and length instead of holding a copy in the database.
+    # Returns the offset and length of every text.
+    import numpy as np
+    name = texts_name(content_hash, params_key)
+    exists = default_storage.exists(name)
+    lengths = np.empty(len(texts), dtype=np.int64)
+    with tempfile.TemporaryFile() as texts_file:
+        for row_index, text in enumerate(texts):
+            data = text.encode()
+            lengths[row_index] = len(data)
+            if not exists:
+                texts_file.write(data)
+        if not exists:
+            texts_file.seek(0)
+            default_storage.save(name, File(texts_file))
+    offsets = np.cumsum(lengths) - lengths
+    return offsets, lengths
+
+
+def read_texts(result_set, results):
+    # Texts of the given ReviewResults of result_set, in the same order
+    with default_storage.open(texts_name(result_set.content_hash, result_set.params_key), 'rb') as texts_file:
+        texts = []
+        for result in results:
+            texts_file.seek(result.text_offset)
+            texts.append(texts_file.read(result.text_length).decode())
+    return texts
+
+
+def _delete_results(results):
+    # In batches, so that deleting a large set never holds the write lock for long
+    while True:
+        ids = list(results.values_list('id', flat=True)[:REVIEW_RESULTS_BATCH_SIZE])
+        if not ids:
+            return
+        ReviewResult.objects.filter(id__in=ids).delete()
+
+
+def store_review_results(content_hash, params_key, state):
+    # Identical content analyzed with the same parameters already has its rows
+    from .data_analyzer import SENTIMENT_LABELS
+    result_set, _ = ReviewResultSet.objects.get_or_create(content_hash=content_hash, params_key=params_key)
+    if result_set.complete:
+        return result_set
+
+    offsets, lengths = save_texts(content_hash, params_key, state.texts)
+    # Rows left over from an attempt that did not finish
+    _delete_results(result_set.results.all())
+    # Every batch commits on its own, so other writers wait for one INSERT at
+    # most rather than for the whole file. The set is not used until
+    # complete is set. A job storing the same set at the same time inserts
+    # the same rows, which are skipped.
+    rows = zip(offsets.tolist(), lengths.tolist(), state.sentiments.tolist(), state.clusters.tolist(),
+               state.coordinates[:, 0].tolist(), state.coordinates[:, 1].tolist())
+    batch = []
+    for row_index, (offset, length, sentiment, cluster, x, y) in enumerate(rows):
+        batch.append(ReviewResult(result_set=result_set, row_index=row_index, text_offset=offset, text_length=length,
+                                  sentiment=SENTIMENT_LABELS[sentiment], cluster=cluster, x=x, y=y))
+        if len(batch) >= REVIEW_RESULTS_BATCH_SIZE:
+            ReviewResult.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    ReviewResult.objects.bulk_create(batch, ignore_conflicts=True)
+    result_set.row_count = len(state.sentiments)
+    if result_set.results.count() == result_set.row_count:
+        result_set.complete = True
+    result_set.save(update_fields=['row_count', 'complete'])
+    return result_set
+
+
+def release(content_hash, params_key):
+    # The sidecars and per-review results of an analysis are kept while the
+    # cache holds the analysis or a FileOutput uses it, and deleted after that
+    if AnalysisCacheEntry.objects.filter(content_hash=content_hash, params_key=params_key).exists():
+        return False
+    if FileOutput.objects.filter(review_file__content_hash=content_hash, params_key=params_key).exists():
+        return False
+    for result_set in ReviewResultSet.objects.filter(content_hash=content_hash, params_key=params_key):
+        _delete_results(result_set.results.all())
+        result_set.delete()
+    for name in (state_name, point_index_name, texts_name):
+        default_storage.delete(name(content_hash, params_key))
+    return True
+
+
+def get_or_create_file_output(review_file, params_key, result, profile=None):
+    # A file classified again with the same parameters reuses its FileOutput;
+    # a new profile replaces the one it had. The output keeps its own copy of
+    # the result, so the job stays readable once the cache evicts the analysis.
+    file_output = FileOutput.objects.filter(review_file=review_file, params_key=params_key).first()
+    if file_output is not None and profile is not None:
+        file_output.profile = profile
+        file_output.save(update_fields=['profile'])
+    if file_output is None:
+        state_file = state_name(review_file.content_hash, params_key)
+        points_file = point_index_name(review_file.content_hash, params_key)
+        file_output = FileOutput.objects.create(
+            review_file=review_file,
+            review_text=result['review_text'],
+            sentiment_summary=result['sentiment_summary'],
+            params_key=params_key,
+            state_file=state_file if default_storage.exists(state_file) else '',
+            points_file=points_file if default_storage.exists(points_file) else '',
+            result_set=ReviewResultSet.objects.filter(
+                content_hash=review_file.content_hash, params_key=params_key, complete=True,
+            ).first(),
+            profile=profile,
+            result=result,
+        )
+    return file_output
+
+
+def complete_from_cache(review_file, entry):
+    with transaction.atomic():
+        file_output = get_or_create_file_output(review_file, entry.params_key, entry.result)
+        return ClassificationJob.objects.create(
+            review_file=review_file,
+            state=ClassificationJob.COMPLETED,
+            progress=100,
+            analysis=entry,
+            cache_hit=True,
+            file_output=file_output,
+        )
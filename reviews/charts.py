@@ -0,0 +1,65 @@
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+
+class ChartRenderer:
+    """Renders report charts to PNG bytes without pyplot's global state.
+
+    Every chart gets its own Figure and Agg canvas, so concurrent requests
+    can render safely. Rendered PNGs are kept in a small LRU cache keyed by
+    chart type, data, labels and colors.
+    """
+
+    def __init__(self, cache_size=64):
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def pie_chart(self, data, labels, colors=None):
+        return self.render('pie', data, labels, colors)
+
+    def bar_chart(self, data, labels, colors=None):
+        return self.render('bar', data, labels, colors)
+
+    def render(self, chart_type, data, labels, colors=None):
+        key = (chart_type, tuple(data), tuple(labels), tuple(colors or ()))
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        # Rendering happens outside the lock; two requests for the same new
+        # chart may both render it, which is cheaper than serializing renders
+        png = self._draw(chart_type, list(data), list(labels), list(colors) if colors else None)
+        with self._lock:
+            self._cache[key] = png
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return png
+
+    def _draw(self, chart_type, data, labels, colors):
+        fig = Figure()
+        FigureCanvasAgg(fig)
+        ax = fig.subplots()
+        if chart_type == 'pie':
+            ax.pie(data, labels=labels, colors=colors, autopct='%1.1f%%')
+            ax.set_title("Pie Chart - Sentiment Distribution")
+            ax.axis('equal')  # Equal aspect ratio ensures that pie is drawn as a circle.
+        elif chart_type == 'bar':
+            ax.bar(labels, data, color=colors)
+            ax.set_title("Bar Chart - Sentiment Counts")
+        else:
+            raise ValueError(f"Unknown chart type: {chart_type}")
+
+        buf = BytesIO()
+        fig.savefig(buf, format='png')
+        return buf.getvalue()
+
+
+# Shared by every report in the process
+chart_renderer = ChartRenderer()
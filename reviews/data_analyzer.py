@@ -1,18 +1,199 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
 import pandas as pd
+from openpyxl import load_workbook
 from textblob import TextBlob
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.cluster import KMeans
-from sklearn.decomposition import PCA
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.decomposition import PCA, TruncatedSVD
+from reviews.profiling import NULL_PROFILER
+from reviews.sentiment import BatchSentimentScorer
+
+SENTIMENT_ENGINES = ('batch', 'textblob')
+SENTIMENT_LABELS = ['positive', 'negative', 'neutral']
+# The only columns of an export the analysis uses
+REVIEW_COLUMNS = ['review_headline', 'review_body']
+# 'svd' projects the sparse TF-IDF matrix directly, 'pca' densifies it first
+REDUCTION_METHODS = ('svd', 'pca')
+# 'minibatch' fits centroids on a sample and assigns every row afterwards,
+# 'kmeans' fits a full KMeans on all rows. Files that fit in the sample are
+# clustered with the full KMeans either way.
+CLUSTER_METHODS = ('minibatch', 'kmeans')
+
+# One analyzer per pool process, so the batch scorer's lexicon is built once
+# per worker rather than once per chunk
+_worker_analyzers = {}
+
+
+def hash_texts(texts):
+    # Stable 64-bit hash per review text, used to recognise unchanged rows
+    return pd.util.hash_pandas_object(texts, index=False).to_numpy()
+
+
+def sentiment_codes(labels):
+    # Positions in SENTIMENT_LABELS, as stored in AnalysisState.sentiments
+    return pd.Categorical(labels, categories=SENTIMENT_LABELS).codes.astype(np.int8)
+
+
+def _score_sentiment_chunk(texts, sentiment_engine):
+    if sentiment_engine not in _worker_analyzers:
+        _worker_analyzers[sentiment_engine] = DataAnalyzer(sentiment_engine=sentiment_engine)
+    return _worker_analyzers[sentiment_engine].score_sentiment(texts)
+
+
+class AnalysisState:
+    """Per-row results and fitted models of one analysis of a file.
+
+    Rows are identified by the hash of their text. A revision of the file
+    only needs new rows scored, and can cluster and project them with the
+    stored vocabulary, centroids and components.
+    """
+
+    ARRAYS = ('row_hashes', 'sentiments', 'clusters', 'coordinates', 'fitted', 'terms', 'idf',
+              'centroids', 'components', 'projection_mean')
+
+    def __init__(self, **arrays):
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+        # Neither is saved: rows taken over from the previous revision rather
+        # than analyzed, and the text of every row
+        self.reused_rows = 0
+        self.texts = None
+
+    def save(self, file):
+        np.savez_compressed(file, **{name: getattr(self, name) for name in self.ARRAYS})
+
+    @classmethod
+    def load(cls, file):
+        with np.load(file, allow_pickle=False) as data:
+            return cls(**{name: data[name] for name in cls.ARRAYS})
+
+    def match_rows(self, row_hashes):
+        # Index of each hash among the stored rows, -1 for rows not seen before
+        if not len(self.row_hashes):
+            return np.full(len(row_hashes), -1)
+        order = np.argsort(self.row_hashes, kind='stable')
+        sorted_hashes = self.row_hashes[order]
+        positions = np.minimum(np.searchsorted(sorted_hashes, row_hashes), len(sorted_hashes) - 1)
+        return np.where(sorted_hashes[positions] == row_hashes, order[positions], -1)
+
+    def build_vectorizer(self):
+        vectorizer = TfidfVectorizer(vocabulary=list(self.terms), dtype=np.float32)
+        vectorizer.fit([''])
+        vectorizer.idf_ = self.idf
+        return vectorizer
+
 
 class DataAnalyzer:
 
-    def read_data(self, file_path):
+    def __init__(self, sentiment_engine='batch', sentiment_workers=1, sentiment_chunk_size=20000,
+                 parallel_threshold=50000, max_features=1000, num_clusters=5, num_components=2,
+                 read_chunk_size=50000, reduction_method='svd', cluster_method='minibatch',
+                 cluster_sample_size=20000, cluster_batch_size=4096, cluster_seed=0,
+                 incremental_max_change=0.2, max_cluster_points=5000):
+        # 'batch' scores the whole column with BatchSentimentScorer, 'textblob'
+        # builds a TextBlob per review
+        if sentiment_engine not in SENTIMENT_ENGINES:
+            raise ValueError(f"Unknown sentiment engine: {sentiment_engine}")
+        self.sentiment_engine = sentiment_engine
+        if reduction_method not in REDUCTION_METHODS:
+            raise ValueError(f"Unknown reduction method: {reduction_method}")
+        self.reduction_method = reduction_method
+        if cluster_method not in CLUSTER_METHODS:
+            raise ValueError(f"Unknown cluster method: {cluster_method}")
+        self.cluster_method = cluster_method
+        self.cluster_sample_size = cluster_sample_size
+        self.cluster_batch_size = cluster_batch_size
+        self.cluster_seed = cluster_seed
+        # Share of new rows above which a revision is re-clustered from scratch
+        self.incremental_max_change = incremental_max_change
+        # cluster_points in the result holds a uniform sample of at most this
+        # many rows; the full set is served through PointIndex
+        self.max_cluster_points = max_cluster_points
+        # Files with fewer rows than parallel_threshold are scored serially, as
+        # starting the process pool would cost more than it saves
+        self.sentiment_workers = sentiment_workers
+        self.sentiment_chunk_size = sentiment_chunk_size
+        self.parallel_threshold = parallel_threshold
+        self.max_features = max_features
+        self.num_clusters = num_clusters
+        self.num_components = num_components
+        # Rows per chunk when streaming a file through analyze()
+        self.read_chunk_size = read_chunk_size
+        self._batch_scorer = None
+
+    @property
+    def analysis_params(self):
+        # Everything that changes the output of analyze(); worker and chunk
+        # settings give identical results, so they are left out
+        return {
+            'sentiment_engine': self.sentiment_engine,
+            'max_features': self.max_features,
+            'num_clusters': self.num_clusters,
+            'num_components': self.num_components,
+            'reduction_method': self.reduction_method,
+            'cluster_method': self.cluster_method,
+            'cluster_sample_size': self.cluster_sample_size,
+            'cluster_batch_size': self.cluster_batch_size,
+            'cluster_seed': self.cluster_seed,
+            'max_cluster_points': self.max_cluster_points,
+        }
+
+    @property
+    def batch_scorer(self):
+        # Building the lexicon vectors takes a moment, so do it on first use
+        if self._batch_scorer is None:
+            self._batch_scorer = BatchSentimentScorer()
+        return self._batch_scorer
+
+    def iter_data(self, file_path, chunk_size=None):
+        # Yields DataFrames of at most chunk_size rows holding only REVIEW_COLUMNS
+        chunk_size = chunk_size or self.read_chunk_size
         if file_path.endswith('.xlsx'):
-            return pd.read_excel(file_path)
+            return self.iter_excel(file_path, chunk_size)
         elif file_path.endswith('.csv'):
-            return pd.read_csv(file_path)
+            return pd.read_csv(file_path, usecols=REVIEW_COLUMNS, chunksize=chunk_size)
         raise ValueError("Unsupported file format")
 
+    def iter_excel(self, file_path, chunk_size):
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            # The first sheet, as pd.read_excel reads; the active one is
+            # whichever was last open in Excel
+            rows = workbook.worksheets[0].iter_rows(values_only=True)
+            header = list(next(rows, None) or [])
+            missing = [column for column in REVIEW_COLUMNS if column not in header]
+            if missing:
+                raise ValueError(f"Missing columns: {', '.join(missing)}")
+            positions = [header.index(column) for column in REVIEW_COLUMNS]
+
+            batch = []
+            for row in rows:
+                # Read-only sheets can report trailing blank rows
+                if all(value is None for value in row):
+                    continue
+                batch.append([row[i] if i < len(row) else None for i in positions])
+                if len(batch) >= chunk_size:
+                    yield self._excel_frame(batch)
+                    batch = []
+            if batch:
+                yield self._excel_frame(batch)
+        finally:
+            workbook.close()
+
+    def _excel_frame(self, rows):
+        # Empty cells become NaN, as they do with pd.read_excel
+        df = pd.DataFrame(rows, columns=REVIEW_COLUMNS, dtype=object)
+        return df.where(df.notna(), np.nan)
+
+    def read_data(self, file_path):
+        chunks = list(self.iter_data(file_path))
+        if not chunks:
+            return pd.DataFrame(columns=REVIEW_COLUMNS)
+        return pd.concat(chunks, ignore_index=True)
+
     def analyze_sentiment(self, text):
         analysis = TextBlob(text)
         if analysis.sentiment.polarity > 0:
@@ -22,19 +203,42 @@ class DataAnalyzer:
         else:
             return 'neutral'
         
-    def perform_analysis(self, df):
+    def score_sentiment(self, texts):
+        if self.sentiment_engine == 'batch':
+            return self.batch_scorer.score(texts)
+        return texts.apply(self.analyze_sentiment)
+
+    def score_sentiment_parallel(self, texts, executor=None):
+        chunks = [texts.iloc[start:start + self.sentiment_chunk_size]
+                  for start in range(0, len(texts), self.sentiment_chunk_size)]
+        if executor is None:
+            with ProcessPoolExecutor(max_workers=self.sentiment_workers) as executor:
+                return self.score_sentiment_parallel(texts, executor)
+        # map() yields results in submission order, so labels line up with rows
+        labels = list(executor.map(_score_sentiment_chunk, chunks,
+                                   [self.sentiment_engine] * len(chunks)))
+        return pd.concat(labels)
+
+    def perform_analysis(self, df, executor=None):
+        # executor, when given, is a process pool kept open across the chunks of a file
         concat_text = df['review_headline'].astype(str) + ' ' + df['review_body'].astype(str)
-        df['review_sentiment'] = concat_text.apply(self.analyze_sentiment)
+        if executor is not None or (self.sentiment_workers > 1 and len(concat_text) >= self.parallel_threshold):
+            df['review_sentiment'] = self.score_sentiment_parallel(concat_text, executor)
+        else:
+            df['review_sentiment'] = self.score_sentiment(concat_text)
         return df
 
     def aggregate_data(self, df):
-        sentiment_counts = df['review_sentiment'].value_counts()
-        sentiment_percentages = sentiment_counts / len(df) * 100
-        description = self.generate_description(df, sentiment_counts, sentiment_percentages)
-        info = {'total_rows': len(df), **sentiment_counts.to_dict(), **sentiment_percentages.to_dict(), 'description': description}
+        return self.aggregate_counts(df['review_sentiment'].value_counts(), len(df))
+
+    def aggregate_counts(self, sentiment_counts, total_rows):
+        sentiment_counts = sentiment_counts.reindex(SENTIMENT_LABELS, fill_value=0).astype(int)
+        sentiment_percentages = sentiment_counts / total_rows * 100 if total_rows else sentiment_counts * 0.0
+        description = self.generate_description(total_rows, sentiment_counts, sentiment_percentages)
+        info = {'total_rows': total_rows, **sentiment_counts.to_dict(), **sentiment_percentages.to_dict(), 'description': description}
         return info, sentiment_counts, sentiment_percentages
 
-    def generate_description(self, df, counts, percentages):
+    def generate_description(self, total_rows, counts, percentages):
         # Prefixing percentage keys
         percentages_prefixed = {'percent_' + k: v for k, v in percentages.items()}
 
@@ -45,51 +249,276 @@ class DataAnalyzer:
             "{percent_positive:.2f}% positive, {percent_negative:.2f}% negative, "
             "and {percent_neutral:.2f}% neutral."
         )
-        return template.format(total=len(df), **counts, **percentages_prefixed)
+        return template.format(total=total_rows, **counts, **percentages_prefixed)
+
+    def fit_vectorizer(self, texts, max_features=1000):
+        # float32 halves the matrix size; KMeans and the projections accept it as is
+        vectorizer = TfidfVectorizer(max_features=max_features, dtype=np.float32)
+        tfidf_matrix = vectorizer.fit_transform(texts)
+        return vectorizer, tfidf_matrix
 
     def vectorize_text(self, df, max_features=1000):
-        vectorizer = TfidfVectorizer(max_features=max_features)
-        tfidf_matrix = vectorizer.fit_transform(df['concatenated_text'])
+        vectorizer, tfidf_matrix = self.fit_vectorizer(df['concatenated_text'], max_features)
         return tfidf_matrix, vectorizer.get_feature_names_out()
 
-    def cluster_reviews(self, tfidf_matrix, num_clusters=5):
-        km = KMeans(n_clusters=num_clusters)
+    def fit_centroids(self, tfidf_matrix, num_clusters=5):
+        # Mini-batch updates on a bounded random sample of the rows
+        rng = np.random.default_rng(self.cluster_seed)
+        num_rows = tfidf_matrix.shape[0]
+        sample = np.sort(rng.choice(num_rows, size=min(self.cluster_sample_size, num_rows), replace=False))
+        km = MiniBatchKMeans(n_clusters=num_clusters, batch_size=self.cluster_batch_size,
+                             random_state=self.cluster_seed, n_init=3)
+        km.fit(tfidf_matrix[sample])
+        return km.cluster_centers_
+
+    def assign_clusters(self, tfidf_matrix, centroids):
+        # Nearest centroid by squared distance; ||x||^2 is the same for every
+        # centroid, so only -2 x.c + ||c||^2 is compared. Rows are processed in
+        # batches so the dense (rows x clusters) block stays small.
+        centroid_norms = (centroids ** 2).sum(axis=1)
+        labels = np.empty(tfidf_matrix.shape[0], dtype=np.int32)
+        for start in range(0, tfidf_matrix.shape[0], self.cluster_batch_size):
+            block = tfidf_matrix[start:start + self.cluster_batch_size]
+            distances = centroid_norms - 2 * np.asarray(block @ centroids.T)
+            labels[start:start + self.cluster_batch_size] = distances.argmin(axis=1)
+        return labels
+
+    def fit_clusters(self, tfidf_matrix, num_clusters=5, method=None):
+        # Returns the label of every row and the centroids they were assigned to
+        method = method or self.cluster_method
+        if method == 'minibatch' and tfidf_matrix.shape[0] > self.cluster_sample_size:
+            centroids = self.fit_centroids(tfidf_matrix, num_clusters)
+            return self.assign_clusters(tfidf_matrix, centroids), centroids
+        km = KMeans(n_clusters=num_clusters, random_state=self.cluster_seed)
         km.fit(tfidf_matrix)
-        clusters = km.labels_
+        return km.labels_, km.cluster_centers_
+
+    def cluster_reviews(self, tfidf_matrix, num_clusters=5, method=None):
+        clusters, _ = self.fit_clusters(tfidf_matrix, num_clusters, method)
         return clusters
-    
-    def reduce_dimensions(self, tfidf_matrix, num_components=2):
+
+    def fit_projection(self, tfidf_matrix, num_components=2, method=None):
+        # Returns the projected rows, plus the components and mean that project
+        # further rows the same way (see project())
+        method = method or self.reduction_method
+        if method == 'svd':
+            # Randomized truncated SVD works on the CSR matrix without densifying it
+            svd = TruncatedSVD(n_components=num_components, algorithm='randomized', random_state=0)
+            reduced_matrix = svd.fit_transform(tfidf_matrix)
+            return reduced_matrix, svd.components_, np.zeros(tfidf_matrix.shape[1], dtype=svd.components_.dtype)
         pca = PCA(n_components=num_components)
         reduced_matrix = pca.fit_transform(tfidf_matrix.toarray())
+        return reduced_matrix, pca.components_, pca.mean_
+
+    def reduce_dimensions(self, tfidf_matrix, num_components=2, method=None):
+        reduced_matrix, _, _ = self.fit_projection(tfidf_matrix, num_components, method)
         return reduced_matrix
 
-    def analyze(self, file_path):
-        df = self.read_data(file_path)
-        
-        # Performing sentiment analysis
-        analyzed_df = self.perform_analysis(df)
-        info, sentiment_counts, sentiment_percentages = self.aggregate_data(analyzed_df)
-        
+    def project(self, tfidf_matrix, components, mean):
+        # (X - mean) C^T, without densifying X
+        return np.asarray(tfidf_matrix @ components.T) - mean @ components.T
+
+    def read_reviews(self, file_path):
+        # Text and sentiment code of every review in the file
+        texts = []
+        sentiments = []
+        for chunk in self.iter_data(file_path):
+            chunk_texts = chunk['review_headline'].astype(str) + ' ' + chunk['review_body'].astype(str)
+            texts.append(chunk_texts)
+            sentiments.append(sentiment_codes(self.score_sentiment(chunk_texts)))
+        if not texts:
+            raise ValueError(f"{os.path.basename(file_path)} contains no reviews")
+        return pd.concat(texts, ignore_index=True), np.concatenate(sentiments)
+
+    def compare(self, file_paths, max_workers=None):
+        # Analyzes several files in one space: the vectorizer, clusters and
+        # projection are fitted once over the reviews of all of them, so a
+        # cluster and the scatter coordinates mean the same in every file.
+        # The files are read and scored on threads.
+        if self.sentiment_engine == 'batch':
+            # Built before the threads share it
+            self.batch_scorer
+        with ThreadPoolExecutor(max_workers=max_workers or len(file_paths)) as executor:
+            files = list(executor.map(self.read_reviews, file_paths))
+
+        analyzed_df = pd.DataFrame({'concatenated_text': pd.concat([texts for texts, _ in files], ignore_index=True)})
+        vectorizer, tfidf_matrix = self.fit_vectorizer(analyzed_df['concatenated_text'], self.max_features)
+        cluster_labels, centroids = self.fit_clusters(tfidf_matrix, self.num_clusters)
+        reduced_matrix, _, _ = self.fit_projection(tfidf_matrix, self.num_components)
+        del tfidf_matrix
+        analyzed_df['cluster'] = cluster_labels
+        analyzed_df['x_coordinate'] = reduced_matrix[:, 0]
+        analyzed_df['y_coordinate'] = reduced_matrix[:, 1]
+
+        # Terms with the highest weight in each centroid describe the clusters
+        terms = vectorizer.get_feature_names_out()
+        clusters = [{'cluster': cluster, 'top_terms': terms[np.argsort(centroid)[::-1][:10]].tolist()}
+                    for cluster, centroid in enumerate(np.asarray(centroids))]
+
+        results = []
+        start = 0
+        max_points = self.max_cluster_points // len(files) if self.max_cluster_points else None
+        for _, sentiments in files:
+            end = start + len(sentiments)
+            file_df = analyzed_df.iloc[start:end]
+            counts = np.bincount(file_df['cluster'], minlength=len(clusters))
+            result = self.build_result(file_df, sentiments, max_points)
+            result['cluster_distribution'] = {
+                'data': counts.tolist(),
+                'percentages': (counts / len(sentiments) * 100).tolist(),
+            }
+            results.append(result)
+            start = end
+        return {'clusters': clusters, 'files': results}
+
+    def analyze(self, file_path, progress_callback=None, profiler=None):
+        result, _ = self.analyze_with_state(file_path, progress_callback, profiler=profiler)
+        return result
+
+    def analyze_with_state(self, file_path, progress_callback=None, previous_state=None, profiler=None):
+        # Returns the result and the AnalysisState to keep for later revisions.
+        # With previous_state (from an earlier revision of the file, analyzed
+        # with the same parameters) only rows whose text is new get scored. As
+        # long as new rows are at most incremental_max_change of the file, they
+        # are also clustered and projected with the stored models and the other
+        # rows keep their stored cluster and coordinates. Rows placed that way
+        # add up over revisions, and once they pass incremental_max_change of
+        # the file the models are fitted again on every row.
+        # progress_callback, when given, is called with a completion percentage.
+        # profiler (see reviews.profiling) times every stage of the analysis.
+        report_progress = progress_callback or (lambda percent: None)
+        profiler = profiler or NULL_PROFILER
+
+        # Streaming the file: sentiment is scored chunk by chunk, and only the
+        # concatenated text is kept for clustering
+        texts = []
+        row_hashes = []
+        sentiments = []
+        matches = []
+        executor = None
+        rows_scored = 0
+        try:
+            for chunk in profiler.iterate('read_data', self.iter_data(file_path)):
+                with profiler.stage('hash_rows'):
+                    chunk_texts = chunk['review_headline'].astype(str) + ' ' + chunk['review_body'].astype(str)
+                    chunk_hashes = hash_texts(chunk_texts)
+                    codes = np.full(len(chunk), -1, dtype=np.int8)
+                    if previous_state is not None:
+                        match = previous_state.match_rows(chunk_hashes)
+                        codes[match >= 0] = previous_state.sentiments[match[match >= 0]]
+                        matches.append(match)
+                        chunk = chunk[codes < 0].copy()
+
+                rows_scored += len(chunk)
+                if executor is None and self.sentiment_workers > 1 and rows_scored >= self.parallel_threshold:
+                    executor = ProcessPoolExecutor(max_workers=self.sentiment_workers)
+
+                # Performing sentiment analysis
+                if len(chunk):
+                    with profiler.stage('perform_analysis'):
+                        chunk = self.perform_analysis(chunk, executor)
+                        codes[codes < 0] = sentiment_codes(chunk['review_sentiment'])
+                texts.append(chunk_texts)
+                row_hashes.append(chunk_hashes)
+                sentiments.append(codes)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        if not texts:
+            raise ValueError("The file contains no reviews")
+        report_progress(50)
+
+        sentiments = np.concatenate(sentiments)
+        rows_read = len(sentiments)
+
         # Preparing text for clustering
-        analyzed_df['concatenated_text'] = analyzed_df['review_headline'].astype(str) + ' ' + analyzed_df['review_body'].astype(str)
-        
-        # Vectorizing and clustering
-        tfidf_matrix, feature_names = self.vectorize_text(analyzed_df)
-        cluster_labels = self.cluster_reviews(tfidf_matrix)
+        analyzed_df = pd.DataFrame({'concatenated_text': pd.concat(texts, ignore_index=True)})
+        del texts
+
+        matches = np.concatenate(matches) if previous_state is not None else np.full(rows_read, -1)
+        new_rows = matches < 0
+        # Rows the models were not fitted on: new ones, and ones an earlier
+        # revision placed with the stored models
+        unfitted_rows = new_rows.copy()
+        if previous_state is not None:
+            unfitted_rows[~new_rows] = ~previous_state.fitted[matches[~new_rows]]
+        if previous_state is not None and unfitted_rows.mean() <= self.incremental_max_change:
+            # Only the new rows are vectorized, with the stored vocabulary
+            vectorizer = previous_state.build_vectorizer()
+            centroids = previous_state.centroids
+            components, projection_mean = previous_state.components, previous_state.projection_mean
+            cluster_labels = np.empty(rows_read, dtype=np.int32)
+            reduced_matrix = np.empty((rows_read, self.num_components), dtype=np.float32)
+            cluster_labels[~new_rows] = previous_state.clusters[matches[~new_rows]]
+            reduced_matrix[~new_rows] = previous_state.coordinates[matches[~new_rows]]
+            report_progress(60)
+            if new_rows.any():
+                with profiler.stage('vectorize_text'):
+                    tfidf_matrix = vectorizer.transform(analyzed_df['concatenated_text'][new_rows])
+                with profiler.stage('cluster_reviews'):
+                    cluster_labels[new_rows] = self.assign_clusters(tfidf_matrix, centroids)
+                report_progress(75)
+                with profiler.stage('reduce_dimensions'):
+                    reduced_matrix[new_rows] = self.project(tfidf_matrix, components, projection_mean)
+        else:
+            unfitted_rows[:] = False
+            # Vectorizing and clustering
+            with profiler.stage('vectorize_text'):
+                vectorizer, tfidf_matrix = self.fit_vectorizer(analyzed_df['concatenated_text'], self.max_features)
+            report_progress(60)
+            with profiler.stage('cluster_reviews'):
+                cluster_labels, centroids = self.fit_clusters(tfidf_matrix, self.num_clusters)
+            report_progress(75)
+
+            # Reducing dimensions for visualization
+            with profiler.stage('reduce_dimensions'):
+                reduced_matrix, components, projection_mean = self.fit_projection(tfidf_matrix, self.num_components)
+            del tfidf_matrix
         analyzed_df['cluster'] = cluster_labels
-        
-        # Reducing dimensions for visualization
-        reduced_matrix = self.reduce_dimensions(tfidf_matrix)
         analyzed_df['x_coordinate'] = reduced_matrix[:, 0]
         analyzed_df['y_coordinate'] = reduced_matrix[:, 1]
+        report_progress(90)
+
+        state = AnalysisState(
+            row_hashes=np.concatenate(row_hashes),
+            sentiments=sentiments,
+            clusters=np.asarray(cluster_labels, dtype=np.int32),
+            coordinates=np.asarray(reduced_matrix, dtype=np.float32),
+            fitted=~unfitted_rows,
+            terms=vectorizer.get_feature_names_out().astype(str),
+            idf=vectorizer.idf_.astype(np.float32),
+            centroids=np.asarray(centroids, dtype=np.float32),
+            components=np.asarray(components, dtype=np.float32),
+            projection_mean=np.asarray(projection_mean, dtype=np.float32),
+        )
+        state.reused_rows = int((~new_rows).sum())
+        state.texts = analyzed_df['concatenated_text']
         
+        result = self.build_result(analyzed_df, sentiments, self.max_cluster_points, profiler)
+        return result, state
+
+    def build_result(self, analyzed_df, sentiments, max_points=None, profiler=None):
+        # The result of one file from its rows (text, cluster and coordinates)
+        # and their sentiment codes: the sentiment summary, sample texts per
+        # cluster and at most max_points of the projected points
+        profiler = profiler or NULL_PROFILER
+        rows = len(sentiments)
+        sentiment_counts = pd.Series(np.bincount(sentiments, minlength=len(SENTIMENT_LABELS)), index=SENTIMENT_LABELS)
+        info, sentiment_counts, sentiment_percentages = self.aggregate_counts(sentiment_counts, rows)
+
         # Grouping reviews by cluster and getting sample texts
-        cluster_samples = analyzed_df.groupby('cluster')['concatenated_text'].apply(lambda texts: texts.tolist()[:10]).to_dict()
+        with profiler.stage('cluster_samples'):
+            cluster_samples = analyzed_df.groupby('cluster')['concatenated_text'].apply(lambda texts: texts.tolist()[:10]).to_dict()
 
         # Mapping clusters to their respective points
-        cluster_points = analyzed_df.groupby('cluster').apply(
-            lambda df: [{'x': x, 'y': y} for x, y in zip(df['x_coordinate'], df['y_coordinate'])]
-        ).to_dict()
+        points_df = analyzed_df
+        if max_points and rows > max_points:
+            rng = np.random.default_rng(self.cluster_seed)
+            points_df = analyzed_df.iloc[np.sort(rng.choice(rows, max_points, replace=False))]
+        with profiler.stage('cluster_points'):
+            cluster_points = points_df.groupby('cluster').apply(
+                lambda df: [{'x': float(x), 'y': float(y)} for x, y in zip(df['x_coordinate'], df['y_coordinate'])]
+            ).to_dict()
 
         # Summarizing sentiment analysis
         sentiment_summary = {
@@ -105,11 +534,9 @@ class DataAnalyzer:
         }
 
         # Constructing the final result
-        result = {
+        return {
             'review_text': info['description'],
             'sentiment_summary': sentiment_summary,
             'cluster_samples': cluster_samples,
             'cluster_points': cluster_points
         }
-
-        return result
\ No newline at end of file
@@ -0,0 +1,88 @@
+import os
+import re
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+
+CONTENT_TYPES = {
+    '.pdf': 'application/pdf',
+    '.docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+}
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def parse_range(header, size):
+    # (start, end) of a single byte range, end inclusive. None when there is no
+    # usable range, in which case the whole file is sent; multiple ranges are
+    # answered with the whole file as well. Raises ValueError when the range
+    # lies outside the file.
+    match = RANGE_RE.match(header.strip()) if header else None
+    if match is None or match.group(1) == match.group(2) == '':
+        return None
+    first, last = match.groups()
+    if first == '':
+        # Suffix range: the last `last` bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError('Empty suffix range')
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size:
+        raise ValueError('Range starts past the end of the file')
+    if end < start:
+        return None
+    return start, end
+
+
+def _read_range(file, start, length, chunk_size):
+    try:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
+
+
+def file_response(request, name, filename=None):
+    # Streams a stored file in chunks of REPORT_DOWNLOAD_CHUNK_SIZE bytes, so a
+    # download never holds more than one chunk in memory, and answers Range
+    # requests with 206 Partial Content so interrupted downloads can resume
+    filename = filename or os.path.basename(name)
+    content_type = CONTENT_TYPES.get(os.path.splitext(filename)[1].lower(), 'application/octet-stream')
+    size = default_storage.size(name)
+    # Report names can be reused once the cache has deleted a file
+    modified = int(default_storage.get_modified_time(name).timestamp())
+    etag = f'"{os.path.basename(name)}-{size}-{modified}"'
+    chunk_size = settings.REPORT_DOWNLOAD_CHUNK_SIZE
+
+    byte_range = None
+    if_range = request.headers.get('If-Range')
+    if if_range is None or if_range == etag:
+        try:
+            byte_range = parse_range(request.headers.get('Range'), size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    if byte_range is None:
+        response = FileResponse(default_storage.open(name, 'rb'), as_attachment=True, filename=filename,
+                                content_type=content_type)
+        response.block_size = chunk_size
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(_read_range(default_storage.open(name, 'rb'), start, end - start + 1, chunk_size),
+                                         status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    return response
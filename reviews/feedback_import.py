@@ -0,0 +1,99 @@
+import json
+import uuid
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from rest_framework import serializers
+
+from . import feedback_summary, report_cache
+from .models import ReviewFile
+
+FILE_NOT_UPLOADED = 'File is not uploaded. Please upload the file first.'
+
+
+def iter_ndjson(stream):
+    # One feedback object per line; a line that is not valid JSON comes out as
+    # the ValueError, so it is reported at its index like any other bad item
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield e
+
+
+def import_feedback(items, model, serializer_class, batch_size=None):
+    # Inserts the valid items and reports the rest by their position in items.
+    # Every batch of batch_size items resolves its files in one query and is
+    # written with bulk_create in its own transaction, so a long import holds
+    # one batch in memory and never keeps the database locked for long.
+    batch_size = batch_size or settings.FEEDBACK_BULK_BATCH_SIZE
+    file_ids = {}
+    review_file_ids = set()
+    result = {'created': 0, 'errors': []}
+    validator = serializer_class()
+
+    items = enumerate(items)
+    while True:
+        batch = list(islice(items, batch_size))
+        if not batch:
+            break
+        _resolve_files(batch, file_ids)
+        rows = []
+        for index, item in batch:
+            errors, row = _build_row(item, model, validator, file_ids)
+            if errors:
+                result['errors'].append({'index': index, 'errors': errors})
+            else:
+                rows.append(row)
+        with transaction.atomic():
+            model.objects.bulk_create(rows)
+            feedback_summary.record(model, rows)
+        result['created'] += len(rows)
+        review_file_ids.update(row.review_file_id for row in rows)
+
+    # bulk_create sends no post_save signals, so the summaries are updated
+    # above and the reports of the files that got feedback invalidated here
+    for review_file_id in review_file_ids:
+        report_cache.invalidate(review_file_id)
+    result['failed'] = len(result['errors'])
+    return result
+
+
+def _resolve_files(batch, file_ids):
+    # Maps every review_file value not seen in an earlier batch to the file's
+    # id, or to None when no file has that unique_id
+    pending = {}
+    for _, item in batch:
+        if not isinstance(item, dict):
+            continue
+        key = str(item.get('review_file'))
+        if key in file_ids or key in pending:
+            continue
+        try:
+            pending[key] = uuid.UUID(key)
+        except ValueError:
+            file_ids[key] = None
+    if not pending:
+        return
+    found = dict(ReviewFile.objects.filter(unique_id__in=set(pending.values())).values_list('unique_id', 'id'))
+    for key, unique_id in pending.items():
+        file_ids[key] = found.get(unique_id)
+
+
+def _build_row(item, model, validator, file_ids):
+    if isinstance(item, ValueError):
+        return {'non_field_errors': [f'Invalid JSON: {item}']}, None
+    if not isinstance(item, dict):
+        return {'non_field_errors': ['Each feedback item must be a JSON object.']}, None
+    review_file_id = file_ids.get(str(item.get('review_file')))
+    if review_file_id is None:
+        return {'review_file': [FILE_NOT_UPLOADED]}, None
+    try:
+        validated_data = validator.run_validation(item)
+    except serializers.ValidationError as e:
+        return e.detail, None
+    return None, model(review_file_id=review_file_id, **validated_data)
@@ -0,0 +1,60 @@
+from collections import Counter, defaultdict
+
+from django.db.models import Count, DateTimeField, F, Max, Q, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import FeedbackSummary, ReviewFeedback, UserInterfaceFeedback
+
+
+def aggregate_fields(review_feedbacks, ui_feedbacks):
+    # Summary fields of the given feedback querysets, one aggregate query each
+    fields = review_feedbacks.aggregate(
+        review_count=Count('id'),
+        rating_sum=Coalesce(Sum('star_rating'), 0),
+        review_latest=Max('created_date'),
+        **{f'rating_{rating}': Count('id', filter=Q(star_rating=rating)) for rating in FeedbackSummary.RATINGS},
+    )
+    fields.update(ui_feedbacks.aggregate(interface_count=Count('id'), interface_latest=Max('created_date')))
+    return fields
+
+
+def rebuild(review_file_id):
+    # Recomputes a summary from the feedback rows; used for files without a
+    # summary and after feedback is edited or deleted
+    summary, _ = FeedbackSummary.objects.update_or_create(
+        review_file_id=review_file_id,
+        defaults=aggregate_fields(ReviewFeedback.objects.filter(review_file_id=review_file_id),
+                                  UserInterfaceFeedback.objects.filter(review_file_id=review_file_id)),
+    )
+    return summary
+
+
+def get_summary(review_file_id):
+    summary = FeedbackSummary.objects.filter(review_file_id=review_file_id).first()
+    return summary if summary is not None else rebuild(review_file_id)
+
+
+def record(model, feedbacks):
+    # Adds newly inserted feedback to the summaries of their files with one
+    # UPDATE per file, so concurrent inserts add up instead of overwriting
+    # each other
+    by_file = defaultdict(list)
+    for feedback in feedbacks:
+        if feedback.review_file_id is not None:
+            by_file[feedback.review_file_id].append(feedback)
+
+    prefix = 'review' if model is ReviewFeedback else 'interface'
+    for review_file_id, rows in by_file.items():
+        latest = Value(max(row.created_date for row in rows), output_field=DateTimeField())
+        updates = {
+            f'{prefix}_count': F(f'{prefix}_count') + len(rows),
+            f'{prefix}_latest': Greatest(Coalesce(f'{prefix}_latest', latest), latest),
+        }
+        if model is ReviewFeedback:
+            ratings = Counter(row.star_rating for row in rows)
+            updates['rating_sum'] = F('rating_sum') + sum(rating * count for rating, count in ratings.items())
+            for rating, count in ratings.items():
+                updates[f'rating_{rating}'] = F(f'rating_{rating}') + count
+        if not FeedbackSummary.objects.filter(review_file_id=review_file_id).update(**updates):
+            # No summary yet; the rows just inserted are part of the rebuild
+            rebuild(review_file_id)
@@ -0,0 +1,484 @@
+import hashlib
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+STALE_JOB_ERROR = 'The job stopped before it finished. Please try again.'
+# Progress of a report job once its charts are rendered; the writers share the rest
+REPORT_CHARTS_PROGRESS = 10
+
+
+def _init_worker():
+    # Spawned workers start with a fresh interpreter, so Django has to be set up
+    # before any model is touched. Forked workers must not reuse the parent's
+    # database connections either.
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'user_review.settings')
+    import django
+    django.setup()
+    from django.db import connections
+    connections.close_all()
+    if settings.WORKER_WARM_UP:
+        warm_up()
+
+
+def warm_up():
+    # The analysis and reporting libraries are imported where they are used,
+    # so the web processes start quickly. A process that will run jobs can
+    # import them, and load the sentiment lexicon, ahead of its first job.
+    import pandas as pd
+    from . import ReportGenerator  # noqa: F401
+    build_analyzer().score_sentiment(pd.Series(['warm up']))
+
+
+def create_executor(max_workers):
+    context = multiprocessing.get_context(settings.CLASSIFICATION_POOL_START_METHOD)
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=context, initializer=_init_worker)
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None and _executor._broken:
+            # A worker died (killed for running out of memory, say) and the
+            # pool refuses any further work; its jobs were failed by _on_job_done
+            logger.warning("Job pool is broken (%s), starting a new one", _executor._broken)
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+        if _executor is None:
+            fail_stale_jobs()
+            _executor = create_executor(settings.CLASSIFICATION_WORKERS)
+        return _executor
+
+
+def shutdown_executor(wait=True):
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=wait)
+            _executor = None
+
+
+def submit_job(job, run, then=None):
+    # run is called on a worker with the job's id. then, when given, is
+    # called here with what run returned, to queue the job's next tasks.
+    job_model, job_id = type(job), job.id
+    # Only hand the job to a worker once the row is visible to other connections
+    transaction.on_commit(lambda: _submit(job_model, job_id, run, (job_id,), then))
+
+
+def _submit(job_model, job_id, run, args, then=None):
+    try:
+        future = get_executor().submit(run, *args)
+    except Exception as e:
+        logger.exception("Could not submit %s %s", job_model.__name__, job_id)
+        _mark_failed(job_model, job_id, e)
+        return
+    future.add_done_callback(lambda f: _on_job_done(job_model, job_id, f, then))
+
+
+def submit_classification_job(job):
+    submit_job(job, run_classification_job)
+
+
+def _on_job_done(job_model, job_id, future, then=None):
+    # A worker that dies (or raises outside the job's own error handling)
+    # would otherwise leave the job stuck in the running state.
+    exc = future.exception()
+    if exc is None and then is not None:
+        try:
+            then(future.result())
+        except Exception as e:
+            exc = e
+    if exc is None:
+        return
+    logger.error("%s %s crashed: %s", job_model.__name__, job_id, exc)
+    _mark_failed(job_model, job_id, exc)
+
+
+def _mark_failed(job_model, job_id, exc):
+    job_model.objects.filter(id=job_id).exclude(
+        state=job_model.COMPLETED
+    ).update(state=job_model.FAILED, error=str(exc) or exc.__class__.__name__, updated_date=timezone.now())
+
+
+def _complete_running(job_model, job_id, **fields):
+    # The final writes of a job are made only while it is still running: a
+    # job failed meanwhile, as stale or by a crashed task, stays failed.
+    # Returns whether the job was updated.
+    return bool(job_model.objects.filter(id=job_id, state=job_model.RUNNING).update(
+        state=job_model.COMPLETED, updated_date=timezone.now(), **fields))
+
+
+def _fail_running(job_model, job_id, exc):
+    return bool(job_model.objects.filter(id=job_id, state=job_model.RUNNING).update(
+        state=job_model.FAILED, error=str(exc), updated_date=timezone.now()))
+
+
+def stale_cutoff():
+    return timezone.now() - timedelta(seconds=settings.JOB_STALE_SECONDS)
+
+
+def fail_stale_job(job):
+    # Jobs live in the pool of the process that submitted them. When that
+    # process goes away (a restart or a deploy) they are never run, so a job
+    # that has not moved for JOB_STALE_SECONDS is reported as failed.
+    if job.is_finished or job.updated_date >= stale_cutoff():
+        return False
+    job.state, job.error = job.FAILED, STALE_JOB_ERROR
+    job.save(update_fields=['state', 'error', 'updated_date'])
+    return True
+
+
+def fail_stale_jobs():
+    # The same for every job, when a process starts its pool
+    from .models import ClassificationJob, CompareJob, ReportJob
+    for job_model in (ClassificationJob, ReportJob, CompareJob):
+        job_model.objects.filter(state__in=[job_model.PENDING, job_model.RUNNING], updated_date__lt=stale_cutoff()).update(
+            state=job_model.FAILED, error=STALE_JOB_ERROR, updated_date=timezone.now())
+
+
+def build_analyzer():
+    from .data_analyzer import DataAnalyzer
+    return DataAnalyzer(
+        sentiment_engine=settings.SENTIMENT_ENGINE,
+        sentiment_workers=settings.SENTIMENT_WORKERS,
+        sentiment_chunk_size=settings.SENTIMENT_CHUNK_SIZE,
+        parallel_threshold=settings.SENTIMENT_PARALLEL_THRESHOLD,
+        read_chunk_size=settings.ANALYSIS_READ_CHUNK_SIZE,
+        reduction_method=settings.ANALYSIS_REDUCTION_METHOD,
+        cluster_method=settings.ANALYSIS_CLUSTER_METHOD,
+        cluster_sample_size=settings.ANALYSIS_CLUSTER_SAMPLE_SIZE,
+        cluster_batch_size=settings.ANALYSIS_CLUSTER_BATCH_SIZE,
+        cluster_seed=settings.ANALYSIS_CLUSTER_SEED,
+        incremental_max_change=settings.ANALYSIS_INCREMENTAL_MAX_CHANGE,
+        max_cluster_points=settings.ANALYSIS_MAX_CLUSTER_POINTS,
+    )
+
+
+def current_params_key():
+    from .analysis_cache import make_params_key
+    return make_params_key(build_analyzer().analysis_params)
+
+
+def start_classification(review_file, profile_mode=''):
+    # Reuses a cached analysis of identical content when there is one,
+    # otherwise queues a new job. A job asked to be profiled always runs, so
+    # there is an analysis to profile.
+    from . import analysis_cache
+    from .models import ClassificationJob
+
+    if not profile_mode:
+        entry = analysis_cache.lookup(review_file.content_hash, current_params_key())
+        if entry is not None:
+            metrics.inc('review_analysis_cache_hits_total')
+            return analysis_cache.complete_from_cache(review_file, entry)
+
+    job = ClassificationJob.objects.create(review_file=review_file,
+                                           profile_mode=profile_mode or settings.ANALYSIS_PROFILE_MODE)
+    submit_classification_job(job)
+    return job
+
+
+def analyze_and_store(analyzer, path, content_hash, params_key, previous_state=None, progress_callback=None,
+                      profiler=None):
+    # Analyzes the file and saves what later requests read for its content:
+    # the analysis state, the point index and the per-review results
+    from . import analysis_cache
+    from .point_index import PointIndex
+    from .profiling import NULL_PROFILER
+
+    profiler = profiler or NULL_PROFILER
+    output, state = analyzer.analyze_with_state(path, progress_callback=progress_callback,
+                                                previous_state=previous_state, profiler=profiler)
+    with profiler.stage('save_state'):
+        analysis_cache.save_state(content_hash, params_key, state)
+    with profiler.stage('build_point_index'):
+        analysis_cache.save_point_index(content_hash, params_key, PointIndex.build(state.coordinates, state.clusters))
+    if progress_callback is not None:
+        progress_callback(95)
+    with profiler.stage('store_review_results'):
+        analysis_cache.store_review_results(content_hash, params_key, state)
+    return output, state
+
+
+def run_classification_job(job_id):
+    from . import analysis_cache
+    from .models import ClassificationJob
+    from .profiling import make_profiler
+
+    started = time.perf_counter()
+    job = ClassificationJob.objects.select_related('review_file').get(id=job_id)
+    job.state = ClassificationJob.RUNNING
+    job.progress = 0
+    job.save(update_fields=['state', 'progress', 'updated_date'])
+
+    def report_progress(percent):
+        ClassificationJob.objects.filter(id=job_id).update(progress=percent, updated_date=timezone.now())
+
+    review_file = job.review_file
+    if not review_file.content_hash:
+        # Files uploaded before content hashes were recorded
+        file_hash = hashlib.md5()
+        for chunk in review_file.file.chunks():
+            file_hash.update(chunk)
+        review_file.content_hash = file_hash.hexdigest()
+        review_file.save(update_fields=['content_hash'])
+
+    analyzer = build_analyzer()
+    params_key = analysis_cache.make_params_key(analyzer.analysis_params)
+    profiler = make_profiler(job.profile_mode, trace_memory=settings.ANALYSIS_PROFILE_MEMORY)
+    profiler.start()
+    try:
+        with profiler.stage('load_previous_state'):
+            previous_state = analysis_cache.load_previous_state(review_file, params_key)
+        output, state = analyze_and_store(analyzer, review_file.file.path, review_file.content_hash, params_key,
+                                          previous_state=previous_state, progress_callback=report_progress,
+                                          profiler=profiler)
+    except Exception as e:
+        profiler.stop()
+        logger.exception("Classification job %s failed", job_id)
+        _fail_running(ClassificationJob, job_id, e)
+        metrics.observe('review_job_duration_seconds', time.perf_counter() - started,
+                        {'job': 'classification', 'outcome': 'failed'})
+        return
+
+    # The FileOutput only exists once the whole analysis has succeeded. It is
+    # kept, like the cached analysis, even if the job was failed meanwhile.
+    with transaction.atomic():
+        analysis = analysis_cache.store(review_file.content_hash, params_key, output)
+        file_output = analysis_cache.get_or_create_file_output(review_file, params_key, output,
+                                                               profile=profiler.report())
+        completed = _complete_running(ClassificationJob, job_id, analysis=analysis, file_output=file_output,
+                                      reused_rows=state.reused_rows, progress=100)
+    if not completed:
+        logger.warning("Classification job %s finished after it was failed", job_id)
+        return
+    metrics.observe('review_job_duration_seconds', time.perf_counter() - started,
+                    {'job': 'classification', 'outcome': 'completed'})
+    metrics.inc('review_analysis_rows_total', {'source': 'analyzed'}, len(state.sentiments) - state.reused_rows)
+    metrics.inc('review_analysis_rows_total', {'source': 'reused'}, state.reused_rows)
+
+
+def analyze_batch_file(path, content_hash, params_key):
+    # Runs on the pool of manage.py batch_analyze; returns the output, the
+    # number of rows and the seconds the analysis took
+    started = time.perf_counter()
+    output, state = analyze_and_store(build_analyzer(), path, content_hash, params_key)
+    seconds = time.perf_counter() - started
+    metrics.observe('review_job_duration_seconds', seconds, {'job': 'batch', 'outcome': 'completed'})
+    metrics.inc('review_analysis_rows_total', {'source': 'analyzed'}, len(state.sentiments))
+    return output, len(state.sentiments), seconds
+
+
+def start_report(review_file, file_output, color_options):
+    # Reports already generated for the same output, feedback and colors come
+    # back as a completed job, otherwise the reports are written on the pool
+    from . import report_cache
+    from .models import ReportJob
+
+    job = ReportJob(review_file=review_file, file_output=file_output, color_options=list(color_options))
+    entry = report_cache.lookup(report_cache.make_report_key(file_output, color_options))
+    if entry is not None:
+        job.pdf_path, job.docx_path = entry.pdf_path.name, entry.docx_path.name
+        job.state, job.stage, job.progress, job.cache_hit = ReportJob.COMPLETED, ReportJob.DONE, 100, True
+        job.save()
+        return job
+
+    job.save()
+    job_id = job.id
+    submit_job(job, run_report_job, then=lambda charts: submit_report_writers(job_id, charts))
+    return job
+
+
+def report_generator(file_output, color_options, charts=None):
+    from .models import ReviewFeedback, UserInterfaceFeedback
+    from .ReportGenerator import ReportGenerator
+
+    return ReportGenerator(file_output,
+                           UserInterfaceFeedback.objects.filter(review_file_id=file_output.review_file_id),
+                           ReviewFeedback.objects.filter(review_file_id=file_output.review_file_id),
+                           color_options, charts=charts)
+
+
+def write_report(file_output_id, color_options, charts, report_format):
+    # Runs on a worker: writes one format of the report from charts rendered
+    # elsewhere and returns its path
+    from .models import FileOutput
+
+    file_output = FileOutput.objects.select_related('review_file').get(id=file_output_id)
+    return report_generator(file_output, color_options, charts).generate_report(report_format)
+
+
+def write_reports(file_output, color_options, charts):
+    # Writes the PDF and the DOCX at the same time, as two tasks on the pool,
+    # and returns their paths. The writers are CPU bound, so threads would
+    # take turns on the GIL instead.
+    from .models import ReportJob
+
+    executor = get_executor()
+    futures = [executor.submit(write_report, file_output.id, list(color_options), charts, report_format)
+               for report_format in ReportJob.FORMATS]
+    return tuple(future.result() for future in futures)
+
+
+def run_report_job(job_id):
+    # Renders the charts; submit_report_writers then hands them to one
+    # run_report_writer per format. Returns None when there is nothing left
+    # to write.
+    from . import report_cache
+    from .models import ReportJob
+
+    started = time.time()
+    job = ReportJob.objects.select_related('review_file', 'file_output').get(id=job_id)
+    job.state, job.stage = ReportJob.RUNNING, ReportJob.CHARTS
+    job.save(update_fields=['state', 'stage', 'updated_date'])
+
+    file_output = job.file_output
+    try:
+        if file_output is None:
+            raise ValueError('The classification output of this file no longer exists.')
+        # The key is taken now rather than at submission, so the reports match
+        # the feedback they are generated from
+        cache_key = report_cache.make_report_key(file_output, job.color_options)
+        entry = report_cache.lookup(cache_key)
+        if entry is None:
+            charts = report_generator(file_output, job.color_options).render_charts()
+    except Exception as e:
+        _fail_report_job(job_id, e, started)
+        return None
+
+    if entry is not None:
+        # Written by another job while this one was queued
+        if _complete_running(ReportJob, job_id, pdf_path=entry.pdf_path.name, docx_path=entry.docx_path.name,
+                             cache_hit=True, stage=ReportJob.DONE, progress=100):
+            _observe_report(started, 'completed')
+        return None
+    ReportJob.objects.filter(id=job_id, state=ReportJob.RUNNING).update(
+        stage=ReportJob.WRITING, progress=REPORT_CHARTS_PROGRESS, updated_date=timezone.now())
+    return {'charts': charts, 'cache_key': cache_key, 'started': started}
+
+
+def submit_report_writers(job_id, rendered):
+    from .models import ReportJob
+
+    if rendered is None:
+        return
+    for report_format in ReportJob.FORMATS:
+        _submit(ReportJob, job_id, run_report_writer,
+                (job_id, report_format, rendered['charts'], rendered['cache_key'], rendered['started']))
+
+
+def run_report_writer(job_id, report_format, charts, cache_key, started):
+    # Writes one format of a report job. The writer that finishes second
+    # completes the job and caches both files.
+    from . import report_cache
+    from .models import ReportJob
+
+    job = ReportJob.objects.select_related('review_file', 'file_output').get(id=job_id)
+    if job.state != ReportJob.RUNNING:
+        return
+    try:
+        if job.file_output is None:
+            raise ValueError('The classification output of this file no longer exists.')
+        path = report_generator(job.file_output, job.color_options, charts).generate_report(report_format)
+    except Exception as e:
+        _fail_report_job(job_id, e, started)
+        return
+
+    path_field = f'{report_format}_path'
+    saved = ReportJob.objects.filter(id=job_id, state=ReportJob.RUNNING).update(
+        **{path_field: path}, progress=F('progress') + (100 - REPORT_CHARTS_PROGRESS) // len(ReportJob.FORMATS),
+        updated_date=timezone.now())
+    if not saved:
+        # Failed, by the other writer or as stale, while this one was writing
+        _discard_report_files(job_id, path)
+        return
+    completed = ReportJob.objects.filter(id=job_id, state=ReportJob.RUNNING).exclude(pdf_path='').exclude(
+        docx_path='').update(state=ReportJob.COMPLETED, stage=ReportJob.DONE, progress=100,
+                             updated_date=timezone.now())
+    if completed:
+        job.refresh_from_db(fields=['pdf_path', 'docx_path'])
+        report_cache.record(job.review_file, job.file_output, cache_key, job.pdf_path.name, job.docx_path.name)
+        _observe_report(started, 'completed')
+
+
+def _fail_report_job(job_id, exc, started):
+    from .models import ReportJob
+
+    logger.exception("Report job %s failed", job_id)
+    if _fail_running(ReportJob, job_id, exc):
+        _discard_report_files(job_id)
+        _observe_report(started, 'failed')
+
+
+def _discard_report_files(job_id, *paths):
+    # A failed job's files are not cached, so nothing else would delete
+    # them: the given paths and any the other writer already saved
+    from .models import ReportJob
+
+    saved = ReportJob.objects.filter(id=job_id).values_list('pdf_path', 'docx_path').first() or ()
+    for path in {*paths, *saved} - {''}:
+        default_storage.delete(path)
+
+
+def _observe_report(started, outcome):
+    # started is wall clock time, as the charts and the files are written in
+    # different processes
+    metrics.observe('review_job_duration_seconds', time.time() - started, {'job': 'report', 'outcome': outcome})
+
+
+def start_compare(review_files):
+    from .models import CompareJob
+
+    job = CompareJob.objects.create(file_ids=[review_file.id for review_file in review_files])
+    submit_job(job, run_compare_job)
+    return job
+
+
+def run_compare_job(job_id):
+    from .models import CompareJob, ReviewFile
+
+    started = time.perf_counter()
+    job = CompareJob.objects.get(id=job_id)
+    job.state = CompareJob.RUNNING
+    job.save(update_fields=['state', 'updated_date'])
+
+    try:
+        review_files = ReviewFile.objects.in_bulk(job.file_ids)
+        if len(review_files) != len(job.file_ids):
+            raise ValueError('A file of this comparison no longer exists.')
+        review_files = [review_files[file_id] for file_id in job.file_ids]
+        result = build_analyzer().compare([review_file.file.path for review_file in review_files])
+    except Exception as e:
+        logger.exception("Compare job %s failed", job_id)
+        _fail_running(CompareJob, job_id, e)
+        metrics.observe('review_job_duration_seconds', time.perf_counter() - started,
+                        {'job': 'compare', 'outcome': 'failed'})
+        return
+
+    for review_file, file_result in zip(review_files, result['files']):
+        file_result['review_file_id'] = review_file.id
+        file_result['file_name'] = review_file.file_name
+        file_result['rows'] = sum(file_result['cluster_distribution']['data'])
+    if not _complete_running(CompareJob, job_id, result=result, progress=100):
+        logger.warning("Compare job %s finished after it was failed", job_id)
+        return
+    metrics.observe('review_job_duration_seconds', time.perf_counter() - started,
+                    {'job': 'compare', 'outcome': 'completed'})
@@ -0,0 +1,18 @@
+def over_budget(entries, max_bytes, keep=None):
+    # Ids of the cache entries that do not fit in max_bytes once the most
+    # recently used ones are counted first. entries is a queryset of a model
+    # with last_used_date and size_bytes; keep, the entry that was just
+    # stored, is counted first and never returned, even if it alone is over.
+    entries = entries.order_by('-last_used_date').values_list('id', 'size_bytes')
+    if keep is not None:
+        entries = entries.exclude(id=keep.id)
+        total = keep.size_bytes
+    else:
+        total = 0
+
+    stale = []
+    for entry_id, size_bytes in entries.iterator():
+        total += size_bytes
+        if total > max_bytes:
+            stale.append(entry_id)
+    return stale
@@ -0,0 +1,188 @@
+import glob
+import hashlib
+import os
+import time
+from collections import Counter
+from concurrent.futures import as_completed
+
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from reviews import analysis_cache
+from reviews.jobs import analyze_batch_file, build_analyzer, create_executor
+from reviews.models import AnalysisCacheEntry, FileOutput, ReviewFile
+
+EXTENSIONS = ('.csv', '.xlsx')
+# Hashes per query when looking up earlier analyses, below SQLite's variable limit
+LOOKUP_CHUNK_SIZE = 500
+
+
+def find_files(patterns):
+    # Files named directly, every CSV/XLSX under a directory, or glob matches,
+    # in a stable order and each once
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for root, dirs, files in os.walk(pattern):
+                dirs.sort()
+                paths.extend(os.path.join(root, name) for name in sorted(files))
+        elif os.path.isfile(pattern):
+            paths.append(pattern)
+        else:
+            matches = sorted(glob.glob(pattern, recursive=True))
+            if not matches:
+                raise CommandError(f"No files match {pattern}")
+            paths.extend(matches)
+    paths = [os.path.abspath(path) for path in paths if os.path.isfile(path) and path.lower().endswith(EXTENSIONS)]
+    return list(dict.fromkeys(paths))
+
+
+def file_md5(path):
+    # Same hash as ReviewFile.content_hash
+    file_hash = hashlib.md5()
+    with open(path, 'rb') as review_file:
+        for chunk in iter(lambda: review_file.read(1024 * 1024), b''):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def in_chunks(values, lookup):
+    values = list(values)
+    found = set()
+    for start in range(0, len(values), LOOKUP_CHUNK_SIZE):
+        found.update(lookup(values[start:start + LOOKUP_CHUNK_SIZE]))
+    return found
+
+
+class Command(BaseCommand):
+    help = ("Analyzes review exports (CSV or XLSX) on a process pool and saves each as a ReviewFile with its "
+            "FileOutput. Content already analyzed with the current settings is skipped, so a run that was "
+            "interrupted continues where it stopped when started again.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='files, directories (searched recursively) or glob patterns')
+        parser.add_argument('--user-email', required=True, help='owner of the ReviewFiles created')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='analysis processes (default: one per CPU); 0 analyzes in this process')
+        parser.add_argument('--batch-size', type=int, default=20, help='analyzed files saved per transaction')
+
+    def handle(self, *args, **options):
+        paths = find_files(options['paths'])
+        if not paths:
+            raise CommandError("No CSV or XLSX files found")
+        self.user_email = options['user_email']
+        self.batch_size = max(options['batch_size'], 1)
+        self.verbosity = options['verbosity']
+        self.params_key = analysis_cache.make_params_key(build_analyzer().analysis_params)
+        self.started = time.perf_counter()
+        self.total = len(paths)
+        self.counts = Counter()
+        self.processed = 0
+        self.rows = 0
+        self.failures = []
+        self.pending = []
+
+        hashes = {path: file_md5(path) for path in paths}
+        done = in_chunks(set(hashes.values()), lambda chunk: FileOutput.objects.filter(
+            params_key=self.params_key, review_file__content_hash__in=chunk,
+        ).values_list('review_file__content_hash', flat=True))
+        cached = in_chunks(set(hashes.values()) - done, lambda chunk: AnalysisCacheEntry.objects.filter(
+            params_key=self.params_key, content_hash__in=chunk,
+        ).values_list('content_hash', flat=True))
+
+        to_analyze = []
+        for path in paths:
+            content_hash = hashes[path]
+            if content_hash in done:
+                # Analyzed before, or a copy of a file earlier in this run
+                self.progress('skipped', path)
+            elif content_hash in cached:
+                entry = AnalysisCacheEntry.objects.get(content_hash=content_hash, params_key=self.params_key)
+                self.completed('cached', path, content_hash, entry.result)
+            else:
+                to_analyze.append((path, content_hash))
+            done.add(content_hash)
+
+        try:
+            self.analyze(to_analyze, options['workers'])
+        except KeyboardInterrupt:
+            self.save()
+            self.summary()
+            raise CommandError("Interrupted. Run the command again to continue with the files not saved yet.")
+        self.save()
+        self.summary()
+
+    def analyze(self, to_analyze, workers):
+        if workers <= 0:
+            for path, content_hash in to_analyze:
+                try:
+                    result = analyze_batch_file(path, content_hash, self.params_key)
+                except Exception as e:
+                    self.failed(path, e)
+                else:
+                    self.completed('analyzed', path, content_hash, *result)
+            return
+
+        executor = create_executor(min(workers, max(len(to_analyze), 1)))
+        try:
+            futures = {executor.submit(analyze_batch_file, path, content_hash, self.params_key): (path, content_hash)
+                       for path, content_hash in to_analyze}
+            for future in as_completed(futures):
+                path, content_hash = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    self.failed(path, e)
+                else:
+                    self.completed('analyzed', path, content_hash, *result)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def progress(self, status, path, detail=''):
+        self.counts[status] += 1
+        self.processed += 1
+        if status != 'skipped' or self.verbosity > 1:
+            self.stdout.write(f"[{self.processed}/{self.total}] {status} {path}{detail}")
+
+    def completed(self, status, path, content_hash, output, rows=None, seconds=None):
+        if rows is not None:
+            self.rows += rows
+            self.progress(status, path, f": {rows} rows in {seconds:.1f}s")
+        else:
+            self.progress(status, path)
+        self.pending.append((path, content_hash, output))
+        if len(self.pending) >= self.batch_size:
+            self.save()
+
+    def failed(self, path, error):
+        self.failures.append((path, error))
+        self.progress('failed', path, f": {error}")
+
+    def save(self):
+        # One transaction per batch. A file counts as done once its FileOutput
+        # is committed; anything analyzed but not saved is analyzed again on
+        # the next run.
+        if not self.pending:
+            return
+        with transaction.atomic():
+            for path, content_hash, output in self.pending:
+                with open(path, 'rb') as upload:
+                    review_file = ReviewFile.objects.create(user_email=self.user_email,
+                                                            file=File(upload, name=os.path.basename(path)))
+                analysis_cache.store(content_hash, self.params_key, output, evict_entries=False)
+                analysis_cache.get_or_create_file_output(review_file, self.params_key, output)
+            analysis_cache.evict()
+        self.counts['saved'] += len(self.pending)
+        self.pending = []
+
+    def summary(self):
+        seconds = time.perf_counter() - self.started
+        counts = self.counts
+        rate = f", {self.rows / seconds:.0f} rows/s" if self.rows and seconds else ''
+        self.stdout.write(self.style.SUCCESS(
+            f"{counts['analyzed']} analyzed ({self.rows} rows{rate}), {counts['cached']} from the analysis cache, "
+            f"{counts['skipped']} skipped, {counts['failed']} failed; {counts['saved']} saved in {seconds:.1f}s"
+        ))
+        for path, error in self.failures:
+            self.stderr.write(f"Failed: {path}: {error}")
@@ -0,0 +1,214 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+COUNTER = 'counter'
+GAUGE = 'gauge'
+HISTOGRAM = 'histogram'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+JOB_BUCKETS = (0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+# name: (type, help, histogram buckets)
+METRICS = {
+    'review_http_requests_total': (COUNTER, 'Requests by view, method and response status.', None),
+    'review_http_request_duration_seconds': (HISTOGRAM, 'Time to produce a response, by view and method.', LATENCY_BUCKETS),
+    'review_http_request_errors_total': (COUNTER, 'Requests that failed, by view and kind (client, server, or the exception raised).', None),
+    'review_http_request_bytes_total': (COUNTER, 'Request body bytes received, by view.', None),
+    'review_http_requests_in_progress': (GAUGE, 'Requests being handled, by view.', None),
+    'review_job_duration_seconds': (HISTOGRAM, 'Run time of classification, report, compare and batch analysis jobs, by job and outcome.', JOB_BUCKETS),
+    'review_analysis_rows_total': (COUNTER, 'Rows of classified files, by whether they were analyzed or reused from an earlier revision.', None),
+    'review_analysis_cache_hits_total': (COUNTER, 'Classifications answered from the analysis cache.', None),
+    'review_jobs': (GAUGE, 'Jobs waiting or running, by job and state.', None),
+}
+
+_local = threading.local()
+
+
+def _connection():
+    # One connection per thread and database file. Every process appends to
+    # the same file, so the exposition covers all web and pool workers. A
+    # forked worker opens its own rather than sharing its parent's.
+    path = settings.METRICS_DB_PATH
+    if getattr(_local, 'pid', None) != os.getpid():
+        _local.pid, _local.connections = os.getpid(), {}
+    connections = _local.connections
+    if path not in connections:
+        connection = sqlite3.connect(path, timeout=5)
+        connection.execute('PRAGMA journal_mode=WAL')
+        # Losing the last increments on a power cut is fine for metrics
+        connection.execute('PRAGMA synchronous=OFF')
+        connection.execute('CREATE TABLE IF NOT EXISTS samples (name TEXT, labels TEXT, value REAL, '
+                           'PRIMARY KEY (name, labels))')
+        connections[path] = connection
+    return connections[path]
+
+
+def _write(samples):
+    # samples are (name, labels, amount) to add to the stored values
+    if not settings.METRICS_ENABLED or not samples:
+        return
+    rows = [(name, json.dumps(labels, sort_keys=True), amount) for name, labels, amount in samples]
+    try:
+        connection = _connection()
+        with connection:
+            connection.executemany('INSERT INTO samples VALUES (?, ?, ?) ON CONFLICT (name, labels) '
+                                   'DO UPDATE SET value = value + excluded.value', rows)
+    except sqlite3.Error:
+        # Metrics must never fail the request or job they describe
+        logger.warning("Could not record metrics", exc_info=True)
+
+
+def _delete(connection, keys):
+    try:
+        with connection:
+            connection.executemany('DELETE FROM samples WHERE name = ? AND labels = ?', keys)
+    except sqlite3.Error:
+        logger.warning("Could not prune metrics", exc_info=True)
+
+
+def _histogram_samples(name, labels, value):
+    # Stored per bucket; the exposition makes the counts cumulative
+    buckets = METRICS[name][2]
+    index = bisect_left(buckets, value)
+    le = _format(buckets[index]) if index < len(buckets) else '+Inf'
+    return [(f'{name}_bucket', {**labels, 'le': le}, 1), (f'{name}_sum', labels, value), (f'{name}_count', labels, 1)]
+
+
+def inc(name, labels=None, amount=1):
+    _write([(name, labels or {}, amount)])
+
+
+def observe(name, value, labels=None):
+    _write(_histogram_samples(name, labels or {}, value))
+
+
+def record_request(view, method, status_code, seconds, request_bytes, exception=None):
+    labels = {'view': view, 'method': method}
+    samples = [('review_http_requests_total', {**labels, 'status': str(status_code)}, 1)]
+    samples += _histogram_samples('review_http_request_duration_seconds', labels, seconds)
+    if request_bytes:
+        samples.append(('review_http_request_bytes_total', {'view': view}, request_bytes))
+    if exception is not None:
+        samples.append(('review_http_request_errors_total', {'view': view, 'kind': exception}, 1))
+    elif status_code >= 400:
+        samples.append(('review_http_request_errors_total',
+                        {'view': view, 'kind': 'server' if status_code >= 500 else 'client'}, 1))
+    _write(samples)
+
+
+def track_in_progress(view, amount):
+    # Kept per process, so the requests of a worker that died are left out
+    _write([('review_http_requests_in_progress', {'view': view, 'pid': str(os.getpid())}, amount)])
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def job_queue_samples():
+    from django.db.models import Count
+    from .models import ClassificationJob, CompareJob, ReportJob
+
+    samples = []
+    for job, model in (('classification', ClassificationJob), ('report', ReportJob), ('compare', CompareJob)):
+        counts = dict(model.objects.filter(state__in=[model.PENDING, model.RUNNING])
+                      .values_list('state').annotate(count=Count('id')))
+        for state in (model.PENDING, model.RUNNING):
+            samples.append(('review_jobs', {'job': job, 'state': state}, counts.get(state, 0)))
+    return samples
+
+
+def collect():
+    # Stored samples plus the job queues, grouped by metric name
+    by_metric = defaultdict(list)
+    if settings.METRICS_ENABLED:
+        connection = _connection()
+        dead = []
+        for name, labels, value in connection.execute('SELECT name, labels, value FROM samples'):
+            stored_labels, labels = labels, json.loads(labels)
+            if name == 'review_http_requests_in_progress':
+                if not _pid_alive(int(labels.pop('pid'))):
+                    dead.append((name, stored_labels))
+                    continue
+            base = name
+            for suffix in ('_bucket', '_sum', '_count'):
+                if name.endswith(suffix) and name[:-len(suffix)] in METRICS:
+                    base = name[:-len(suffix)]
+            by_metric[base].append((name, labels, value))
+        if dead:
+            # Rows of workers that died, which pids only add to over time
+            _delete(connection, dead)
+    for name, labels, value in job_queue_samples():
+        by_metric[name].append((name, labels, value))
+    return by_metric
+
+
+def exposition():
+    # The samples in the Prometheus text format, version 0.0.4
+    by_metric = collect()
+    lines = []
+    for base, (kind, help_text, buckets) in METRICS.items():
+        samples = by_metric.get(base)
+        if not samples:
+            continue
+        lines.append(f'# HELP {base} {help_text}')
+        lines.append(f'# TYPE {base} {kind}')
+        if kind == HISTOGRAM:
+            lines.extend(_histogram_lines(base, buckets, samples))
+            continue
+        totals = defaultdict(float)
+        for _, labels, value in samples:
+            totals[_label_key(labels)] += value
+        for key, value in sorted(totals.items()):
+            lines.append(f'{base}{_format_labels(dict(key))} {_format(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def _histogram_lines(base, buckets, samples):
+    series = defaultdict(lambda: {'buckets': defaultdict(float), 'sum': 0.0, 'count': 0.0})
+    for name, labels, value in samples:
+        if name.endswith('_bucket'):
+            le = labels.pop('le')
+            series[_label_key(labels)]['buckets'][le] += value
+        else:
+            series[_label_key(labels)][name[len(base) + 1:]] += value
+    lines = []
+    for key, data in sorted(series.items()):
+        labels = dict(key)
+        cumulative = 0
+        for le in [_format(bucket) for bucket in buckets] + ['+Inf']:
+            cumulative += data['buckets'].get(le, 0)
+            lines.append(f'{base}_bucket{_format_labels({**labels, "le": le})} {_format(cumulative)}')
+        lines.append(f'{base}_sum{_format_labels(labels)} {_format(data["sum"])}')
+        lines.append(f'{base}_count{_format_labels(labels)} {_format(data["count"])}')
+    return lines
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+
+def _format(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
@@ -0,0 +1,46 @@
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from . import metrics
+
+
+class MetricsMiddleware:
+    """Records latency, status, errors and body size of every request.
+
+    Requests are labelled with the name of the URL pattern they matched, so
+    the number of series stays bounded. Streamed responses are timed until
+    the response starts, not until the last byte is sent.
+    """
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        response = self.get_response(request)
+        seconds = time.perf_counter() - start
+
+        view = getattr(request, '_metrics_view', None)
+        if view is not None:
+            metrics.track_in_progress(view, -1)
+        else:
+            view = 'unmatched'
+        try:
+            request_bytes = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            request_bytes = 0
+        metrics.record_request(view, request.method, response.status_code, seconds, request_bytes,
+                               getattr(request, '_metrics_exception', None))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        request._metrics_view = match.view_name if match else view_func.__name__
+        metrics.track_in_progress(request._metrics_view, 1)
+
+    def process_exception(self, request, exception):
+        request._metrics_exception = exception.__class__.__name__
@@ -0,0 +1,69 @@
+# Generated by Django 4.2.6 on 2026-10-18 07:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def move_job_results(apps, schema_editor):
+    # Results move from the jobs onto the outputs they produced
+    ClassificationJob = apps.get_model('reviews', 'ClassificationJob')
+    FileOutput = apps.get_model('reviews', 'FileOutput')
+
+    for job in ClassificationJob.objects.filter(result__isnull=False, file_output__isnull=False).iterator():
+        FileOutput.objects.filter(id=job.file_output_id).update(result=job.result)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0002_classificationjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fileoutput',
+            name='result',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.RunPython(move_job_results, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='classificationjob',
+            name='result',
+        ),
+        migrations.AddField(
+            model_name='classificationjob',
+            name='cache_hit',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='fileoutput',
+            name='params_key',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='reviewfile',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=32),
+        ),
+        migrations.CreateModel(
+            name='AnalysisCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=32)),
+                ('params_key', models.CharField(max_length=32)),
+                ('result', models.JSONField()),
+                ('size_bytes', models.PositiveBigIntegerField(default=0)),
+                ('hit_count', models.PositiveIntegerField(default=0)),
+                ('created_date', models.DateTimeField(auto_now_add=True)),
+                ('last_used_date', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'unique_together': {('content_hash', 'params_key')},
+            },
+        ),
+        migrations.AddField(
+            model_name='classificationjob',
+            name='analysis',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='reviews.analysiscacheentry'),
+        ),
+    ]
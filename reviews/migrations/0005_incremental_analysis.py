@@ -0,0 +1,29 @@
+# Generated by Django 4.2.6 on 2026-10-18 07:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0004_stored_blob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='classificationjob',
+            name='reused_rows',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='fileoutput',
+            name='state_file',
+            field=models.FileField(blank=True, upload_to='analysis/'),
+        ),
+        migrations.AddField(
+            model_name='reviewfile',
+            name='revision_of',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='revisions', to='reviews.reviewfile'),
+        ),
+    ]
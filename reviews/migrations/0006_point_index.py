@@ -0,0 +1,18 @@
+# Generated by Django 4.2.6 on 2026-10-18 07:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0005_incremental_analysis'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fileoutput',
+            name='points_file',
+            field=models.FileField(blank=True, upload_to='analysis/'),
+        ),
+    ]
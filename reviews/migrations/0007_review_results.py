@@ -0,0 +1,51 @@
+# Generated by Django 4.2.6 on 2026-10-18 07:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0006_point_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReviewResultSet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=32)),
+                ('params_key', models.CharField(max_length=32)),
+                ('row_count', models.PositiveIntegerField(default=0)),
+                ('complete', models.BooleanField(default=False)),
+                ('created_date', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'unique_together': {('content_hash', 'params_key')},
+            },
+        ),
+        migrations.AddField(
+            model_name='fileoutput',
+            name='result_set',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='reviews.reviewresultset'),
+        ),
+        migrations.CreateModel(
+            name='ReviewResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('row_index', models.PositiveIntegerField()),
+                ('text_offset', models.PositiveBigIntegerField(default=0)),
+                ('text_length', models.PositiveIntegerField(default=0)),
+                ('sentiment', models.CharField(max_length=8)),
+                ('cluster', models.PositiveSmallIntegerField()),
+                ('x', models.FloatField()),
+                ('y', models.FloatField()),
+                ('result_set', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='results', to='reviews.reviewresultset')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['result_set', 'sentiment', 'cluster', 'row_index'], name='reviews_rev_result__ef5fec_idx'), models.Index(fields=['result_set', 'sentiment', 'row_index'], name='reviews_rev_result__af5e1a_idx'), models.Index(fields=['result_set', 'cluster', 'row_index'], name='reviews_rev_result__a7451c_idx')],
+                'unique_together': {('result_set', 'row_index')},
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.6 on 2026-10-18 07:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0007_review_results'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cache_key', models.CharField(max_length=32, unique=True)),
+                ('pdf_path', models.FileField(upload_to='reports/')),
+                ('docx_path', models.FileField(upload_to='reports/')),
+                ('size_bytes', models.PositiveBigIntegerField(default=0)),
+                ('hit_count', models.PositiveIntegerField(default=0)),
+                ('created_date', models.DateTimeField(auto_now_add=True)),
+                ('last_used_date', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('file_output', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='reviews.fileoutput')),
+            ],
+        ),
+    ]
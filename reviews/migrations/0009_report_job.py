@@ -0,0 +1,34 @@
+# Generated by Django 4.2.6 on 2026-10-18 08:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0008_report_cache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('unique_id', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('color_options', models.JSONField(blank=True, default=list)),
+                ('state', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('stage', models.CharField(choices=[('queued', 'Queued'), ('charts', 'Rendering charts'), ('writing', 'Writing PDF and DOCX'), ('done', 'Done')], default='queued', max_length=20)),
+                ('progress', models.PositiveSmallIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('cache_hit', models.BooleanField(default=False)),
+                ('pdf_path', models.FileField(blank=True, upload_to='reports/')),
+                ('docx_path', models.FileField(blank=True, upload_to='reports/')),
+                ('created_date', models.DateTimeField(auto_now_add=True)),
+                ('updated_date', models.DateTimeField(auto_now=True)),
+                ('file_output', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='reviews.fileoutput')),
+                ('review_file', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='reviews.reviewfile')),
+            ],
+        ),
+    ]
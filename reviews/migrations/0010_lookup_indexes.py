@@ -0,0 +1,30 @@
+# Generated by Django 4.2.6 on 2026-10-18 08:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0009_report_job'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='reviewfile',
+            name='user_email',
+            field=models.EmailField(db_index=True, max_length=254),
+        ),
+        migrations.AddIndex(
+            model_name='fileoutput',
+            index=models.Index(fields=['review_file', 'params_key'], name='reviews_fil_review__ddc900_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reviewfeedback',
+            index=models.Index(fields=['review_file', 'created_date'], name='reviews_rev_review__9d2a43_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userinterfacefeedback',
+            index=models.Index(fields=['review_file', 'created_date'], name='reviews_use_review__0342e8_idx'),
+        ),
+    ]
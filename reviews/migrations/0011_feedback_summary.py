@@ -0,0 +1,60 @@
+# Generated by Django 4.2.6 on 2026-10-18 08:07
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Max, Q, Sum
+from django.db.models.functions import Coalesce
+
+
+def build_summaries(apps, schema_editor):
+    ReviewFile = apps.get_model('reviews', 'ReviewFile')
+    ReviewFeedback = apps.get_model('reviews', 'ReviewFeedback')
+    UserInterfaceFeedback = apps.get_model('reviews', 'UserInterfaceFeedback')
+    FeedbackSummary = apps.get_model('reviews', 'FeedbackSummary')
+
+    reviews = ReviewFeedback.objects.filter(review_file__isnull=False).values('review_file_id').annotate(
+        review_count=Count('id'),
+        rating_sum=Coalesce(Sum('star_rating'), 0),
+        review_latest=Max('created_date'),
+        **{f'rating_{rating}': Count('id', filter=Q(star_rating=rating)) for rating in range(1, 6)},
+    )
+    interface = UserInterfaceFeedback.objects.filter(review_file__isnull=False).values('review_file_id').annotate(
+        interface_count=Count('id'),
+        interface_latest=Max('created_date'),
+    )
+    fields = {review_file_id: {} for review_file_id in ReviewFile.objects.values_list('id', flat=True)}
+    for row in list(reviews) + list(interface):
+        fields[row.pop('review_file_id')].update(row)
+    FeedbackSummary.objects.bulk_create(
+        (FeedbackSummary(review_file_id=review_file_id, **values) for review_file_id, values in fields.items()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0010_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedbackSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('review_count', models.PositiveIntegerField(default=0)),
+                ('rating_sum', models.PositiveIntegerField(default=0)),
+                ('rating_1', models.PositiveIntegerField(default=0)),
+                ('rating_2', models.PositiveIntegerField(default=0)),
+                ('rating_3', models.PositiveIntegerField(default=0)),
+                ('rating_4', models.PositiveIntegerField(default=0)),
+                ('rating_5', models.PositiveIntegerField(default=0)),
+                ('review_latest', models.DateTimeField(blank=True, null=True)),
+                ('interface_count', models.PositiveIntegerField(default=0)),
+                ('interface_latest', models.DateTimeField(blank=True, null=True)),
+                ('updated_date', models.DateTimeField(auto_now=True)),
+                ('review_file', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='feedback_summary', to='reviews.reviewfile')),
+            ],
+        ),
+        migrations.RunPython(build_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.6 on 2026-10-18 08:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0011_feedback_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='classificationjob',
+            name='profile_mode',
+            field=models.CharField(blank=True, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='fileoutput',
+            name='profile',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.6 on 2026-10-18 08:53
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0012_profiling'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompareJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('unique_id', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('file_ids', models.JSONField(default=list)),
+                ('state', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('progress', models.PositiveSmallIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('result', models.JSONField(blank=True, null=True)),
+                ('created_date', models.DateTimeField(auto_now_add=True)),
+                ('updated_date', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
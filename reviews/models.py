@@ -1,6 +1,10 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
 from django.contrib.auth.models import AbstractUser, Group, Permission, UserManager as DefaultUserManager
+from django.core.files import File
+from django.core.files.storage import default_storage
 import hashlib
+import os
 import uuid
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils.text import slugify
@@ -44,25 +48,149 @@ class CustomUser(AbstractUser):
         self.username = self.email
         super().save(*args, **kwargs)
 
+class HashingFile(File):
+    """Wraps an upload so its MD5 is computed while storage reads it, whether
+    through chunks() or read(). Reading again from the start starts over."""
+
+    def __init__(self, file, name=None):
+        super().__init__(file, name or file.name)
+        self._reset()
+
+    def _reset(self):
+        self.md5 = hashlib.md5()
+        self.hashed_size = 0
+
+    def _update(self, data):
+        self.md5.update(data)
+        self.hashed_size += len(data)
+
+    def chunks(self, chunk_size=None):
+        self._reset()
+        for chunk in self.file.chunks(chunk_size):
+            self._update(chunk)
+            yield chunk
+
+    def read(self, *args, **kwargs):
+        data = self.file.read(*args, **kwargs)
+        self._update(data)
+        return data
+
+    def seek(self, *args, **kwargs):
+        position = self.file.seek(*args, **kwargs)
+        if self.file.tell() == 0:
+            self._reset()
+        return position
+
+
+def _hash_stored(name):
+    file_hash = hashlib.md5()
+    with default_storage.open(name, 'rb') as stored_file:
+        for chunk in stored_file.chunks():
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+class StoredBlobManager(models.Manager):
+    def store_upload(self, uploaded_file):
+        # Write the upload under a temporary name, then either adopt it as a new
+        # blob or throw it away in favour of the existing copy of the same content
+        extension = os.path.splitext(uploaded_file.name)[1].lower()
+        content = HashingFile(uploaded_file)
+        temp_name = default_storage.save(f'uploads/tmp/{uuid.uuid4().hex}{extension}', content)
+        content_hash, size = content.md5.hexdigest(), content.hashed_size
+        if size != uploaded_file.size:
+            # The storage skipped or re-read part of the upload while writing
+            # it, so hash what it wrote instead
+            content_hash, size = _hash_stored(temp_name), default_storage.size(temp_name)
+
+        try:
+            return self._adopt(temp_name, content_hash, extension, size)
+        except Exception:
+            # A no-op when it was already moved into place
+            default_storage.delete(temp_name)
+            raise
+
+    @transaction.atomic
+    def _adopt(self, temp_name, content_hash, extension, size):
+        blob = self._add_reference(content_hash)
+        if blob is not None:
+            default_storage.delete(temp_name)
+            return blob
+
+        final_name = f'uploads/{content_hash}{extension}'
+        try:
+            os.replace(default_storage.path(temp_name), default_storage.path(final_name))
+        except NotImplementedError:
+            # Storage without local paths: copy, then drop the temporary file
+            if default_storage.exists(final_name):
+                default_storage.delete(final_name)
+            with default_storage.open(temp_name) as temp_file:
+                final_name = default_storage.save(final_name, temp_file)
+            default_storage.delete(temp_name)
+        try:
+            with transaction.atomic():
+                return self.create(content_hash=content_hash, file=final_name, size=size, ref_count=1)
+        except IntegrityError:
+            # A concurrent upload of the same content created the blob first
+            blob = self._add_reference(content_hash)
+            if blob.file.name != final_name:
+                default_storage.delete(final_name)
+            return blob
+
+    def _add_reference(self, content_hash):
+        # The UPDATE comes first so that on SQLite, where select_for_update()
+        # does nothing, it takes the write lock and a concurrent upload of the
+        # same content waits for this one to commit
+        if not self.filter(content_hash=content_hash).update(ref_count=F('ref_count') + 1):
+            return None
+        return self.get(content_hash=content_hash)
+
+    def release(self, blob_id):
+        # Drop one reference; the stored file goes when the last ReviewFile does
+        with transaction.atomic():
+            self.filter(id=blob_id).update(ref_count=F('ref_count') - 1)
+            blob = self.select_for_update().filter(id=blob_id).first()
+            if blob is None or blob.ref_count > 0:
+                return
+            file_name = blob.file.name
+            blob.delete()
+            transaction.on_commit(lambda: default_storage.delete(file_name))
+
+
+class StoredBlob(models.Model):
+    content_hash = models.CharField(max_length=32, unique=True)
+    file = models.FileField(upload_to='uploads/')
+    size = models.PositiveBigIntegerField(default=0)
+    ref_count = models.PositiveIntegerField(default=0)
+    created_date = models.DateTimeField(auto_now_add=True)
+
+    objects = StoredBlobManager()
+
+    def __str__(self):
+        return self.file.name
+
+
 class ReviewFile(models.Model):
-    user_email = models.EmailField()
+    user_email = models.EmailField(db_index=True)
     file = models.FileField(upload_to='uploads/')
     file_name = models.CharField(max_length=255)
     created_date = models.DateTimeField(auto_now_add=True)
     unique_id = models.UUIDField(unique=True, default=uuid.uuid4, editable=False)
+    # MD5 of the uploaded content, used to find earlier analyses of the same file
+    content_hash = models.CharField(max_length=32, blank=True, db_index=True)
+    # Shared storage for the content; null for files uploaded before deduplication
+    blob = models.ForeignKey(StoredBlob, on_delete=models.PROTECT, null=True, blank=True)
+    # Earlier upload this file is a newer export of; rows it shares with that
+    # file are not analyzed again
+    revision_of = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='revisions')
 
     def save(self, *args, **kwargs):
-        if not self.id:
-            # Generate a unique file name using a hash of the file content
-            self.file.seek(0)
-            file_content = self.file.read()
-            file_hash = hashlib.md5(file_content).hexdigest()
-            original_name = self.file.name
-            self.file_name = original_name
-            new_name = f"{self.user_email}_{self.unique_id}_{file_hash}{self.file.name[self.file.name.rfind('.'):]}"
-
-            if ReviewFile.objects.filter(file=new_name).exists():
-                self.file.name = new_name
+        if not self.id and self.blob_id is None:
+            # Hash the upload while it is written; identical content is stored once
+            self.file_name = self.file.name
+            self.blob = StoredBlob.objects.store_upload(self.file)
+            self.content_hash = self.blob.content_hash
+            self.file = self.blob.file.name
 
         super(ReviewFile, self).save(*args, **kwargs)
 
@@ -70,19 +198,102 @@ class ReviewFile(models.Model):
         return self.file.name
     
     
+class ReviewResultSet(models.Model):
+    # Per-review results of one analysis, shared by every output of the same
+    # content and parameters
+    content_hash = models.CharField(max_length=32)
+    params_key = models.CharField(max_length=32)
+    row_count = models.PositiveIntegerField(default=0)
+    # False until every row has been inserted
+    complete = models.BooleanField(default=False)
+    created_date = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('content_hash', 'params_key')
+
+    def __str__(self):
+        return f"Review results of {self.content_hash} ({self.params_key})"
+
+
+class ReviewResult(models.Model):
+    result_set = models.ForeignKey(ReviewResultSet, on_delete=models.CASCADE, related_name='results')
+    # Position of the review in the file, also the pagination key
+    row_index = models.PositiveIntegerField()
+    # Where the review's text is in the texts sidecar of the set
+    # (analysis_cache.texts_name); the text itself is not stored here
+    text_offset = models.PositiveBigIntegerField(default=0)
+    text_length = models.PositiveIntegerField(default=0)
+    sentiment = models.CharField(max_length=8)
+    cluster = models.PositiveSmallIntegerField()
+    x = models.FloatField()
+    y = models.FloatField()
+
+    class Meta:
+        unique_together = ('result_set', 'row_index')
+        indexes = [
+            models.Index(fields=['result_set', 'sentiment', 'cluster', 'row_index']),
+            models.Index(fields=['result_set', 'sentiment', 'row_index']),
+            models.Index(fields=['result_set', 'cluster', 'row_index']),
+        ]
+
+    def __str__(self):
+        return f"Review {self.row_index} ({self.sentiment}, cluster {self.cluster})"
+
+
 class FileOutput(models.Model):
     review_file = models.ForeignKey(ReviewFile, on_delete=models.CASCADE)
     review_text = models.TextField()
     sentiment_summary = models.JSONField()
+    # Key of the analyzer parameters the output was produced with
+    params_key = models.CharField(max_length=32, blank=True)
+    # Per-row results and fitted models (AnalysisState), shared by every
+    # output of the same content and parameters
+    state_file = models.FileField(upload_to='analysis/', blank=True)
+    # Grid index over the projected points (PointIndex), for the scatter plot
+    points_file = models.FileField(upload_to='analysis/', blank=True)
+    result_set = models.ForeignKey(ReviewResultSet, on_delete=models.SET_NULL, null=True, blank=True)
+    # Stage timings of the analysis that produced the output, when it was profiled
+    profile = models.JSONField(null=True, blank=True)
+    # Full analyzer output, kept with the file rather than only in the
+    # analysis cache, which may evict it
+    result = models.JSONField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['review_file', 'params_key']),
+        ]
 
     def __str__(self):
         return self.review_file.file_name
 
+
+class AnalysisCacheEntry(models.Model):
+    content_hash = models.CharField(max_length=32)
+    params_key = models.CharField(max_length=32)
+    # Full analyzer output (cluster samples and points)
+    result = models.JSONField()
+    size_bytes = models.PositiveBigIntegerField(default=0)
+    hit_count = models.PositiveIntegerField(default=0)
+    created_date = models.DateTimeField(auto_now_add=True)
+    last_used_date = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        unique_together = ('content_hash', 'params_key')
+
+    def __str__(self):
+        return f"Analysis of {self.content_hash} ({self.params_key})"
+
 class UserInterfaceFeedback(models.Model):
     comment = models.TextField()
     created_date = models.DateTimeField(auto_now_add=True)
     review_file = models.ForeignKey(ReviewFile, on_delete=models.SET_NULL, null=True)
 
+    class Meta:
+        # Report cache keys count a file's feedback and take its latest date
+        indexes = [
+            models.Index(fields=['review_file', 'created_date']),
+        ]
+
     def __str__(self):
         return f"Feedback for {self.review_file.file.name}"
 
@@ -92,13 +303,181 @@ class ReviewFeedback(models.Model):
     review_file = models.ForeignKey(ReviewFile, on_delete=models.SET_NULL, null=True)
     star_rating = models.PositiveIntegerField(validators=[MinValueValidator(1), MaxValueValidator(5)])
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['review_file', 'created_date']),
+        ]
+
     def __str__(self):
         return f"Review for {self.review_file.file.name}"
 
+class FeedbackSummary(models.Model):
+    # Running totals of a file's feedback, bumped on every insert so that
+    # reports and clients never have to scan the feedback rows for them
+    RATINGS = range(1, 6)
+
+    review_file = models.OneToOneField(ReviewFile, on_delete=models.CASCADE, related_name='feedback_summary')
+    review_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_1 = models.PositiveIntegerField(default=0)
+    rating_2 = models.PositiveIntegerField(default=0)
+    rating_3 = models.PositiveIntegerField(default=0)
+    rating_4 = models.PositiveIntegerField(default=0)
+    rating_5 = models.PositiveIntegerField(default=0)
+    review_latest = models.DateTimeField(null=True, blank=True)
+    interface_count = models.PositiveIntegerField(default=0)
+    interface_latest = models.DateTimeField(null=True, blank=True)
+    updated_date = models.DateTimeField(auto_now=True)
+
+    @property
+    def mean_rating(self):
+        return self.rating_sum / self.review_count if self.review_count else None
+
+    @property
+    def histogram(self):
+        return {str(rating): getattr(self, f'rating_{rating}') for rating in self.RATINGS}
+
+    def __str__(self):
+        return f"Feedback summary for {self.review_file.file_name}"
+
 class ReportGenerated(models.Model):
     generated_at = models.DateTimeField(auto_now_add=True)
     file_path = models.FileField(upload_to='reports/')
     review_file = models.ForeignKey(ReviewFile, on_delete=models.SET_NULL, null=True)
 
     def __str__(self):
-        return f"Report for {self.review_file.file.name} at {self.generated_at}"
\ No newline at end of file
+        return f"Report for {self.review_file.file.name} at {self.generated_at}"
+
+
+class ReportCacheEntry(models.Model):
+    file_output = models.ForeignKey(FileOutput, on_delete=models.CASCADE)
+    # Hash of the output, the feedback counts and latest timestamps, and the colors
+    cache_key = models.CharField(max_length=32, unique=True)
+    pdf_path = models.FileField(upload_to='reports/')
+    docx_path = models.FileField(upload_to='reports/')
+    size_bytes = models.PositiveBigIntegerField(default=0)
+    hit_count = models.PositiveIntegerField(default=0)
+    created_date = models.DateTimeField(auto_now_add=True)
+    last_used_date = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"Reports for {self.file_output} ({self.cache_key})"
+
+
+class ClassificationJob(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
+    STATE_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (COMPLETED, 'Completed'),
+        (FAILED, 'Failed'),
+    ]
+
+    unique_id = models.UUIDField(unique=True, default=uuid.uuid4, editable=False)
+    review_file = models.ForeignKey(ReviewFile, on_delete=models.CASCADE)
+    state = models.CharField(max_length=20, choices=STATE_CHOICES, default=PENDING)
+    progress = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    analysis = models.ForeignKey(AnalysisCacheEntry, on_delete=models.SET_NULL, null=True, blank=True)
+    cache_hit = models.BooleanField(default=False)
+    # Rows taken over from the analysis of the file this one revises
+    reused_rows = models.PositiveIntegerField(default=0)
+    # '' or one of reviews.profiling.PROFILE_MODES
+    profile_mode = models.CharField(max_length=20, blank=True)
+    file_output = models.ForeignKey(FileOutput, on_delete=models.SET_NULL, null=True, blank=True)
+    created_date = models.DateTimeField(auto_now_add=True)
+    updated_date = models.DateTimeField(auto_now=True)
+
+    @property
+    def is_finished(self):
+        return self.state in (self.COMPLETED, self.FAILED)
+
+    @property
+    def result(self):
+        return self.file_output.result if self.file_output else None
+
+    def __str__(self):
+        return f"Classification of {self.review_file.file.name} ({self.state})"
+
+
+class ReportJob(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
+    STATE_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (COMPLETED, 'Completed'),
+        (FAILED, 'Failed'),
+    ]
+    QUEUED = 'queued'
+    CHARTS = 'charts'
+    WRITING = 'writing'
+    DONE = 'done'
+    STAGE_CHOICES = [
+        (QUEUED, 'Queued'),
+        (CHARTS, 'Rendering charts'),
+        (WRITING, 'Writing PDF and DOCX'),
+        (DONE, 'Done'),
+    ]
+    PDF = 'pdf'
+    DOCX = 'docx'
+    FORMATS = (PDF, DOCX)
+
+    unique_id = models.UUIDField(unique=True, default=uuid.uuid4, editable=False)
+    review_file = models.ForeignKey(ReviewFile, on_delete=models.CASCADE)
+    file_output = models.ForeignKey(FileOutput, on_delete=models.SET_NULL, null=True, blank=True)
+    color_options = models.JSONField(default=list, blank=True)
+    state = models.CharField(max_length=20, choices=STATE_CHOICES, default=PENDING)
+    stage = models.CharField(max_length=20, choices=STAGE_CHOICES, default=QUEUED)
+    progress = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    cache_hit = models.BooleanField(default=False)
+    # The files belong to the report cache and go away when it evicts them
+    pdf_path = models.FileField(upload_to='reports/', blank=True)
+    docx_path = models.FileField(upload_to='reports/', blank=True)
+    created_date = models.DateTimeField(auto_now_add=True)
+    updated_date = models.DateTimeField(auto_now=True)
+
+    @property
+    def is_finished(self):
+        return self.state in (self.COMPLETED, self.FAILED)
+
+    def __str__(self):
+        return f"Report of {self.review_file.file.name} ({self.state}, {self.stage})"
+
+
+
+class CompareJob(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
+    STATE_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (COMPLETED, 'Completed'),
+        (FAILED, 'Failed'),
+    ]
+
+    unique_id = models.UUIDField(unique=True, default=uuid.uuid4, editable=False)
+    # ReviewFile ids, in the order the files are listed in the result
+    file_ids = models.JSONField(default=list)
+    state = models.CharField(max_length=20, choices=STATE_CHOICES, default=PENDING)
+    progress = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    # What DataAnalyzer.compare returns, plus the id, name and rows of each file
+    result = models.JSONField(null=True, blank=True)
+    created_date = models.DateTimeField(auto_now_add=True)
+    updated_date = models.DateTimeField(auto_now=True)
+
+    @property
+    def is_finished(self):
+        return self.state in (self.COMPLETED, self.FAILED)
+
+    def __str__(self):
+        return f"Comparison of files {self.file_ids} ({self.state})"
@@ -0,0 +1,122 @@
+import numpy as np
+
+
+class PointIndex:
+    """Uniform grid over the projected review coordinates, for the scatter plot.
+
+    Points are sorted by their cell in a GRID_SIZE x GRID_SIZE grid over the
+    bounds of the plot (row by row), and offsets mark where each cell starts,
+    so the points in a viewport come from one slice per grid row it covers.
+    Zoom level 0 splits the whole plot into 2**BASE_LEVEL bins per axis and
+    every further level halves the bin size. Each point also has a random
+    priority; taking the lowest priorities in a viewport gives a uniform
+    sample, which stays the same while the user pans and zooms.
+    """
+
+    MAX_LEVEL = 9
+    BASE_LEVEL = 5
+    GRID_SIZE = 2 ** MAX_LEVEL
+    ARRAYS = ('bounds', 'x', 'y', 'clusters', 'priority', 'offsets')
+
+    def __init__(self, **arrays):
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+
+    @classmethod
+    def build(cls, coordinates, clusters, seed=0):
+        x = np.asarray(coordinates[:, 0], dtype=np.float32)
+        y = np.asarray(coordinates[:, 1], dtype=np.float32)
+        bounds = np.array([x.min(), x.max(), y.min(), y.max()], dtype=np.float64)
+        index = cls(bounds=bounds, x=x, y=y, clusters=np.asarray(clusters, dtype=np.int16),
+                    priority=np.random.default_rng(seed).permutation(len(x)).astype(np.int32),
+                    offsets=None)
+        cells = index._cell(x, 0) + index._cell(y, 2) * cls.GRID_SIZE
+        order = np.argsort(cells, kind='stable')
+        for name in ('x', 'y', 'clusters', 'priority'):
+            setattr(index, name, getattr(index, name)[order])
+        index.offsets = np.searchsorted(cells[order], np.arange(cls.GRID_SIZE ** 2 + 1)).astype(np.int64)
+        return index
+
+    def save(self, file):
+        np.savez_compressed(file, **{name: getattr(self, name) for name in self.ARRAYS})
+
+    @classmethod
+    def load(cls, file):
+        with np.load(file, allow_pickle=False) as data:
+            return cls(**{name: data[name] for name in cls.ARRAYS})
+
+    def _cell(self, values, axis):
+        # Grid column (axis 0) or row (axis 2) of each value, clipped to the grid
+        low, high = self.bounds[axis], self.bounds[axis + 1]
+        span = high - low if high > low else 1.0
+        cells = np.floor((np.asarray(values, dtype=np.float64) - low) / span * self.GRID_SIZE)
+        return np.clip(cells, 0, self.GRID_SIZE - 1).astype(np.int64)
+
+    def _bin_size(self, level, axis):
+        span = self.bounds[axis + 1] - self.bounds[axis]
+        return (span if span > 0 else 1.0) / 2 ** level
+
+    def query(self, viewport=None, zoom=0, max_points=5000, max_bins=4096, mode='auto'):
+        # viewport is (x_min, x_max, y_min, y_max) and defaults to the whole
+        # plot. mode 'points' returns at most max_points points (sampled when
+        # the viewport holds more), 'bins' returns per-cluster counts for at
+        # most max_bins bins, and 'auto' picks points whenever they all fit.
+        x_min, x_max, y_min, y_max = viewport if viewport is not None else self.bounds
+        result = {
+            'bounds': [float(value) for value in self.bounds],
+            'viewport': [float(x_min), float(x_max), float(y_min), float(y_max)],
+            'total': 0,
+        }
+        if x_min > x_max or y_min > y_max or x_max < self.bounds[0] or x_min > self.bounds[1] \
+                or y_max < self.bounds[2] or y_min > self.bounds[3]:
+            result.update({'mode': 'points' if mode == 'auto' else mode, 'sampled': False, 'points': []})
+            return result
+
+        (column_first, column_last), (row_first, row_last) = self._cell([x_min, x_max], 0), self._cell([y_min, y_max], 2)
+        starts = self.offsets[np.arange(row_first, row_last + 1) * self.GRID_SIZE + column_first]
+        ends = self.offsets[np.arange(row_first, row_last + 1) * self.GRID_SIZE + column_last + 1]
+        rows = np.concatenate([np.arange(start, end) for start, end in zip(starts, ends)])
+        x, y = self.x[rows], self.y[rows]
+        rows = rows[(x >= x_min) & (x <= x_max) & (y >= y_min) & (y <= y_max)]
+        result['total'] = int(len(rows))
+
+        if mode == 'auto':
+            mode = 'points' if len(rows) <= max_points else 'bins'
+        result['mode'] = mode
+        if mode == 'points':
+            result['sampled'] = len(rows) > max_points
+            if result['sampled']:
+                rows = rows[np.argpartition(self.priority[rows], max_points)[:max_points]]
+            rows = rows[np.argsort(self.priority[rows])]
+            result['points'] = [{'x': float(x), 'y': float(y), 'cluster': int(cluster)}
+                                for x, y, cluster in zip(self.x[rows], self.y[rows], self.clusters[rows])]
+            return result
+
+        # Coarsen the bins until the viewport needs no more than max_bins of them
+        level = min(self.BASE_LEVEL + max(zoom, 0), self.MAX_LEVEL)
+        while level > 0:
+            shift = self.MAX_LEVEL - level
+            if ((column_last >> shift) - (column_first >> shift) + 1) * ((row_last >> shift) - (row_first >> shift) + 1) <= max_bins:
+                break
+            level -= 1
+        shift = self.MAX_LEVEL - level
+        num_clusters = int(self.clusters.max()) + 1
+        keys = ((self._cell(self.y[rows], 2) >> shift) * 2 ** level + (self._cell(self.x[rows], 0) >> shift)) \
+            * num_clusters + self.clusters[rows]
+        keys, counts = np.unique(keys, return_counts=True)
+        bin_keys, clusters = np.divmod(keys, num_clusters)
+        bin_rows, columns = np.divmod(bin_keys, 2 ** level)
+
+        width, height = self._bin_size(level, 0), self._bin_size(level, 2)
+        bins = {}
+        for bin_row, column, cluster, count in zip(bin_rows.tolist(), columns.tolist(), clusters.tolist(), counts.tolist()):
+            entry = bins.setdefault((bin_row, column), {
+                'x': float(self.bounds[0] + column * width),
+                'y': float(self.bounds[2] + bin_row * height),
+                'count': 0,
+                'clusters': {},
+            })
+            entry['count'] += count
+            entry['clusters'][cluster] = count
+        result.update({'level': level, 'bin_width': width, 'bin_height': height, 'bins': list(bins.values())})
+        return result
@@ -0,0 +1,132 @@
+import cProfile
+import io
+import pstats
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+# 'stages' records wall time, CPU time and peak memory per stage; 'cprofile'
+# adds the functions with the highest cumulative time
+PROFILE_MODES = ('stages', 'cprofile')
+CPROFILE_LIMIT = 40
+
+
+class NullProfiler:
+    """Profiler used when profiling is off; every hook does nothing."""
+
+    _context = nullcontext()
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def stage(self, name):
+        return self._context
+
+    def iterate(self, name, iterable):
+        return iterable
+
+    def report(self):
+        return None
+
+
+NULL_PROFILER = NullProfiler()
+
+
+class StageProfiler:
+    """Wall time, CPU time and peak traced memory for each named stage.
+
+    A stage that runs several times (once per chunk of a file, say) adds up
+    its times and keeps its highest peak. CPU time is this process's only;
+    work handed to other processes shows up as wall time. Memory is traced
+    with tracemalloc, which slows numpy- and pandas-heavy code noticeably.
+    """
+
+    def __init__(self, trace_memory=True, use_cprofile=False):
+        self.trace_memory = trace_memory
+        self.use_cprofile = use_cprofile
+        self.stages = {}
+        self._cprofile = None
+        self._started = None
+        self._totals = None
+        self._owns_tracing = False
+
+    def start(self):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._owns_tracing = True
+        if self.use_cprofile:
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        self._started = (time.perf_counter(), time.process_time())
+
+    def stop(self):
+        if self._started is None or self._totals is not None:
+            return
+        self._totals = (time.perf_counter() - self._started[0], time.process_time() - self._started[1])
+        if self._cprofile is not None:
+            self._cprofile.disable()
+        if self._owns_tracing:
+            tracemalloc.stop()
+            self._owns_tracing = False
+
+    @contextmanager
+    def stage(self, name):
+        tracing = self.trace_memory and tracemalloc.is_tracing()
+        if tracing:
+            start_memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            entry = self.stages.setdefault(name, {'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0})
+            entry['calls'] += 1
+            entry['wall_seconds'] += time.perf_counter() - wall
+            entry['cpu_seconds'] += time.process_time() - cpu
+            if tracing:
+                peak = tracemalloc.get_traced_memory()[1]
+                entry['peak_memory_bytes'] = max(entry.get('peak_memory_bytes', 0), peak)
+                entry['peak_increase_bytes'] = max(entry.get('peak_increase_bytes', 0), peak - start_memory)
+
+    def iterate(self, name, iterable):
+        # Yields the items of iterable, timing only the work of producing them
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def report(self):
+        self.stop()
+        stages = [{
+            'name': name,
+            **entry,
+            'wall_seconds': round(entry['wall_seconds'], 4),
+            'cpu_seconds': round(entry['cpu_seconds'], 4),
+        } for name, entry in self.stages.items()]
+        report = {'stages': stages}
+        if self._totals is not None:
+            report['wall_seconds'] = round(self._totals[0], 4)
+            report['cpu_seconds'] = round(self._totals[1], 4)
+        if self.trace_memory:
+            report['peak_memory_bytes'] = max((stage.get('peak_memory_bytes', 0) for stage in stages), default=0)
+        if self._cprofile is not None:
+            output = io.StringIO()
+            pstats.Stats(self._cprofile, stream=output).sort_stats('cumulative').print_stats(CPROFILE_LIMIT)
+            report['cprofile'] = output.getvalue()
+        return report
+
+
+def make_profiler(mode, trace_memory=True):
+    # mode is '' (off) or one of PROFILE_MODES
+    if not mode:
+        return NULL_PROFILER
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"Unknown profile mode: {mode}")
+    return StageProfiler(trace_memory=trace_memory, use_cprofile=mode == 'cprofile')
@@ -0,0 +1,87 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .feedback_summary import get_summary
+from .lru import over_budget
+from .models import ReportCacheEntry, ReportGenerated
+
+
+def make_report_key(file_output, color_options):
+    # New or deleted feedback changes a count or the latest timestamp, so the
+    # key moves on without the cache having to be told
+    summary = get_summary(file_output.review_file_id)
+    parts = {'file_output': file_output.id, 'colors': list(color_options)}
+    for name, count, latest in (('ui_feedback', summary.interface_count, summary.interface_latest),
+                                ('review_feedback', summary.review_count, summary.review_latest)):
+        parts[name] = [count, latest.isoformat() if latest else None]
+    return hashlib.md5(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+
+def lookup(cache_key):
+    entry = ReportCacheEntry.objects.filter(cache_key=cache_key).first()
+    if entry is None:
+        return None
+    if not (default_storage.exists(entry.pdf_path.name) and default_storage.exists(entry.docx_path.name)):
+        # Files removed behind the cache's back
+        delete_entries(ReportCacheEntry.objects.filter(id=entry.id))
+        return None
+    ReportCacheEntry.objects.filter(id=entry.id).update(
+        hit_count=F('hit_count') + 1,
+        last_used_date=timezone.now(),
+    )
+    return entry
+
+
+def store(file_output, cache_key, pdf_path, docx_path):
+    entry, _ = ReportCacheEntry.objects.update_or_create(
+        cache_key=cache_key,
+        defaults={
+            'file_output': file_output,
+            'pdf_path': pdf_path,
+            'docx_path': docx_path,
+            'size_bytes': default_storage.size(pdf_path) + default_storage.size(docx_path),
+            'last_used_date': timezone.now(),
+        },
+    )
+    evict(keep=entry)
+    return entry
+
+
+def record(review_file, file_output, cache_key, pdf_path, docx_path):
+    # Logs freshly generated reports and caches them under cache_key
+    for path in (pdf_path, docx_path):
+        ReportGenerated.objects.create(review_file=review_file, file_path=path)
+    return store(file_output, cache_key, pdf_path, docx_path)
+
+
+def delete_entries(entries):
+    # Drops the entries together with their files and the ReportGenerated rows
+    # pointing at them
+    paths = []
+    for pdf_path, docx_path in entries.values_list('pdf_path', 'docx_path'):
+        paths += [pdf_path, docx_path]
+    if not paths:
+        return 0
+    with transaction.atomic():
+        ReportGenerated.objects.filter(file_path__in=paths).delete()
+        deleted, _ = entries.delete()
+        transaction.on_commit(lambda: [default_storage.delete(path) for path in paths])
+    return deleted
+
+
+def evict(keep=None):
+    # Least recently used reports go first once the stored files outgrow the
+    # budget
+    stale = over_budget(ReportCacheEntry.objects.all(), settings.REPORT_CACHE_MAX_BYTES, keep)
+    return delete_entries(ReportCacheEntry.objects.filter(id__in=stale))
+
+
+def invalidate(review_file_id):
+    # Reports of a file are out of date as soon as its feedback changes
+    return delete_entries(ReportCacheEntry.objects.filter(file_output__review_file_id=review_file_id))
@@ -0,0 +1,165 @@
+import re
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+from textblob.en import sentiment as pattern_sentiment
+from textblob._text import EMOTICONS
+
+# Words, optionally joined by hyphens ("5-star", "f*cking"). TextBlob's tokenizer
+# splits on apostrophes, so "isn't" becomes "isn" + "t" in both paths.
+WORD_PATTERN = r"\w+(?:[-*]\w+)*"
+# Emoticons only count when they stand on their own, as in TextBlob
+EMOTICON_PATTERN = r"(?<!\S)(?:%s)(?!\S)" % "|".join(
+    re.escape(e) for e in sorted({e.lower() for group in EMOTICONS.values() for e in group}, key=len, reverse=True)
+)
+# Exclamation marks boost the preceding assessment
+TOKEN_RE = re.compile(EMOTICON_PATTERN + "|" + WORD_PATTERN + "|!")
+# Sums closer to zero than this are assessments cancelling out, whose sign
+# depends on the order they are added in
+TIE_TOLERANCE = 1e-9
+
+
+class BatchSentimentScorer:
+    """Scores a whole Series of texts against TextBlob's pattern lexicon at once.
+
+    TextBlob averages the polarity of the known words in a text, so its label
+    only depends on the sign of their sum. Unigram polarities come from a
+    sparse document-term matrix multiplied by a precomputed lexicon polarity
+    vector. Modifiers ("very good"), negations ("not good") and exclamation
+    marks ("good!") are handled by adding a correction for each adjacent pair
+    and triple that starts with a modifier or negation, and for each run of
+    exclamation marks; corrections are computed once per distinct n-gram with
+    TextBlob's own assessment rules and memoized. Texts whose assessments
+    cancel out are left to TextBlob, as only its summation order decides them.
+    """
+
+    def __init__(self, batch_size=10000):
+        self.batch_size = batch_size
+        if dict.__len__(pattern_sentiment) == 0:
+            pattern_sentiment.load()
+
+        vocabulary = [w for w in dict.keys(pattern_sentiment) if re.fullmatch(WORD_PATTERN, w)]
+        vocabulary += [n for n in pattern_sentiment.negations if re.fullmatch(WORD_PATTERN, n)]
+        vocabulary += [e.lower() for group in EMOTICONS.values() for e in group]
+        self.terms = list(dict.fromkeys(vocabulary))
+        self.vocabulary = {term: index for index, term in enumerate(self.terms)}
+
+        self.polarity = np.array([self._assessed_polarity((term,)) for term in self.terms])
+        # Terms that produce an assessment of their own (lexicon words and emoticons)
+        self.assessed = np.array([
+            dict.__contains__(pattern_sentiment, term) or not re.fullmatch(WORD_PATTERN, term)
+            for term in self.terms
+        ])
+        # Terms that change how the following word is assessed
+        self.stateful = np.array([
+            term in pattern_sentiment.negations
+            or (dict.__contains__(pattern_sentiment, term) and 'RB' in pattern_sentiment[term])
+            for term in self.terms
+        ])
+        self._corrections = {}
+
+    def _assessed_polarity(self, terms):
+        assessments = pattern_sentiment.assessments([(term, None) for term in terms])
+        return sum(p for _, p, _, _ in assessments)
+
+    def _correction(self, ngram, exclamations=0):
+        # Difference between TextBlob's assessment of the n-gram and what the
+        # shorter n-grams already contribute (inclusion-exclusion).
+        key = (ngram, exclamations)
+        if key not in self._corrections:
+            if exclamations:
+                value = self._assessed_polarity(ngram + ('!',) * exclamations) - self._assessed_polarity(ngram)
+            elif len(ngram) == 2:
+                value = self._assessed_polarity(ngram) - self._assessed_polarity(ngram[:1]) - self._assessed_polarity(ngram[1:])
+            else:
+                value = (self._assessed_polarity(ngram) - self._assessed_polarity(ngram[:2])
+                         - self._assessed_polarity(ngram[1:]) + self._assessed_polarity(ngram[1:2]))
+            self._corrections[key] = value
+        return self._corrections[key]
+
+    def _ngram_scores(self, ids, docs, n, num_docs):
+        size = len(self.terms)
+        windows = [ids[k:len(ids) - n + 1 + k] for k in range(n)]
+        mask = docs[:len(docs) - n + 1] == docs[n - 1:]
+        for window in windows:
+            mask &= window >= 0
+        for window in windows[:-1]:
+            mask[mask] &= self.stateful[window[mask]]
+        if not mask.any():
+            return np.zeros(num_docs)
+
+        codes = np.zeros(mask.sum(), dtype=np.int64)
+        for window in windows:
+            codes = codes * size + window[mask]
+        unique_codes, inverse = np.unique(codes, return_inverse=True)
+        corrections = np.array([
+            self._correction(tuple(self.terms[i] for i in np.unravel_index(code, (size,) * n)))
+            for code in unique_codes
+        ])
+        return np.bincount(docs[:len(docs) - n + 1][mask], weights=corrections[inverse], minlength=num_docs)
+
+    def _exclamation_scores(self, ids, docs, positions, exclamation_positions, exclamation_docs, num_docs):
+        # Each run of "!" boosts the last assessment before it, which ends at the
+        # closest preceding lexicon word or emoticon of the same text.
+        assessed = np.flatnonzero((ids >= 0) & self.assessed[np.maximum(ids, 0)])
+        if not len(exclamation_positions) or not len(assessed):
+            return np.zeros(num_docs)
+        preceding = np.searchsorted(positions[assessed], exclamation_positions) - 1
+        targets = assessed[np.maximum(preceding, 0)]
+        valid = (preceding >= 0) & (docs[targets] == exclamation_docs)
+        targets, counts = np.unique(targets[valid], return_counts=True)
+
+        corrections = np.empty(len(targets))
+        for k, (target, count) in enumerate(zip(targets, counts)):
+            # Include the modifier or negation the assessment started with
+            start = target
+            while (target - start < 2 and start > 0 and docs[start - 1] == docs[target]
+                   and ids[start - 1] >= 0 and self.stateful[ids[start - 1]]):
+                start -= 1
+            ngram = tuple(self.terms[i] for i in ids[start:target + 1])
+            corrections[k] = self._correction(ngram, exclamations=int(count))
+        return np.bincount(docs[targets], weights=corrections, minlength=num_docs)
+
+    def polarity_sums(self, texts):
+        texts = pd.Series(np.asarray(texts, dtype=object)).astype(str).str.lower()
+        num_docs = len(texts)
+        tokens = texts.str.findall(TOKEN_RE).explode().dropna()
+        ids = tokens.map(self.vocabulary).fillna(-1).to_numpy(dtype=np.int64)
+        docs = tokens.index.to_numpy(dtype=np.int64)
+        exclamations = tokens.to_numpy() == '!'
+
+        # Unknown one-letter tokens (including "!") don't break a preceding
+        # negation ("not a good")
+        keep = (ids >= 0) | (tokens.str.len().to_numpy() > 1)
+        positions = np.flatnonzero(keep)
+        exclamation_positions = np.flatnonzero(exclamations)
+        exclamation_docs = docs[exclamations]
+        ids, docs = ids[keep], docs[keep]
+
+        known = ids >= 0
+        document_terms = csr_matrix(
+            (np.ones(known.sum()), (docs[known], ids[known])),
+            shape=(num_docs, len(self.terms)),
+        )
+        scores = document_terms @ self.polarity
+        scores += self._ngram_scores(ids, docs, 2, num_docs)
+        scores += self._ngram_scores(ids, docs, 3, num_docs)
+        scores += self._exclamation_scores(ids, docs, positions, exclamation_positions, exclamation_docs, num_docs)
+        return scores
+
+    def score(self, texts):
+        texts = pd.Series(texts)
+        labels = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = texts.iloc[start:start + self.batch_size]
+            scores = self.polarity_sums(batch)
+            # The sums add the same assessments as TextBlob in another order.
+            # Where they cancel out, TextBlob's left-to-right sum is float
+            # noise of either sign, so those few texts are summed by TextBlob
+            # itself to get exactly its label.
+            for i in np.flatnonzero(np.abs(scores) < TIE_TOLERANCE):
+                scores[i] = pattern_sentiment(str(batch.iloc[i]))[0]
+            labels.append(np.where(scores > 0, 'positive', np.where(scores < 0, 'negative', 'neutral')))
+        values = np.concatenate(labels) if labels else np.array([], dtype=object)
+        return pd.Series(values, index=texts.index, dtype=object)
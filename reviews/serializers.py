@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import CustomUser, ReviewFile, FileOutput, UserInterfaceFeedback, ReviewFeedback, ReportGenerated
+from .models import CustomUser, ReviewFile, FileOutput, FeedbackSummary, UserInterfaceFeedback, ReviewFeedback, ReportGenerated, ClassificationJob, CompareJob, ReportJob, ReviewResult
 
 from django.contrib.auth import get_user_model
 
@@ -24,6 +24,7 @@ class ReviewFileSerializer(serializers.ModelSerializer):
     class Meta:
         model = ReviewFile
         fields = '__all__'
+        read_only_fields = ('content_hash', 'blob')
 
 class FileOutputSerializer(serializers.ModelSerializer):
     review_file = ReviewFileSerializer()
@@ -47,9 +48,64 @@ class ReviewFeedbackSerializer(serializers.ModelSerializer):
         model = ReviewFeedback
         fields = ['review_file', 'star_rating', 'comment']
 
+# Bulk imports resolve review_file themselves, once per batch, so the item
+# serializers only validate the feedback fields
+
+class UserInterfaceFeedbackItemSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UserInterfaceFeedback
+        fields = ['comment']
+
+
+class ReviewFeedbackItemSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ReviewFeedback
+        fields = ['star_rating', 'comment']
+
 class ReportGeneratedSerializer(serializers.ModelSerializer):
     review_file = ReviewFileSerializer()
 
     class Meta:
         model = ReportGenerated
-        fields = ['review_file', 'file_path']
\ No newline at end of file
+        fields = ['review_file', 'file_path']
+
+class ClassificationJobSerializer(serializers.ModelSerializer):
+    job_id = serializers.UUIDField(source='unique_id', read_only=True)
+    review_file = serializers.PrimaryKeyRelatedField(read_only=True)
+    file_output = serializers.PrimaryKeyRelatedField(read_only=True)
+
+    class Meta:
+        model = ClassificationJob
+        fields = ['job_id', 'review_file', 'file_output', 'state', 'progress', 'error', 'cache_hit', 'reused_rows', 'profile_mode', 'created_date', 'updated_date']
+
+class ReviewResultSerializer(serializers.ModelSerializer):
+    # Read from the texts sidecar by the view
+    text = serializers.CharField(read_only=True)
+
+    class Meta:
+        model = ReviewResult
+        fields = ['row_index', 'text', 'sentiment', 'cluster', 'x', 'y']
+
+class ReportJobSerializer(serializers.ModelSerializer):
+    job_id = serializers.UUIDField(source='unique_id', read_only=True)
+    review_file = serializers.PrimaryKeyRelatedField(read_only=True)
+    file_output = serializers.PrimaryKeyRelatedField(read_only=True)
+
+    class Meta:
+        model = ReportJob
+        fields = ['job_id', 'review_file', 'file_output', 'state', 'stage', 'progress', 'error', 'cache_hit', 'created_date', 'updated_date']
+
+class CompareJobSerializer(serializers.ModelSerializer):
+    job_id = serializers.UUIDField(source='unique_id', read_only=True)
+
+    class Meta:
+        model = CompareJob
+        fields = ['job_id', 'file_ids', 'state', 'progress', 'error', 'created_date', 'updated_date']
+
+class FeedbackSummarySerializer(serializers.ModelSerializer):
+    mean_rating = serializers.FloatField(read_only=True)
+    histogram = serializers.DictField(child=serializers.IntegerField(), read_only=True)
+
+    class Meta:
+        model = FeedbackSummary
+        fields = ['review_file', 'review_count', 'mean_rating', 'histogram', 'review_latest', 'interface_count', 'interface_latest', 'updated_date']
@@ -0,0 +1,71 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import analysis_cache, feedback_summary, report_cache
+from .models import (AnalysisCacheEntry, FeedbackSummary, FileOutput, ReviewFeedback, ReviewFile, StoredBlob,
+                     UserInterfaceFeedback)
+
+
+@receiver(post_delete, sender=ReviewFile)
+def release_review_file_blob(sender, instance, **kwargs):
+    if instance.blob_id is not None:
+        StoredBlob.objects.release(instance.blob_id)
+
+
+@receiver(post_delete, sender=FileOutput)
+def release_output_analysis(sender, instance, **kwargs):
+    # Runs before the ReviewFile itself goes when the output is deleted with it
+    content_hash = ReviewFile.objects.filter(id=instance.review_file_id).values_list('content_hash', flat=True).first()
+    if content_hash:
+        transaction.on_commit(lambda: analysis_cache.release(content_hash, instance.params_key))
+
+
+@receiver(post_delete, sender=AnalysisCacheEntry)
+def release_cached_analysis(sender, instance, **kwargs):
+    transaction.on_commit(lambda: analysis_cache.release(instance.content_hash, instance.params_key))
+
+
+@receiver(post_save, sender=ReviewFile)
+def create_feedback_summary(sender, instance, created, **kwargs):
+    if created:
+        FeedbackSummary.objects.create(review_file=instance)
+
+
+@receiver(post_save, sender=ReviewFeedback)
+@receiver(post_save, sender=UserInterfaceFeedback)
+def update_feedback_summary(sender, instance, created, **kwargs):
+    if instance.review_file_id is None:
+        return
+    if created:
+        feedback_summary.record(sender, [instance])
+    else:
+        # An edit may have changed the rating
+        feedback_summary.rebuild(instance.review_file_id)
+
+
+@receiver(post_delete, sender=ReviewFeedback)
+@receiver(post_delete, sender=UserInterfaceFeedback)
+def rebuild_feedback_summary(sender, instance, **kwargs):
+    if instance.review_file_id is not None:
+        feedback_summary.rebuild(instance.review_file_id)
+
+
+@receiver(post_save, sender=ReviewFeedback)
+@receiver(post_save, sender=UserInterfaceFeedback)
+@receiver(post_delete, sender=ReviewFeedback)
+@receiver(post_delete, sender=UserInterfaceFeedback)
+def invalidate_cached_reports(sender, instance, **kwargs):
+    if instance.review_file_id is not None:
+        report_cache.invalidate(instance.review_file_id)
+
+
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
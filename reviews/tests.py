@@ -1,3 +1,1087 @@
-from django.test import TestCase
+import io
+import json
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import hashlib
+import tempfile
+import uuid
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+from docx import Document
+from docx.oxml.ns import qn
+from reportlab.lib.pagesizes import A4
+from sklearn.cluster import KMeans, MiniBatchKMeans
+
+from benchmarks.synthetic import reference_corpus
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from . import analysis_cache, feedback_summary, jobs, metrics, report_cache
+from .charts import ChartRenderer
+from .data_analyzer import DataAnalyzer
+from .downloads import file_response, parse_range
+from .feedback_import import FILE_NOT_UPLOADED
+from .models import (
+    AnalysisCacheEntry,
+    CompareJob,
+    ClassificationJob,
+    FeedbackSummary,
+    FileOutput,
+    HashingFile,
+    ReportCacheEntry,
+    ReportGenerated,
+    ReportJob,
+    ReviewFeedback,
+    ReviewFile,
+    ReviewResult,
+    ReviewResultSet,
+    StoredBlob,
+    UserInterfaceFeedback,
+)
+from .point_index import PointIndex
+from .profiling import NULL_PROFILER, make_profiler
+from .ReportGenerator import ReportGenerator
+
+SUMMARY = {'labels': ['Positive', 'Neutral', 'Negative'],
+           'datasets': [{'data': [5, 3, 2], 'percentages': [50.0, 30.0, 20.0]}]}
+ADJECTIVES = ['good', 'bad', 'great', 'awful', 'fine', 'broken', 'cheap', 'perfect']
+
+
+def reviews_csv(rows, offset=0):
+    # A small export whose reviews mix a few adjectives, so there is sentiment
+    # and clustering to find; offset shifts the mix to make a different file
+    lines = [f'Item {i},It is {ADJECTIVES[(i + offset) % 8]} and {ADJECTIVES[i * 3 % 8]}' for i in range(rows)]
+    return '\n'.join(['review_headline,review_body'] + lines) + '\n'
+
+
+def analysis_state(texts, sentiments, clusters):
+    # As much of an AnalysisState as store_review_results reads
+    return SimpleNamespace(texts=pd.Series(texts), sentiments=np.array(sentiments, dtype=np.int8),
+                           clusters=np.array(clusters, dtype=np.int32),
+                           coordinates=np.arange(2 * len(texts), dtype=np.float32).reshape(-1, 2))
+
+
+class TempMediaMixin:
+    """Sends uploads, analysis sidecars, reports and metrics to a temporary
+    directory instead of the project's."""
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root,
+                                              METRICS_DB_PATH=os.path.join(self.media_root, 'metrics.sqlite3'))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def upload(self, name='reviews.csv', content=b'review_headline,review_body\nGood,Works well\n'):
+        return ReviewFile.objects.create(user_email='tester@example.com', file=SimpleUploadedFile(name, content))
+
+    def post_json(self, url, data):
+        return self.client.post(url, json.dumps(data), content_type='application/json')
+
+
+class SqlitePragmaTests(TestCase):
+    def test_pragmas_applied_on_connect(self):
+        with connection.cursor() as cursor:
+            self.assertEqual(cursor.execute('PRAGMA synchronous').fetchone()[0], 1)
+            self.assertEqual(cursor.execute('PRAGMA cache_size').fetchone()[0], -64000)
+            self.assertEqual(cursor.execute('PRAGMA temp_store').fetchone()[0], 2)
+
+
+def fail_as_stale(job):
+    # What the stale job sweep does to a job that has not moved for too long
+    job_model = type(job)
+    job_model.objects.filter(id=job.id).update(
+        updated_date=timezone.now() - timedelta(seconds=settings.JOB_STALE_SECONDS + 1))
+    return jobs.fail_stale_job(job_model.objects.get(id=job.id))
+
+
+class BrokenPool:
+    _broken = 'A child process terminated abruptly'
+
+    def __init__(self):
+        self.shut_down = False
+
+    def submit(self, *args):
+        raise BrokenProcessPool(self._broken)
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shut_down = True
+
+
+class InlinePool:
+    """Runs each task as it is submitted, so a job and the tasks it queues
+    have finished when the submitting call returns."""
+
+    _broken = False
+
+    def submit(self, fn, *args):
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+class JobTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.review_file = self.upload()
+        self.addCleanup(setattr, jobs, '_executor', None)
+
+    def test_broken_pool_is_replaced(self):
+        broken = jobs._executor = BrokenPool()
+        with mock.patch('reviews.jobs.create_executor', return_value='new pool') as create_executor, \
+                self.assertLogs('reviews.jobs', 'WARNING'):
+            self.assertEqual(jobs.get_executor(), 'new pool')
+        self.assertTrue(broken.shut_down)
+        create_executor.assert_called_once()
+
+    def test_failed_submit_fails_the_job(self):
+        job = ClassificationJob.objects.create(review_file=self.review_file)
+        with mock.patch('reviews.jobs.get_executor', return_value=BrokenPool()):
+            with self.assertLogs('reviews.jobs', 'ERROR'), self.captureOnCommitCallbacks(execute=True):
+                jobs.submit_classification_job(job)
+        job.refresh_from_db()
+        self.assertEqual(job.state, ClassificationJob.FAILED)
+        self.assertIn('terminated abruptly', job.error)
+
+    def test_stale_jobs_fail(self):
+        stale = ClassificationJob.objects.create(review_file=self.review_file)
+        fresh = ClassificationJob.objects.create(review_file=self.review_file)
+        report = ReportJob.objects.create(review_file=self.review_file, state=ReportJob.RUNNING)
+        long_ago = timezone.now() - timedelta(seconds=settings.JOB_STALE_SECONDS + 1)
+        ClassificationJob.objects.filter(id=stale.id).update(updated_date=long_ago)
+        ReportJob.objects.filter(id=report.id).update(updated_date=long_ago)
+
+        self.assertEqual(self.client.get(f'/classify-data/{stale.unique_id}/').json()['state'], ClassificationJob.FAILED)
+        self.assertEqual(self.client.get(f'/classify-data/{fresh.unique_id}/').json()['state'], ClassificationJob.PENDING)
+        jobs.fail_stale_jobs()
+        report.refresh_from_db()
+        self.assertEqual((report.state, report.error), (ReportJob.FAILED, jobs.STALE_JOB_ERROR))
+
+    def test_slow_job_failed_as_stale_stays_failed(self):
+        review_file = self.upload('slow.csv', reviews_csv(30).encode())
+        job = ClassificationJob.objects.create(review_file=review_file)
+        analyze_and_store = jobs.analyze_and_store
+
+        def analyze_slowly(*args, **kwargs):
+            self.assertTrue(fail_as_stale(job))
+            return analyze_and_store(*args, **kwargs)
+
+        with mock.patch('reviews.jobs.analyze_and_store', side_effect=analyze_slowly), \
+                self.assertLogs('reviews.jobs', 'WARNING'):
+            jobs.run_classification_job(job.id)
+        job.refresh_from_db()
+        self.assertEqual((job.state, job.error, job.file_output), (ClassificationJob.FAILED, jobs.STALE_JOB_ERROR, None))
+
+
+class EndpointQueryCountTests(TempMediaMixin, TestCase):
+    """Number of queries each endpoint runs, so that an N+1 or a lost index
+    shortcut shows up as a failure rather than as a slow page."""
+
+    def setUp(self):
+        super().setUp()
+        self.review_file = self.upload()
+        result_set = analysis_cache.store_review_results(self.review_file.content_hash, 'p', analysis_state(
+            [f'review {i}' for i in range(3)], [0, 0, 0], [0, 1, 0]))
+        self.file_output = FileOutput.objects.create(review_file=self.review_file, review_text='Reviews.',
+                                                     sentiment_summary=SUMMARY, params_key='p', result_set=result_set)
+
+    def test_upload_review_file(self):
+        upload = SimpleUploadedFile('more.csv', b'review_headline,review_body\nBad,Broke\n')
+        # The blob is inserted in a savepoint, to fall back on a concurrent duplicate
+        with self.assertNumQueries(8):
+            response = self.client.post('/upload-review-file/', {'file': upload, 'user_email': 'tester@example.com',
+                                                                  'file_name': 'more.csv'})
+        self.assertEqual(response.status_code, 201)
+
+    def test_review_feedback(self):
+        with self.assertNumQueries(5):
+            response = self.post_json('/reviewfeedback/', {
+                'review_file': str(self.review_file.unique_id), 'star_rating': 4, 'comment': 'Useful'})
+        self.assertEqual(response.status_code, 201)
+
+    def test_interface_feedback(self):
+        with self.assertNumQueries(5):
+            response = self.post_json('/interfacefeedback/', {
+                'review_file': str(self.review_file.unique_id), 'comment': 'Clear'})
+        self.assertEqual(response.status_code, 201)
+
+    def test_bulk_feedback_does_not_grow_with_items(self):
+        for count in (10, 200):
+            items = [{'review_file': str(self.review_file.unique_id), 'star_rating': 1 + i % 5, 'comment': f'c{i}'}
+                     for i in range(count)]
+            with self.assertNumQueries(6):
+                response = self.post_json('/reviewfeedback/bulk/', items)
+            self.assertEqual(response.json()['created'], count)
+
+    def test_classification_status(self):
+        job = ClassificationJob.objects.create(review_file=self.review_file, state=ClassificationJob.RUNNING)
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/classify-data/{job.unique_id}/')
+        self.assertEqual(response.json()['state'], ClassificationJob.RUNNING)
+
+    def test_review_results_page(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/review-results/{self.file_output.id}/', {'limit': 2})
+        self.assertEqual([result['text'] for result in response.json()['results']], ['review 0', 'review 1'])
+        self.assertEqual(response.json()['next_after'], 1)
+
+    def test_generate_report_data_cache_hit(self):
+        pdf_path = default_storage.save('reports/report.pdf', ContentFile(b'%PDF-'))
+        docx_path = default_storage.save('reports/report.docx', ContentFile(b'PK'))
+        colors = ['#FF6384', '#36A2EB', '#FFCE56']
+        report_cache.store(self.file_output, report_cache.make_report_key(self.file_output, colors),
+                           pdf_path, docx_path)
+        with self.assertNumQueries(5):
+            response = self.client.get('/generatereportdata/', {
+                'review_file_id': self.review_file.id, 'colorOptions[]': colors})
+        self.assertEqual(response.json()['pdf_path'], default_storage.url(pdf_path))
+
+    def test_report_job_status_and_download(self):
+        pdf_path = default_storage.save('reports/report.pdf', ContentFile(b'%PDF-1.4 report'))
+        job = ReportJob.objects.create(review_file=self.review_file, file_output=self.file_output,
+                                       state=ReportJob.COMPLETED, stage=ReportJob.DONE, progress=100,
+                                       pdf_path=pdf_path)
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/report-jobs/{job.unique_id}/')
+        self.assertEqual(response.json()['stage'], ReportJob.DONE)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(response.json()['pdf_path'], HTTP_RANGE='bytes=0-3')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'%PDF')
+
+    def test_feedback_summary(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/feedback-summary/{self.review_file.id}/')
+        self.assertEqual(response.json()['review_count'], 0)
+
+    def test_feedback_indexes(self):
+        for model in (ReviewFeedback, UserInterfaceFeedback):
+            with connection.cursor() as cursor:
+                constraints = connection.introspection.get_constraints(cursor, model._meta.db_table)
+            self.assertIn(['review_file_id', 'created_date'],
+                          [constraint['columns'] for constraint in constraints.values() if constraint['index']])
+
+
+class DownloadTests(TempMediaMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.name = default_storage.save('reports/report.pdf', ContentFile(b'0123456789'))
+
+    def download(self, **headers):
+        response = file_response(RequestFactory().get('/', headers=headers), self.name)
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        response.close()
+        return response, content
+
+    def test_parse_range(self):
+        self.assertEqual(parse_range('bytes=2-4', 10), (2, 4))
+        self.assertEqual(parse_range('bytes=8-', 10), (8, 9))
+        self.assertEqual(parse_range('bytes=5-100', 10), (5, 9))
+        # Suffix ranges count from the end, and may ask for more than there is
+        self.assertEqual(parse_range('bytes=-3', 10), (7, 9))
+        self.assertEqual(parse_range('bytes=-30', 10), (0, 9))
+        for header in (None, '', 'bytes=-', 'bytes=0-1,4-5', 'items=0-1', 'bytes=5-2'):
+            self.assertIsNone(parse_range(header, 10))
+        for header in ('bytes=10-', 'bytes=12-20', 'bytes=-0'):
+            with self.assertRaises(ValueError):
+                parse_range(header, 10)
+
+    def test_ranges(self):
+        response, content = self.download(Range='bytes=-4')
+        self.assertEqual((response.status_code, response['Content-Range'], content), (206, 'bytes 6-9/10', b'6789'))
+        response, _ = self.download(Range='bytes=10-')
+        self.assertEqual((response.status_code, response['Content-Range']), (416, 'bytes */10'))
+
+    def test_if_range(self):
+        etag = self.download()[0]['ETag']
+        response, content = self.download(Range='bytes=0-1', **{'If-Range': etag})
+        self.assertEqual((response.status_code, content), (206, b'01'))
+        # The file changed since the client got its first part: send all of it
+        response, content = self.download(Range='bytes=0-1', **{'If-Range': '"report.pdf-4-0"'})
+        self.assertEqual((response.status_code, content), (200, b'0123456789'))
+
+
+class StoredBlobTests(TempMediaMixin, TestCase):
+    CONTENT = reviews_csv(5).encode()
+
+    def test_identical_uploads_share_a_blob(self):
+        first = self.upload('a.csv', self.CONTENT)
+        second = self.upload('b.csv', self.CONTENT)
+        other = self.upload('c.csv', reviews_csv(5, 1).encode())
+        blob = first.blob
+        self.assertEqual(second.blob_id, blob.id)
+        self.assertNotEqual(other.blob_id, blob.id)
+        self.assertEqual(first.content_hash, hashlib.md5(self.CONTENT).hexdigest())
+        self.assertEqual((blob.ref_count, blob.size), (1, len(self.CONTENT)))
+        blob.refresh_from_db()
+        self.assertEqual(blob.ref_count, 2)
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'uploads', 'tmp')), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        blob.refresh_from_db()
+        self.assertEqual(blob.ref_count, 1)
+        self.assertTrue(default_storage.exists(blob.file.name))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(StoredBlob.objects.filter(id=blob.id).exists())
+        self.assertFalse(default_storage.exists(blob.file.name))
+
+    def test_hashes_reads_as_well_as_chunks(self):
+        content = HashingFile(SimpleUploadedFile('a.csv', self.CONTENT))
+        content.read(10)
+        content.seek(0)
+        self.assertEqual(content.read(), self.CONTENT)
+        self.assertEqual(content.md5.hexdigest(), hashlib.md5(self.CONTENT).hexdigest())
+        self.assertEqual(content.hashed_size, len(self.CONTENT))
+
+    def test_rehashes_when_storage_bypasses_the_wrapper(self):
+        with mock.patch.object(HashingFile, '_update'):
+            review_file = self.upload('a.csv', self.CONTENT)
+        self.assertEqual(review_file.content_hash, hashlib.md5(self.CONTENT).hexdigest())
+        self.assertEqual(review_file.blob.size, len(self.CONTENT))
+
+    def test_concurrent_duplicate_takes_a_reference(self):
+        first = self.upload('a.csv', self.CONTENT)
+        # As if the other upload committed its blob after this one looked for it
+        add_reference = StoredBlob.objects._add_reference
+        lookups = [None]
+
+        def racing_add_reference(content_hash):
+            return lookups.pop() if lookups else add_reference(content_hash)
+
+        with mock.patch.object(StoredBlob.objects, '_add_reference', side_effect=racing_add_reference):
+            second = self.upload('b.CSV', self.CONTENT)
+        self.assertEqual(second.blob_id, first.blob_id)
+        self.assertEqual(StoredBlob.objects.get().ref_count, 2)
+        self.assertTrue(default_storage.exists(first.file.name))
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'uploads', 'tmp')), [])
+
+
+class ReviewResultsTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.review_file = self.upload()
+        texts = [f'review {i} ✓' if i % 3 else f'review {i}' for i in range(12)]
+        self.result_set = analysis_cache.store_review_results(self.review_file.content_hash, 'p', analysis_state(
+            texts, [i % 3 for i in range(12)], [i % 2 for i in range(12)]))
+        self.file_output = FileOutput.objects.create(review_file=self.review_file, review_text='Reviews.',
+                                                     sentiment_summary=SUMMARY, params_key='p',
+                                                     result_set=self.result_set)
+
+    def pages(self, **params):
+        # row_index and text of every row, following next_after page by page
+        rows, after = [], -1
+        while after is not None:
+            response = self.client.get(f'/review-results/{self.file_output.id}/', {**params, 'after': after})
+            self.assertEqual(response.status_code, 200)
+            rows += [(result['row_index'], result['text']) for result in response.json()['results']]
+            after = response.json()['next_after']
+        return rows
+
+    def test_rows_point_at_their_text(self):
+        self.assertTrue(self.result_set.complete)
+        self.assertEqual(self.result_set.results.count(), 12)
+        self.assertEqual(self.pages(limit=5), [(i, f'review {i} ✓' if i % 3 else f'review {i}') for i in range(12)])
+
+    def test_keyset_pages_with_filters(self):
+        self.assertEqual([row for row, _ in self.pages(limit=2, sentiment='Negative')], [1, 4, 7, 10])
+        self.assertEqual([row for row, _ in self.pages(limit=3, cluster=1)], [1, 3, 5, 7, 9, 11])
+        self.assertEqual(self.pages(limit=1, sentiment='neutral', cluster=0), [(2, 'review 2 ✓'), (8, 'review 8 ✓')])
+        self.assertEqual(self.client.get(f'/review-results/{self.file_output.id}/', {'limit': 'x'}).status_code, 400)
+
+    def test_released_with_last_output_or_cache_entry(self):
+        texts_name = analysis_cache.texts_name(self.review_file.content_hash, 'p')
+        AnalysisCacheEntry.objects.create(content_hash=self.review_file.content_hash, params_key='p', result={})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.file_output.delete()
+        # Still cached
+        self.assertTrue(ReviewResultSet.objects.filter(id=self.result_set.id).exists())
+        with self.captureOnCommitCallbacks(execute=True):
+            AnalysisCacheEntry.objects.all().delete()
+        self.assertFalse(ReviewResultSet.objects.filter(id=self.result_set.id).exists())
+        self.assertFalse(ReviewResult.objects.exists())
+        self.assertFalse(default_storage.exists(texts_name))
+
+
+@override_settings(ANALYSIS_MAX_CLUSTER_POINTS=100, CLUSTER_POINTS_MAX_BINS=64)
+class ClusterPointsTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.review_file = self.upload()
+        coordinates = np.random.default_rng(0).normal(size=(2000, 2))
+        point_index = PointIndex.build(coordinates, np.arange(2000) % 3)
+        points_file = analysis_cache.save_point_index(self.review_file.content_hash, 'p', point_index)
+        self.addCleanup(analysis_cache.load_point_index.cache_clear)
+        self.file_output = FileOutput.objects.create(review_file=self.review_file, review_text='Reviews.',
+                                                     sentiment_summary=SUMMARY, params_key='p',
+                                                     points_file=points_file)
+
+    def get(self, **params):
+        return self.client.get(f'/cluster-points/{self.file_output.id}/', params)
+
+    def test_response_size_is_bounded(self):
+        points = self.get(mode='points', max_points=1000).json()
+        self.assertEqual((points['total'], points['sampled'], len(points['points'])), (2000, True, 100))
+        bins = self.get(mode='bins', zoom=9).json()
+        self.assertLessEqual(len(bins['bins']), 64)
+        self.assertEqual(sum(entry['count'] for entry in bins['bins']), 2000)
+
+    def test_sample_is_stable_across_requests_and_zoom(self):
+        def sample(**viewport):
+            return {(point['x'], point['y']) for point in self.get(mode='points', **viewport).json()['points']}
+
+        whole = sample()
+        self.assertEqual(sample(), whole)
+        # Zooming in keeps every sampled point that is still in view
+        zoomed = sample(x_min=-1, x_max=1, y_min=-1, y_max=1)
+        self.assertEqual(len(zoomed), 100)
+        self.assertLessEqual({(x, y) for x, y in whole if -1 <= x <= 1 and -1 <= y <= 1}, zoomed)
+
+    def test_rejects_non_finite_bounds(self):
+        for value in ('nan', 'inf', '-inf'):
+            response = self.get(x_min=value, x_max=1, y_min=-1, y_max=1)
+            self.assertEqual(response.status_code, 400)
+
+
+class AnalysisCacheTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.review_file = self.upload(content=reviews_csv(40).encode())
+
+    def classify(self):
+        job = ClassificationJob.objects.create(review_file=self.review_file)
+        jobs.run_classification_job(job.id)
+        job.refresh_from_db()
+        return job
+
+    def test_result_survives_eviction(self):
+        job = self.classify()
+        entry = job.analysis
+        params_key = entry.params_key
+        names = [name(self.review_file.content_hash, params_key) for name in (
+            analysis_cache.state_name, analysis_cache.point_index_name, analysis_cache.texts_name)]
+        # The entry counts its sidecars and rows, not only the JSON
+        self.assertGreater(entry.size_bytes, len(json.dumps(entry.result)) + 40 * analysis_cache.REVIEW_RESULT_ROW_BYTES)
+
+        with override_settings(ANALYSIS_CACHE_MAX_BYTES=0), self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(analysis_cache.evict(), 1)
+        response = self.client.get(f'/classify-data/{job.unique_id}/')
+        self.assertEqual(response.json()['classified_data']['review_text'], entry.result['review_text'])
+        # The output still uses the sidecars and rows
+        self.assertTrue(all(default_storage.exists(name) for name in names))
+        self.assertEqual(ReviewResult.objects.count(), 40)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.review_file.delete()
+        self.assertFalse(any(default_storage.exists(name) for name in names))
+        self.assertFalse(ReviewResultSet.objects.exists())
+
+    def test_cache_hit_keeps_its_own_result(self):
+        self.classify()
+        copy = self.upload('copy.csv', reviews_csv(40).encode())
+        job = jobs.start_classification(copy)
+        self.assertTrue(job.cache_hit)
+        AnalysisCacheEntry.objects.all().delete()
+        job = ClassificationJob.objects.get(id=job.id)
+        self.assertEqual(sum(job.result['sentiment_summary']['datasets'][0]['data']), 40)
+
+
+class ReportCacheTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.review_file = self.upload()
+        self.file_output = FileOutput.objects.create(review_file=self.review_file, review_text='Reviews.',
+                                                     sentiment_summary=SUMMARY)
+
+    def record(self, colors):
+        cache_key = report_cache.make_report_key(self.file_output, colors)
+        pdf_path = default_storage.save('reports/report.pdf', ContentFile(b'%PDF-1.4'))
+        docx_path = default_storage.save('reports/report.docx', ContentFile(b'PK'))
+        return report_cache.record(self.review_file, self.file_output, cache_key, pdf_path, docx_path)
+
+    def assertDropped(self, entry):
+        self.assertFalse(ReportCacheEntry.objects.filter(id=entry.id).exists())
+        self.assertFalse(ReportGenerated.objects.filter(file_path__in=[entry.pdf_path.name, entry.docx_path.name]).exists())
+        self.assertFalse(default_storage.exists(entry.pdf_path.name))
+        self.assertFalse(default_storage.exists(entry.docx_path.name))
+
+    def test_feedback_invalidates_reports(self):
+        entry = self.record(['#FF6384'])
+        self.assertEqual(report_cache.lookup(entry.cache_key), entry)
+        with self.captureOnCommitCallbacks(execute=True):
+            ReviewFeedback.objects.create(review_file=self.review_file, comment='c', star_rating=2)
+        self.assertDropped(entry)
+        self.assertNotEqual(report_cache.make_report_key(self.file_output, ['#FF6384']), entry.cache_key)
+
+    def test_lookup_drops_entry_with_missing_files(self):
+        entry = self.record(['#FF6384'])
+        default_storage.delete(entry.pdf_path.name)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertIsNone(report_cache.lookup(entry.cache_key))
+        self.assertDropped(entry)
+
+    def test_evicts_least_recently_used(self):
+        # Each entry takes 10 bytes, so two fit
+        with self.settings(REPORT_CACHE_MAX_BYTES=25), self.captureOnCommitCallbacks(execute=True):
+            oldest, used = self.record(['#000000']), self.record(['#111111'])
+            ReportCacheEntry.objects.filter(id=oldest.id).update(last_used_date=timezone.now() - timedelta(hours=1))
+            newest = self.record(['#222222'])
+        self.assertDropped(oldest)
+        self.assertEqual(set(ReportCacheEntry.objects.values_list('id', flat=True)), {used.id, newest.id})
+
+
+class ChartRendererTests(SimpleTestCase):
+    def setUp(self):
+        self.renderer = ChartRenderer(cache_size=2)
+        patcher = mock.patch.object(self.renderer, '_draw', side_effect=lambda chart_type, *args: chart_type.encode())
+        self.draw = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_repeated_render_is_a_cache_hit(self):
+        first = self.renderer.pie_chart([5, 3, 2], ['a', 'b', 'c'], ['#FF6384'])
+        self.assertEqual(self.renderer.pie_chart([5, 3, 2], ['a', 'b', 'c'], ['#FF6384']), first)
+        self.assertEqual(self.draw.call_count, 1)
+
+    def test_colors_are_keyed_separately(self):
+        self.renderer.bar_chart([5, 3, 2], ['a', 'b', 'c'], ['#FF6384'])
+        self.renderer.bar_chart([5, 3, 2], ['a', 'b', 'c'], ['#36A2EB'])
+        self.renderer.bar_chart([5, 3, 2], ['a', 'b', 'c'])
+        self.assertEqual([call.args[3] for call in self.draw.call_args_list], [['#FF6384'], ['#36A2EB'], None])
+
+    def test_evicts_least_recently_used(self):
+        for colors in (['#000000'], ['#111111'], ['#000000'], ['#222222']):
+            self.renderer.pie_chart([1], ['a'], colors)
+        # '#111111' was used least recently when '#222222' made three
+        self.assertEqual(self.draw.call_count, 3)
+        self.renderer.pie_chart([1], ['a'], ['#000000'])
+        self.assertEqual(self.draw.call_count, 3)
+        self.renderer.pie_chart([1], ['a'], ['#111111'])
+        self.assertEqual(self.draw.call_count, 4)
+
+
+class ReportGeneratorTests(TempMediaMixin, TestCase):
+    ROWS = 1200
+
+    def setUp(self):
+        super().setUp()
+        self.review_file = self.upload()
+        file_output = FileOutput.objects.create(review_file=self.review_file, review_text='Reviews.',
+                                                sentiment_summary=SUMMARY)
+        ReviewFeedback.objects.bulk_create(ReviewFeedback(review_file=self.review_file, comment=f'comment {i}',
+                                                          star_rating=1 + i % 5) for i in range(self.ROWS))
+        self.generator = jobs.report_generator(file_output, ['#FF6384', '#36A2EB', '#FFCE56'])
+        self.feedbacks = ReviewFeedback.objects.filter(review_file=self.review_file)
+
+    def test_pdf_tables_repeat_their_header(self):
+        flowables = list(self.generator.feedback_table_flowables(self.feedbacks, 'Review Feedback', True))
+        tables = flowables[1:]
+        header = ['Comment', 'Created Date', 'Rating']
+        self.assertEqual([len(table._cellvalues) - 1 for table in tables], [500, 500, 200])
+        self.assertEqual([table._cellvalues[1][0] for table in tables], ['comment 0', 'comment 500', 'comment 1000'])
+        for table in tables:
+            self.assertEqual((table.repeatRows, table._cellvalues[0]), (1, header))
+        # A table split across pages starts every part with the header
+        parts = tables[0].split(A4[0], 400)
+        self.assertEqual([part._cellvalues[0] for part in parts], [header, header])
+
+        path = self.generator.generate_report('pdf')
+        with default_storage.open(path) as pdf:
+            self.assertEqual(pdf.read(4), b'%PDF')
+
+    def test_docx_table_repeats_its_header(self):
+        path = self.generator.generate_report('docx')
+        with default_storage.open(path) as docx_file:
+            table = Document(docx_file).tables[-1]
+        self.assertEqual(len(table.rows), self.ROWS + 1)
+        self.assertEqual([cell.text for cell in table.rows[0].cells], ['Comment', 'Created Date', 'Rating'])
+        self.assertEqual([cell.text for cell in table.rows[-1].cells][::2], [f'comment {self.ROWS - 1}', '5'])
+        header_rows = [index for index, row in enumerate(table.rows)
+                       if row._tr.trPr is not None and row._tr.trPr.find(qn('w:tblHeader')) is not None]
+        self.assertEqual(header_rows, [0])
+        shading = table.rows[0].cells[0]._tc.tcPr.find(qn('w:shd'))
+        self.assertEqual(shading.get(qn('w:fill')), 'D3D3D3')
+
+
+class ReportJobTests(TempMediaMixin, TestCase):
+    COLORS = ['#FF6384', '#36A2EB', '#FFCE56']
+
+    def setUp(self):
+        super().setUp()
+        self.review_file = self.upload()
+        self.file_output = FileOutput.objects.create(review_file=self.review_file, review_text='Reviews.',
+                                                     sentiment_summary=SUMMARY)
+        # Without a cache every chart asked for is drawn
+        self.renderer = ChartRenderer(cache_size=0)
+        for patcher in (mock.patch('reviews.jobs.get_executor', return_value=InlinePool()),
+                        mock.patch('reviews.ReportGenerator.chart_renderer', self.renderer)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def start_report(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            job = jobs.start_report(self.review_file, self.file_output, self.COLORS)
+        job.refresh_from_db()
+        return job
+
+    def test_writers_share_one_chart_render(self):
+        with mock.patch.object(self.renderer, '_draw', wraps=self.renderer._draw) as draw:
+            job = self.start_report()
+        self.assertEqual(sorted(call.args[0] for call in draw.call_args_list), ['bar', 'pie'])
+        self.assertEqual((job.state, job.stage, job.progress), (ReportJob.COMPLETED, ReportJob.DONE, 100))
+        with default_storage.open(job.pdf_path.name) as pdf, default_storage.open(job.docx_path.name) as docx:
+            self.assertEqual((pdf.read(4), docx.read(2)), (b'%PDF', b'PK'))
+        entry = ReportCacheEntry.objects.get()
+        self.assertEqual((entry.pdf_path, entry.docx_path), (job.pdf_path, job.docx_path))
+        self.assertEqual(ReportGenerated.objects.count(), 2)
+
+    def test_job_failed_while_writing_stays_failed(self):
+        # The PDF writer has finished when the job is failed as stale, the
+        # DOCX writer is still going
+        generate_docx_report = ReportGenerator.generate_docx_report
+
+        def write_slowly(generator):
+            self.assertTrue(fail_as_stale(ReportJob.objects.get()))
+            return generate_docx_report(generator)
+
+        with mock.patch.object(ReportGenerator, 'generate_docx_report', autospec=True, side_effect=write_slowly):
+            job = self.start_report()
+        self.assertEqual((job.state, job.error), (ReportJob.FAILED, jobs.STALE_JOB_ERROR))
+        self.assertFalse(ReportCacheEntry.objects.exists())
+        self.assertEqual([name for name in default_storage.listdir('')[1] if name.startswith('report_')], [])
+
+
+class FeedbackSummaryTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.review_file = self.upload()
+        self.unique_id = str(self.review_file.unique_id)
+
+    def assert_matches_rows(self):
+        # The incrementally updated summary equals one aggregated from scratch
+        summary = FeedbackSummary.objects.get(review_file=self.review_file)
+        fields = feedback_summary.aggregate_fields(ReviewFeedback.objects.filter(review_file=self.review_file),
+                                                   UserInterfaceFeedback.objects.filter(review_file=self.review_file))
+        self.assertEqual({name: getattr(summary, name) for name in fields}, fields)
+        return summary
+
+    def test_single_and_bulk_inserts(self):
+        for rating in (5, 4, 4):
+            self.client.post('/reviewfeedback/', json.dumps({'review_file': self.unique_id, 'star_rating': rating,
+                                                             'comment': 'Single'}), content_type='application/json')
+        items = [{'review_file': self.unique_id, 'star_rating': 1 + i % 5, 'comment': f'c{i}'} for i in range(12)]
+        self.client.post('/reviewfeedback/bulk/', json.dumps(items), content_type='application/json')
+        self.client.post('/interfacefeedback/bulk/', '\n'.join(
+            json.dumps({'review_file': self.unique_id, 'comment': 'ui'}) for _ in range(3)),
+            content_type='application/x-ndjson')
+
+        summary = self.assert_matches_rows()
+        self.assertEqual(summary.review_count, 15)
+        self.assertEqual(summary.interface_count, 3)
+        self.assertEqual(summary.histogram, {'1': 3, '2': 3, '3': 2, '4': 4, '5': 3})
+        self.assertAlmostEqual(summary.mean_rating, (5 + 4 + 4 + sum(1 + i % 5 for i in range(12))) / 15)
+
+    def test_edit_and_delete_rebuild(self):
+        feedbacks = [ReviewFeedback.objects.create(review_file=self.review_file, comment='c', star_rating=rating)
+                     for rating in (1, 2, 3)]
+        feedbacks[0].star_rating = 5
+        feedbacks[0].save()
+        feedbacks[1].delete()
+        summary = self.assert_matches_rows()
+        self.assertEqual((summary.review_count, summary.rating_sum), (2, 8))
+
+    def test_missing_summary_is_rebuilt(self):
+        ReviewFeedback.objects.create(review_file=self.review_file, comment='c', star_rating=3)
+        FeedbackSummary.objects.filter(review_file=self.review_file).delete()
+        response = self.client.get(f'/feedback-summary/{self.review_file.id}/')
+        self.assertEqual(response.json()['histogram']['3'], 1)
+        self.assertEqual(self.client.get('/feedback-summary/0/').status_code, 404)
+
+
+@override_settings(FEEDBACK_BULK_BATCH_SIZE=2)
+class FeedbackImportTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.review_file = self.upload()
+
+    def test_errors_are_reported_per_item(self):
+        unique_id = str(self.review_file.unique_id)
+        lines = [
+            json.dumps({'review_file': unique_id, 'star_rating': 5, 'comment': 'Great'}),
+            '{"review_file": ',
+            json.dumps({'review_file': str(uuid.uuid4()), 'star_rating': 4, 'comment': 'Unknown file'}),
+            '',
+            json.dumps({'review_file': unique_id, 'star_rating': 7, 'comment': 'Out of range'}),
+            json.dumps(['not', 'an', 'object']),
+            json.dumps({'review_file': unique_id, 'star_rating': 2, 'comment': 'Meh'}),
+        ]
+        response = self.client.post('/reviewfeedback/bulk/', '\n'.join(lines), content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        self.assertEqual((data['created'], data['failed']), (2, 4))
+        # Blank lines are skipped, so indexes count items
+        errors = {error['index']: error['errors'] for error in data['errors']}
+        self.assertEqual(sorted(errors), [1, 2, 3, 4])
+        self.assertTrue(errors[1]['non_field_errors'][0].startswith('Invalid JSON'))
+        self.assertEqual(errors[2], {'review_file': [FILE_NOT_UPLOADED]})
+        self.assertEqual(list(errors[3]), ['star_rating'])
+        self.assertIn('non_field_errors', errors[4])
+        self.assertEqual(sorted(ReviewFeedback.objects.values_list('star_rating', flat=True)), [2, 5])
+        self.assertEqual(FeedbackSummary.objects.get(review_file=self.review_file).review_count, 2)
+
+    def test_all_items_failing_is_a_bad_request(self):
+        response = self.post_json('/reviewfeedback/bulk/', [{'review_file': 'nope', 'star_rating': 0}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'], [{'index': 0, 'errors': {'review_file': [FILE_NOT_UPLOADED]}}])
+
+
+def reference_texts(rows):
+    # The corpus benchmarks.sentiment_engines measures agreement on, as the
+    # analyzer concatenates it
+    corpus = reference_corpus(rows)
+    return corpus['review_headline'] + ' ' + corpus['review_body']
+
+
+class SentimentTests(SimpleTestCase):
+    def test_batch_labels_match_textblob(self):
+        # 2000 rows hold texts whose assessments cancel out, where only
+        # TextBlob's summation order decides the label
+        texts = reference_texts(2000)
+        batch = DataAnalyzer(sentiment_engine='batch').score_sentiment(texts)
+        textblob = DataAnalyzer(sentiment_engine='textblob').score_sentiment(texts)
+        # apply() keeps the str dtype of the texts, the scorer builds labels as objects
+        pd.testing.assert_series_equal(batch, textblob, check_dtype=False)
+        self.assertEqual(set(batch), {'positive', 'negative', 'neutral'})
+
+    def test_parallel_labels_match_serial(self):
+        # Chunks smaller than the texts, so the labels come back from several workers
+        texts = reference_texts(60)
+        texts.index += 100
+        analyzer = DataAnalyzer(sentiment_workers=2, sentiment_chunk_size=8)
+        parallel = analyzer.score_sentiment_parallel(texts)
+        pd.testing.assert_series_equal(parallel, analyzer.score_sentiment(texts))
+
+
+class ProjectionTests(SimpleTestCase):
+    def setUp(self):
+        self.analyzer = DataAnalyzer()
+        _, self.tfidf_matrix = self.analyzer.fit_vectorizer(reference_texts(300))
+
+    def test_svd_matches_pca_layout_without_densifying(self):
+        matrix_type = type(self.tfidf_matrix)
+        with mock.patch.object(matrix_type, 'toarray', side_effect=AssertionError('densified')), \
+                mock.patch.object(matrix_type, 'todense', side_effect=AssertionError('densified')):
+            svd = self.analyzer.fit_projection(self.tfidf_matrix, method='svd')
+        pca = self.analyzer.fit_projection(self.tfidf_matrix, method='pca')
+        for svd_array, pca_array in zip(svd, pca):
+            self.assertEqual((svd_array.shape, svd_array.dtype), (pca_array.shape, pca_array.dtype))
+        self.assertEqual(svd[0].shape, (300, 2))
+        # The components and mean project rows onto the same coordinates
+        reduced_matrix, components, mean = svd
+        np.testing.assert_allclose(self.analyzer.project(self.tfidf_matrix, components, mean), reduced_matrix,
+                                   atol=1e-5)
+
+
+class ClusteringTests(SimpleTestCase):
+    def setUp(self):
+        # Batches smaller than the rows, so assignment spans several of them
+        self.analyzer = DataAnalyzer(cluster_sample_size=200, cluster_batch_size=64)
+        _, self.tfidf_matrix = self.analyzer.fit_vectorizer(reference_texts(600))
+
+    def test_assignment_matches_minibatch_predict(self):
+        km = MiniBatchKMeans(n_clusters=5, batch_size=64, random_state=0, n_init=3).fit(self.tfidf_matrix[:200])
+        np.testing.assert_array_equal(self.analyzer.assign_clusters(self.tfidf_matrix, km.cluster_centers_),
+                                      km.predict(self.tfidf_matrix))
+
+    def test_minibatch_above_sample_size(self):
+        with mock.patch('reviews.data_analyzer.KMeans') as kmeans:
+            labels, centroids = self.analyzer.fit_clusters(self.tfidf_matrix)
+        kmeans.assert_not_called()
+        self.assertEqual((labels.shape, centroids.shape), ((600,), (5, self.tfidf_matrix.shape[1])))
+
+    def test_small_input_is_clustered_exactly(self):
+        small = self.tfidf_matrix[:200]
+        with mock.patch('reviews.data_analyzer.MiniBatchKMeans') as minibatch:
+            labels, centroids = self.analyzer.fit_clusters(small)
+        minibatch.assert_not_called()
+        km = KMeans(n_clusters=5, random_state=0).fit(small)
+        np.testing.assert_array_equal(labels, km.labels_)
+        np.testing.assert_array_equal(centroids, km.cluster_centers_)
+
+
+class ExcelReadTests(SimpleTestCase):
+    def test_reads_the_first_sheet(self):
+        from openpyxl import Workbook
+        workbook = Workbook()
+        workbook.active.append(['review_headline', 'review_body'])
+        workbook.active.append(['Great', 'Works well'])
+        notes = workbook.create_sheet('Notes')
+        notes.append(['review_headline', 'review_body'])
+        notes.append(['Ignore', 'this sheet'])
+        workbook.active = notes
+        with tempfile.NamedTemporaryFile(suffix='.xlsx', delete=False) as xlsx_file:
+            workbook.save(xlsx_file.name)
+        self.addCleanup(os.remove, xlsx_file.name)
+
+        chunks = list(DataAnalyzer().iter_data(xlsx_file.name))
+        self.assertEqual(pd.concat(chunks)['review_body'].tolist(), ['Works well'])
+
+
+class RevisionTests(SimpleTestCase):
+    def analyze(self, rows, previous_state=None):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'reviews.csv')
+        with open(path, 'w') as csv_file:
+            csv_file.write(reviews_csv(rows))
+        _, state = DataAnalyzer(incremental_max_change=0.2).analyze_with_state(path, previous_state=previous_state)
+        return state
+
+    def test_unchanged_rows_keep_their_results(self):
+        first = self.analyze(200)
+        revision = self.analyze(220, first)
+
+        self.assertEqual(revision.reused_rows, 200)
+        np.testing.assert_array_equal(revision.sentiments[:200], first.sentiments)
+        np.testing.assert_array_equal(revision.clusters[:200], first.clusters)
+        np.testing.assert_array_equal(revision.coordinates[:200], first.coordinates)
+        np.testing.assert_array_equal(revision.fitted, np.arange(220) < 200)
+
+    def test_refits_once_revisions_add_up(self):
+        state = self.analyze(200)
+        # 20 and then 50 of 250 rows placed with the stored models
+        for rows in (220, 250):
+            state = self.analyze(rows, state)
+            self.assertEqual(int((~state.fitted).sum()), rows - 200)
+
+        state = self.analyze(280, state)
+        self.assertEqual(state.reused_rows, 250)
+        self.assertTrue(state.fitted.all())
+
+
+
+class ProfilingTests(SimpleTestCase):
+    def analyze(self, profiler):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as csv_file:
+            csv_file.write(reviews_csv(60))
+        self.addCleanup(os.remove, csv_file.name)
+        profiler.start()
+        result = DataAnalyzer(read_chunk_size=25).analyze(csv_file.name, profiler=profiler)
+        return result, profiler.report()
+
+    def test_disabled_profiler(self):
+        self.assertIs(make_profiler(''), NULL_PROFILER)
+        result, report = self.analyze(NULL_PROFILER)
+        self.assertIsNone(report)
+        self.assertEqual(sum(result['sentiment_summary']['datasets'][0]['data']), 60)
+
+    def test_stages_recorded(self):
+        _, report = self.analyze(make_profiler('stages'))
+        stages = {stage['name']: stage for stage in report['stages']}
+        self.assertEqual(list(stages), ['read_data', 'hash_rows', 'perform_analysis', 'vectorize_text',
+                                        'cluster_reviews', 'reduce_dimensions', 'cluster_samples', 'cluster_points'])
+        # Three chunks of 25 rows, plus the read that finds the end of the file
+        self.assertEqual(stages['read_data']['calls'], 4)
+        self.assertEqual(stages['perform_analysis']['calls'], 3)
+        self.assertGreater(stages['vectorize_text']['peak_memory_bytes'], 0)
+        self.assertGreaterEqual(report['wall_seconds'], sum(stage['wall_seconds'] for stage in stages.values()) - 0.01)
+        self.assertNotIn('cprofile', report)
+
+    def test_cprofile(self):
+        _, report = self.analyze(make_profiler('cprofile', trace_memory=False))
+        # The report keeps the CPROFILE_LIMIT slowest calls, so check for the
+        # entry point rather than a stage whose rank depends on timing
+        self.assertIn('analyze_with_state', report['cprofile'])
+        self.assertNotIn('peak_memory_bytes', report)
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            make_profiler('perf')
+
+
+def _record_in_child():
+    metrics.inc('review_analysis_cache_hits_total', amount=2)
+
+
+def _die_in_request():
+    metrics.track_in_progress('classify_data', 1)
+
+
+class MetricsTests(TempMediaMixin, TestCase):
+    def scrape(self):
+        response = self.client.get('/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        return response.content.decode()
+
+    def test_request_metrics(self):
+        self.client.post('/reviewfeedback/', json.dumps({'review_file': str(uuid.uuid4())}), content_type='application/json')
+        self.client.get('/feedback-summary/999/')
+        self.client.get('/feedback-summary/999/')
+        text = self.scrape()
+        self.assertIn('review_http_requests_total{method="GET",status="404",view="feedback_summary"} 2', text)
+        self.assertIn('review_http_request_errors_total{kind="client",view="feedback_summary"} 2', text)
+        self.assertIn('review_http_request_duration_seconds_count{method="GET",view="feedback_summary"} 2', text)
+        self.assertIn('review_http_request_duration_seconds_bucket{method="GET",view="feedback_summary",le="+Inf"} 2', text)
+        self.assertRegex(text, r'review_http_request_bytes_total\{view="review_feedback"\} [1-9]')
+        # Only the scrape itself is in progress
+        self.assertIn('review_http_requests_in_progress{view="metrics"} 1', text)
+        self.assertIn('review_http_requests_in_progress{view="feedback_summary"} 0', text)
+        self.assertIn('review_jobs{job="classification",state="pending"} 0', text)
+
+    def test_histogram_buckets_are_cumulative(self):
+        for seconds in (0.003, 0.2, 0.2, 100):
+            metrics.observe('review_job_duration_seconds', seconds, {'job': 'report', 'outcome': 'completed'})
+        text = self.scrape()
+        labels = 'job="report",outcome="completed"'
+        self.assertIn(f'review_job_duration_seconds_bucket{{{labels},le="0.5"}} 3', text)
+        self.assertIn(f'review_job_duration_seconds_bucket{{{labels},le="60"}} 3', text)
+        self.assertIn(f'review_job_duration_seconds_bucket{{{labels},le="120"}} 4', text)
+        self.assertIn(f'review_job_duration_seconds_bucket{{{labels},le="+Inf"}} 4', text)
+        self.assertIn(f'review_job_duration_seconds_sum{{{labels}}} 100.403', text)
+
+    def test_shared_between_processes(self):
+        metrics.inc('review_analysis_cache_hits_total')
+        child = multiprocessing.get_context('fork').Process(target=_record_in_child)
+        child.start()
+        child.join()
+        self.assertIn('review_analysis_cache_hits_total 3', self.scrape())
+
+    def test_prunes_in_progress_of_dead_workers(self):
+        child = multiprocessing.get_context('fork').Process(target=_die_in_request)
+        child.start()
+        child.join()
+        self.assertNotIn('view="classify_data"', self.scrape())
+        rows = metrics._connection().execute(
+            "SELECT COUNT(*) FROM samples WHERE name = 'review_http_requests_in_progress' AND labels LIKE ?",
+            [f'%"pid": "{child.pid}"%']).fetchone()
+        self.assertEqual(rows, (0,))
+
+
+STARTUP_SCRIPT = """
+import json, os, sys
+os.environ['DJANGO_SETTINGS_MODULE'] = 'user_review.settings'
+import django
+django.setup()
+from django.urls import get_resolver
+get_resolver().url_patterns
+print(json.dumps(sorted(sys.modules)))
+"""
+
+
+class StartupTests(SimpleTestCase):
+    """Loading the project must not import the analysis and reporting
+    libraries, which take several seconds; only jobs and report views need them."""
+
+    HEAVY_MODULES = ['docx', 'matplotlib', 'nltk', 'numpy', 'openpyxl', 'pandas', 'reportlab', 'scipy',
+                     'sklearn', 'textblob']
+
+    def test_startup_imports(self):
+        # In a fresh interpreter, as this one has imported everything already
+        output = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT], cwd=settings.BASE_DIR, check=True,
+                                capture_output=True, text=True).stdout
+        loaded = json.loads(output.splitlines()[-1])
+        # The URL configuration has imported the views
+        self.assertIn('reviews.views', loaded)
+        modules = {module.split('.')[0] for module in loaded}
+        self.assertEqual([module for module in self.HEAVY_MODULES if module in modules], [])
+
+
+class BatchAnalyzeTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.exports = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.exports, ignore_errors=True)
+        os.makedirs(os.path.join(self.exports, 'archive'))
+        for name, offset in (('a.csv', 0), ('b.csv', 3), (os.path.join('archive', 'a-copy.csv'), 0)):
+            with open(os.path.join(self.exports, name), 'w') as csv_file:
+                csv_file.write(reviews_csv(30, offset))
+        with open(os.path.join(self.exports, 'notes.txt'), 'w') as notes:
+            notes.write('not an export')
+
+    def batch_analyze(self):
+        output = io.StringIO()
+        call_command('batch_analyze', self.exports, user_email='archive@example.com', workers=0, stdout=output)
+        return output.getvalue()
+
+    def test_analyzes_each_content_once(self):
+        output = self.batch_analyze()
+        self.assertIn('2 analyzed (60 rows', output)
+        self.assertIn('1 skipped', output)
+        self.assertEqual(sorted(ReviewFile.objects.values_list('file_name', flat=True)), ['a.csv', 'b.csv'])
+        self.assertEqual(FileOutput.objects.count(), 2)
+        self.assertEqual(ReviewResultSet.objects.filter(complete=True, row_count=30).count(), 2)
+
+        # A second run finds everything done
+        output = self.batch_analyze()
+        self.assertIn('0 analyzed', output)
+        self.assertIn('3 skipped', output)
+        self.assertEqual(ReviewFile.objects.count(), 2)
+
+
+class CompareTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.review_files = [self.upload(name, reviews_csv(rows).encode()) for name, rows in (('a.csv', 20), ('b.csv', 12))]
+
+    def compare(self, ids):
+        # Runs the queued job here rather than on the pool
+        response = self.post_json('/compare/', {'ids': ids})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['state'], CompareJob.PENDING)
+        job = CompareJob.objects.get(unique_id=response.json()['job_id'])
+        jobs.run_compare_job(job.id)
+        return self.client.get(f'/compare/{job.unique_id}/').json()
+
+    def test_files_share_one_cluster_space(self):
+        ids = [review_file.id for review_file in self.review_files]
+        data = self.compare(ids)
+        self.assertEqual((data['state'], data['progress'], data['file_ids']), (CompareJob.COMPLETED, 100, ids))
+        self.assertEqual(len(data['clusters']), 5)
+        self.assertEqual([result['review_file_id'] for result in data['files']], ids)
+        self.assertEqual([result['rows'] for result in data['files']], [20, 12])
+        for result in data['files']:
+            self.assertEqual(sum(result['sentiment_summary']['datasets'][0]['data']), result['rows'])
+            self.assertEqual(len(result['cluster_distribution']['data']), 5)
+            self.assertAlmostEqual(sum(result['cluster_distribution']['percentages']), 100)
+
+    def test_fails_when_a_file_is_gone(self):
+        response = self.post_json('/compare/', {'ids': [review_file.id for review_file in self.review_files]})
+        self.review_files[1].delete()
+        job = CompareJob.objects.get(unique_id=response.json()['job_id'])
+        with self.assertLogs('reviews.jobs', 'ERROR'):
+            jobs.run_compare_job(job.id)
+        data = self.client.get(f'/compare/{job.unique_id}/').json()
+        self.assertEqual(data['state'], CompareJob.FAILED)
+        self.assertNotIn('files', data)
+
+    def test_rejects_bad_ids(self):
+        self.assertEqual(self.post_json('/compare/', {'ids': [self.review_files[0].id]}).status_code, 400)
+        self.assertEqual(self.post_json('/compare/', {'ids': 'all'}).status_code, 400)
+        self.assertEqual(self.post_json('/compare/', {'ids': [True, self.review_files[0].id]}).status_code, 400)
+        response = self.post_json('/compare/', {'ids': [self.review_files[0].id, 9999]})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()['missing_ids'], [9999])
+        self.assertFalse(CompareJob.objects.exists())
@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import register, login, review_feedback, interface_feedback, generate_report_data, upload_review_file, classify_data
+from .views import register, login, review_feedback, interface_feedback, review_feedback_bulk, interface_feedback_bulk, feedback_summary, generate_report_data, report_jobs, report_job_status, report_job_download, upload_review_file, classify_data, classification_status, cluster_points, review_results, compare, compare_status, metrics
 
 router = DefaultRouter()
 urlpatterns = [
@@ -9,7 +9,19 @@ urlpatterns = [
     path('login-api/', login, name='login'),
     path('reviewfeedback/', review_feedback, name='review_feedback'),
     path('interfacefeedback/', interface_feedback, name='interface-feedback'),
+    path('reviewfeedback/bulk/', review_feedback_bulk, name='review_feedback_bulk'),
+    path('interfacefeedback/bulk/', interface_feedback_bulk, name='interface-feedback-bulk'),
+    path('feedback-summary/<int:review_file_id>/', feedback_summary, name='feedback_summary'),
     path('generatereportdata/', generate_report_data, name='generate_report_data'),
+    path('report-jobs/', report_jobs, name='report_jobs'),
+    path('report-jobs/<uuid:job_id>/', report_job_status, name='report_job_status'),
+    path('report-jobs/<uuid:job_id>/download/<str:report_format>/', report_job_download, name='report_job_download'),
     path('upload-review-file/', upload_review_file, name='upload_review_file'),
     path('classify-data/', classify_data, name='classify_data'),
+    path('classify-data/<uuid:job_id>/', classification_status, name='classification_status'),
+    path('cluster-points/<int:file_output_id>/', cluster_points, name='cluster_points'),
+    path('review-results/<int:file_output_id>/', review_results, name='review_results'),
+    path('compare/', compare, name='compare'),
+    path('compare/<uuid:job_id>/', compare_status, name='compare_status'),
+    path('metrics/', metrics, name='metrics'),
 ]
@@ -1,4 +1,5 @@
-import os
+import math
+
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
@@ -7,23 +8,47 @@ from django.conf import settings
 from rest_framework import status
 from rest_framework.parsers import JSONParser
 from django.contrib.auth import get_user_model, authenticate
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
+from django.urls import reverse
 from .models import (
+    ClassificationJob,
+    CompareJob,
+    FeedbackSummary,
     FileOutput, 
-    ReportGenerated, 
+    ReportJob,
     ReviewFeedback, 
     ReviewFile, 
+    ReviewResult,
     UserInterfaceFeedback
 )
 from .serializers import (
+    ClassificationJobSerializer,
+    CompareJobSerializer,
     CustomUserSerializer, 
+    FeedbackSummarySerializer,
+    ReportJobSerializer,
+    ReviewFeedbackItemSerializer,
     ReviewFeedbackSerializer, 
     ReviewFileSerializer, 
+    ReviewResultSerializer,
+    UserInterfaceFeedbackItemSerializer,
     UserInterfaceFeedbackSerializer
 )
-from reviews.data_analyzer import DataAnalyzer
-from reviews.ReportGenerator import ReportGenerator
-dataAnalyzer = DataAnalyzer()
+from reviews import report_cache
+from reviews.jobs import (
+    fail_stale_job,
+    report_generator,
+    start_classification,
+    start_compare,
+    start_report,
+    write_reports,
+)
+from reviews.downloads import file_response
+from reviews.feedback_import import import_feedback, iter_ndjson
+from reviews.feedback_summary import get_summary
+from reviews.analysis_cache import load_point_index, read_texts
+from reviews.profiling import PROFILE_MODES
+from reviews.metrics import exposition
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
@@ -90,6 +115,43 @@ def interface_feedback(request):
             return Response({'message': 'Feedback submitted successfully!'}, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+def bulk_feedback(request, model, serializer_class):
+    # The body is either a JSON array of feedback objects or, for imports too
+    # large to send as one document, NDJSON (application/x-ndjson) that is
+    # read line by line as it arrives
+    if request.content_type.split(';')[0].strip() == 'application/x-ndjson':
+        items = iter_ndjson(request.stream or [])
+    else:
+        items = request.data
+        if not isinstance(items, list):
+            return Response({'error': 'Expected a JSON array of feedback or NDJSON.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    result = import_feedback(items, model, serializer_class)
+    if result['created'] == 0 and result['failed']:
+        return Response(result, status=status.HTTP_400_BAD_REQUEST)
+    result['message'] = 'Feedback submitted successfully!'
+    return Response(result, status=status.HTTP_201_CREATED)
+
+@api_view(['POST'])
+def review_feedback_bulk(request):
+    return bulk_feedback(request, ReviewFeedback, ReviewFeedbackItemSerializer)
+
+@api_view(['POST'])
+def interface_feedback_bulk(request):
+    return bulk_feedback(request, UserInterfaceFeedback, UserInterfaceFeedbackItemSerializer)
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def feedback_summary(request, review_file_id):
+    # Counts, rating mean and histogram and latest dates of a file's feedback,
+    # kept up to date on every insert
+    summary = FeedbackSummary.objects.filter(review_file_id=review_file_id).first()
+    if summary is None:
+        if not ReviewFile.objects.filter(id=review_file_id).exists():
+            return Response({'error': 'File not found'}, status=status.HTTP_404_NOT_FOUND)
+        summary = get_summary(review_file_id)
+    return Response(FeedbackSummarySerializer(summary).data, status=status.HTTP_200_OK)
+
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def upload_review_file(request):
@@ -112,23 +174,22 @@ def generate_report_data(request):
 
     try:
         review_file = ReviewFile.objects.get(id=review_file_id)
-        file_output = FileOutput.objects.get(review_file__id=review_file_id)
-        ui_feedbacks = UserInterfaceFeedback.objects.filter(review_file__id=review_file_id)
-        review_feedbacks = ReviewFeedback.objects.filter(review_file__id=review_file_id)
-
-        # Instantiate ReportGenerator and generate reports
-        report_generator = ReportGenerator(file_output, ui_feedbacks, review_feedbacks, colorOptions)
-        pdf_path = report_generator.generate_pdf_report()
-        ReportGenerated.objects.create(
-            review_file=review_file,
-            file_path = pdf_path
-        )
-
-        docx_path = report_generator.generate_docx_report()
-        ReportGenerated.objects.create(
-            review_file=review_file,
-            file_path = docx_path
-        )
+        # The latest output, when the file was classified with different settings
+        file_output = FileOutput.objects.filter(review_file__id=review_file_id).latest('id')
+
+        # Unchanged output, feedback and colors: serve the reports generated before
+        cache_key = report_cache.make_report_key(file_output, colorOptions)
+        entry = report_cache.lookup(cache_key)
+        if entry is not None:
+            return Response({
+                'pdf_path': default_storage.url(entry.pdf_path.name),
+                'docx_path': default_storage.url(entry.docx_path.name),
+            })
+
+        # Render the charts once, then write the PDF and DOCX side by side on the worker pool
+        charts = report_generator(file_output, colorOptions).render_charts()
+        pdf_path, docx_path = write_reports(file_output, colorOptions, charts)
+        report_cache.record(review_file, file_output, cache_key, pdf_path, docx_path)
 
         # Construct response with file paths
         response_data = {
@@ -143,6 +204,67 @@ def generate_report_data(request):
     except Exception as e:
         return Response({'error': str(e)}, status=500)
 
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def report_jobs(request):
+    # Reports are written on the worker pool; the client polls report_job_status
+    # and then fetches each file from report_job_download
+    review_file_id = request.data.get('review_file_id')
+    color_options = request.data.get('colorOptions') or []
+    if not review_file_id:
+        return Response({'error': 'Please submit data file first.'}, status=status.HTTP_400_BAD_REQUEST)
+    if not isinstance(color_options, list):
+        return Response({'error': 'colorOptions must be a list'}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        review_file = ReviewFile.objects.get(id=review_file_id)
+        file_output = FileOutput.objects.filter(review_file=review_file).latest('id')
+    except (ReviewFile.DoesNotExist, FileOutput.DoesNotExist):
+        return Response({'error': 'File not found for the provided id.'}, status=status.HTTP_404_NOT_FOUND)
+
+    job = start_report(review_file, file_output, color_options)
+    response_data = report_job_data(job)
+    return Response(response_data, status=status.HTTP_200_OK if job.cache_hit else status.HTTP_202_ACCEPTED)
+
+
+def report_job_data(job):
+    response_data = ReportJobSerializer(job).data
+    if job.state == ReportJob.COMPLETED:
+        response_data['pdf_path'] = reverse('report_job_download', args=[job.unique_id, 'pdf'])
+        response_data['docx_path'] = reverse('report_job_download', args=[job.unique_id, 'docx'])
+    return response_data
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def report_job_status(request, job_id):
+    try:
+        job = ReportJob.objects.get(unique_id=job_id)
+    except ReportJob.DoesNotExist:
+        return Response({'error': 'Report job not found'}, status=status.HTTP_404_NOT_FOUND)
+    fail_stale_job(job)
+    return Response(report_job_data(job), status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def report_job_download(request, job_id, report_format):
+    try:
+        job = ReportJob.objects.get(unique_id=job_id)
+    except ReportJob.DoesNotExist:
+        return Response({'error': 'Report job not found'}, status=status.HTTP_404_NOT_FOUND)
+    if report_format not in ReportJob.FORMATS:
+        return Response({'error': 'Report format must be pdf or docx'}, status=status.HTTP_404_NOT_FOUND)
+    if job.state != ReportJob.COMPLETED:
+        return Response({'error': 'The report is not ready yet.'}, status=status.HTTP_409_CONFLICT)
+
+    report_file = job.pdf_path if report_format == ReportJob.PDF else job.docx_path
+    if not report_file or not default_storage.exists(report_file.name):
+        # Evicted from the report cache, or dropped when the feedback changed
+        return Response({'error': 'The report has expired. Please generate it again.'}, status=status.HTTP_410_GONE)
+    return file_response(request, report_file.name, filename=f'report.{report_format}')
+
+
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def classify_data(request):
@@ -155,19 +277,152 @@ def classify_data(request):
             except ReviewFile.DoesNotExist:
                 return Response({'error': 'File not found'}, status=status.HTTP_404_NOT_FOUND)
 
-            file_path = os.path.join(settings.MEDIA_ROOT, 'uploads', os.path.basename(data['file']))
-            file_path = file_path.replace('\\', '/')
-            # Create an instance of DataAnalyzer and generate the report
-            output = dataAnalyzer.analyze(file_path)
-            FileOutput.objects.create(
-                review_file=review_file,
-                review_text=output['review_text'],
-                sentiment_summary=output['sentiment_summary'],
-            )
+            # profile: true records the time and memory of each analysis stage,
+            # 'cprofile' adds cProfile output; classification_status returns it
+            profile = data.get('profile') or ''
+            if profile is True:
+                profile = 'stages'
+            if profile not in ('',) + PROFILE_MODES:
+                return Response({'error': 'profile must be true, false, "stages" or "cprofile"'}, status=status.HTTP_400_BAD_REQUEST)
+
+            # The analysis runs on the worker pool; the client polls classification_status.
+            # Content that was analyzed before comes back already completed.
+            job = start_classification(review_file, profile_mode=profile)
             response_data = {
-                'message': 'Data classified successfully!',
-                'classified_data': output,  # Include your classified data here
+                'message': 'Data classified successfully!' if job.cache_hit else 'Classification started.',
+                'job_id': str(job.unique_id),
+                'state': job.state,
+                'cache_hit': job.cache_hit,
             }
-            return Response(response_data, status=status.HTTP_200_OK)
+            return Response(response_data, status=status.HTTP_200_OK if job.cache_hit else status.HTTP_202_ACCEPTED)
         else:
-            return Response({'error': 'Data not provided'}, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+            return Response({'error': 'Data not provided'}, status=status.HTTP_400_BAD_REQUEST)
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def classification_status(request, job_id):
+    try:
+        job = ClassificationJob.objects.get(unique_id=job_id)
+    except ClassificationJob.DoesNotExist:
+        return Response({'error': 'Classification job not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    fail_stale_job(job)
+    response_data = ClassificationJobSerializer(job).data
+    if job.state == ClassificationJob.COMPLETED:
+        response_data['message'] = 'Data classified successfully!'
+        response_data['classified_data'] = job.result
+        if job.profile_mode or request.query_params.get('profile') in ('1', 'true'):
+            response_data['profile'] = job.file_output.profile if job.file_output else None
+    return Response(response_data, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def cluster_points(request, file_output_id):
+    # Scatter plot data for one viewport: the points when they fit, otherwise
+    # per-cluster counts on a grid whose resolution follows the zoom level
+    try:
+        file_output = FileOutput.objects.get(id=file_output_id)
+    except FileOutput.DoesNotExist:
+        return Response({'error': 'File output not found'}, status=status.HTTP_404_NOT_FOUND)
+    if not file_output.points_file:
+        return Response({'error': 'No point index for this output. Please classify the file again.'}, status=status.HTTP_404_NOT_FOUND)
+
+    params = request.query_params
+    mode = params.get('mode', 'auto')
+    if mode not in ('auto', 'points', 'bins'):
+        return Response({'error': 'mode must be auto, points or bins'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        bounds = [params.get(name) for name in ('x_min', 'x_max', 'y_min', 'y_max')]
+        viewport = [float(value) for value in bounds] if all(value is not None for value in bounds) else None
+        zoom = int(params.get('zoom', 0))
+        max_points = min(int(params.get('max_points', settings.ANALYSIS_MAX_CLUSTER_POINTS)), settings.ANALYSIS_MAX_CLUSTER_POINTS)
+    except ValueError:
+        return Response({'error': 'Viewport bounds, zoom and max_points must be numbers'}, status=status.HTTP_400_BAD_REQUEST)
+    if viewport is not None and not all(math.isfinite(value) for value in viewport):
+        return Response({'error': 'Viewport bounds must be finite'}, status=status.HTTP_400_BAD_REQUEST)
+
+    point_index = load_point_index(file_output.points_file.name)
+    response_data = point_index.query(viewport, zoom=zoom, max_points=max(max_points, 1),
+                                      max_bins=settings.CLUSTER_POINTS_MAX_BINS, mode=mode)
+    return Response(response_data, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def review_results(request, file_output_id):
+    # Keyset pagination over the per-review results: each page holds the rows
+    # after row_index `after`, and next_after continues from the last of them
+    try:
+        file_output = FileOutput.objects.select_related('result_set').get(id=file_output_id)
+    except FileOutput.DoesNotExist:
+        return Response({'error': 'File output not found'}, status=status.HTTP_404_NOT_FOUND)
+    if file_output.result_set_id is None:
+        return Response({'error': 'No review results for this output. Please classify the file again.'}, status=status.HTTP_404_NOT_FOUND)
+
+    params = request.query_params
+    results = ReviewResult.objects.filter(result_set_id=file_output.result_set_id)
+    try:
+        after = int(params.get('after', -1))
+        limit = min(max(int(params.get('limit', settings.REVIEW_RESULTS_PAGE_SIZE)), 1), settings.REVIEW_RESULTS_MAX_PAGE_SIZE)
+        if params.get('cluster') is not None:
+            results = results.filter(cluster=int(params['cluster']))
+    except ValueError:
+        return Response({'error': 'after, limit and cluster must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+    if params.get('sentiment'):
+        results = results.filter(sentiment=params['sentiment'].lower())
+
+    page = list(results.filter(row_index__gt=after).order_by('row_index')[:limit + 1])
+    for result, text in zip(page[:limit], read_texts(file_output.result_set, page[:limit])):
+        result.text = text
+    response_data = {
+        'results': ReviewResultSerializer(page[:limit], many=True).data,
+        'next_after': page[limit - 1].row_index if len(page) > limit else None,
+    }
+    return Response(response_data, status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def compare(request):
+    # Analyzes several files together, so their clusters and scatter
+    # coordinates can be compared: one vectorizer, clustering and projection
+    # is fitted over the reviews of all of them. The analysis runs on the
+    # worker pool; the client polls compare_status.
+    ids = request.data.get('ids') if isinstance(request.data, dict) else None
+    # bool is a subclass of int, but true is not a file id
+    if not isinstance(ids, list) or not all(isinstance(file_id, int) and not isinstance(file_id, bool) for file_id in ids):
+        return Response({'error': 'ids must be a list of file ids'}, status=status.HTTP_400_BAD_REQUEST)
+    ids = list(dict.fromkeys(ids))
+    if not 2 <= len(ids) <= settings.COMPARE_MAX_FILES:
+        return Response({'error': f'Between 2 and {settings.COMPARE_MAX_FILES} different files can be compared'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    review_files = ReviewFile.objects.in_bulk(ids)
+    missing = [file_id for file_id in ids if file_id not in review_files]
+    if missing:
+        return Response({'error': 'File not found', 'missing_ids': missing}, status=status.HTTP_404_NOT_FOUND)
+
+    job = start_compare([review_files[file_id] for file_id in ids])
+    return Response(CompareJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def compare_status(request, job_id):
+    try:
+        job = CompareJob.objects.get(unique_id=job_id)
+    except CompareJob.DoesNotExist:
+        return Response({'error': 'Compare job not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    fail_stale_job(job)
+    response_data = CompareJobSerializer(job).data
+    if job.state == CompareJob.COMPLETED:
+        response_data.update(job.result)
+    return Response(response_data, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def metrics(request):
+    # Scraped by Prometheus; covers every process writing to METRICS_DB_PATH
+    return HttpResponse(exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -70,6 +71,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'reviews.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -109,9 +111,26 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Connections are reused for this many seconds and checked before reuse
+        'CONN_MAX_AGE': int(os.environ.get('DATABASE_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Seconds a connection waits for a lock held by another writer
+            'timeout': float(os.environ.get('SQLITE_BUSY_TIMEOUT', 20)),
+        },
     }
 }
 
+# Applied to every new SQLite connection (reviews.signals). WAL lets readers
+# carry on while a writer commits, and synchronous=NORMAL is durable enough in
+# WAL mode; a negative cache_size is in KiB
+SQLITE_PRAGMAS = {
+    'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', -64000)),
+    'temp_store': 'MEMORY',
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -165,3 +184,89 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media/')
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Classification jobs
+# Uploads are analyzed on a local process pool instead of inside the request.
+
+CLASSIFICATION_WORKERS = int(os.environ.get('CLASSIFICATION_WORKERS', 2))
+CLASSIFICATION_POOL_START_METHOD = os.environ.get('CLASSIFICATION_POOL_START_METHOD', 'spawn')
+
+# Jobs that have neither started nor reported progress for this long are
+# taken to be lost with the process that queued them, and marked failed
+JOB_STALE_SECONDS = int(os.environ.get('JOB_STALE_SECONDS', 30 * 60))
+
+# Sentiment scoring: 'batch' (vectorized lexicon scorer) or 'textblob' (one TextBlob per review)
+SENTIMENT_ENGINE = os.environ.get('SENTIMENT_ENGINE', 'batch')
+
+# Sentiment scoring is spread over SENTIMENT_WORKERS processes in chunks of
+# SENTIMENT_CHUNK_SIZE rows once a file has SENTIMENT_PARALLEL_THRESHOLD rows
+SENTIMENT_WORKERS = int(os.environ.get('SENTIMENT_WORKERS', 1))
+SENTIMENT_CHUNK_SIZE = int(os.environ.get('SENTIMENT_CHUNK_SIZE', 20000))
+SENTIMENT_PARALLEL_THRESHOLD = int(os.environ.get('SENTIMENT_PARALLEL_THRESHOLD', 50000))
+
+# Uploads are streamed through the analyzer this many rows at a time
+ANALYSIS_READ_CHUNK_SIZE = int(os.environ.get('ANALYSIS_READ_CHUNK_SIZE', 50000))
+
+# Projection for the scatter plot: 'svd' (sparse truncated SVD) or 'pca' (dense PCA)
+ANALYSIS_REDUCTION_METHOD = os.environ.get('ANALYSIS_REDUCTION_METHOD', 'svd')
+
+# Clustering: 'minibatch' fits centroids on a sample of ANALYSIS_CLUSTER_SAMPLE_SIZE
+# rows and assigns the rest in batches; 'kmeans' fits a full KMeans, as does
+# 'minibatch' for files of at most ANALYSIS_CLUSTER_SAMPLE_SIZE rows
+ANALYSIS_CLUSTER_METHOD = os.environ.get('ANALYSIS_CLUSTER_METHOD', 'minibatch')
+ANALYSIS_CLUSTER_SAMPLE_SIZE = int(os.environ.get('ANALYSIS_CLUSTER_SAMPLE_SIZE', 20000))
+ANALYSIS_CLUSTER_BATCH_SIZE = int(os.environ.get('ANALYSIS_CLUSTER_BATCH_SIZE', 4096))
+ANALYSIS_CLUSTER_SEED = int(os.environ.get('ANALYSIS_CLUSTER_SEED', 0))
+
+# A revision of an earlier upload keeps the stored clusters and coordinates of
+# unchanged rows unless more than this share of its rows is new
+ANALYSIS_INCREMENTAL_MAX_CHANGE = float(os.environ.get('ANALYSIS_INCREMENTAL_MAX_CHANGE', 0.2))
+
+# Scatter plot: the classification result carries a sample of at most
+# ANALYSIS_MAX_CLUSTER_POINTS points; the cluster points endpoint returns at most
+# that many points or CLUSTER_POINTS_MAX_BINS bins per viewport
+ANALYSIS_MAX_CLUSTER_POINTS = int(os.environ.get('ANALYSIS_MAX_CLUSTER_POINTS', 5000))
+CLUSTER_POINTS_MAX_BINS = int(os.environ.get('CLUSTER_POINTS_MAX_BINS', 4096))
+
+# Page sizes of the per-review results endpoint
+REVIEW_RESULTS_PAGE_SIZE = int(os.environ.get('REVIEW_RESULTS_PAGE_SIZE', 50))
+REVIEW_RESULTS_MAX_PAGE_SIZE = int(os.environ.get('REVIEW_RESULTS_MAX_PAGE_SIZE', 500))
+
+# Analyses are cached by upload content hash and analyzer parameters; least
+# recently used entries are evicted once they exceed this size, counting each
+# result with its sidecars and per-review rows. Those go with the entry unless
+# a FileOutput still uses them, in which case they go with the file.
+ANALYSIS_CACHE_MAX_BYTES = int(os.environ.get('ANALYSIS_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+
+# Generated reports are reused until the file's feedback changes; least
+# recently used reports are deleted once they take up more than this size
+REPORT_CACHE_MAX_BYTES = int(os.environ.get('REPORT_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+
+# Report downloads are streamed from storage in chunks of this many bytes
+REPORT_DOWNLOAD_CHUNK_SIZE = int(os.environ.get('REPORT_DOWNLOAD_CHUNK_SIZE', 64 * 1024))
+
+# Bulk feedback imports resolve files, validate and insert this many items per transaction
+FEEDBACK_BULK_BATCH_SIZE = int(os.environ.get('FEEDBACK_BULK_BATCH_SIZE', 1000))
+
+# Profiling of classification jobs: '' (off), 'stages' (wall time, CPU time and
+# peak memory per analysis stage) or 'cprofile' (stages plus cProfile output).
+# When set, every job is profiled; otherwise only the ones that ask for it.
+# Memory tracing slows the analysis down and can be turned off on its own.
+ANALYSIS_PROFILE_MODE = os.environ.get('ANALYSIS_PROFILE_MODE', '')
+ANALYSIS_PROFILE_MEMORY = os.environ.get('ANALYSIS_PROFILE_MEMORY', 'true').lower() in ('1', 'true', 'yes')
+
+# Request and job metrics, served in the Prometheus text format at /metrics/.
+# Web and pool worker processes all add to the one SQLite file at METRICS_DB_PATH,
+# which is runtime state and so lives outside the source tree by default
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+METRICS_DB_PATH = os.environ.get('METRICS_DB_PATH', os.path.join(tempfile.gettempdir(), 'review-metrics.sqlite3'))
+
+# Pool workers import the analysis and reporting libraries and load the
+# sentiment lexicon when they start, rather than during their first job
+WORKER_WARM_UP = os.environ.get('WORKER_WARM_UP', 'true').lower() in ('1', 'true', 'yes')
+
+# A comparison runs as one pool job that vectorizes and clusters all of its
+# files together, so its memory and the time it holds a worker grow with
+# every file added; the compare endpoint accepts at most this many
+COMPARE_MAX_FILES = int(os.environ.get('COMPARE_MAX_FILES', 10))